@@ -67,13 +67,13 @@ async def get_current_user(request: Request) -> User:
                 request.session["last_activity"] = time.time()
         
         # Get or create debug user in database
-        user = User.get_user_by_username(username)
+        user = await User.aget_user_by_username(username)
         if not user:
             # Create debug user if it doesn't exist
             # Use a simple password hash for debug mode
             debug_password_hash = get_password_hash("debug_password")
-            User.create_user(username=username, hashed_password=debug_password_hash, is_admin=True)
-            user = User.get_user_by_username(username)
+            await User.acreate_user(username=username, hashed_password=debug_password_hash, is_admin=True)
+            user = await User.aget_user_by_username(username)
         
         if user:
             return user
@@ -108,7 +108,7 @@ async def get_current_user(request: Request) -> User:
     request.session["last_activity"] = current_time
     
     # Validate user exists in the database
-    user = User.get_user_by_username(username)
+    user = await User.aget_user_by_username(username)
     if not user:
         # If user does not exist, clear the invalid session
         request.session.clear()
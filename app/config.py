@@ -20,10 +20,6 @@ else:
 TMP_DIR = BASE_DIR / "tmp"
 DATA_ROOT = TMP_DIR / "data"
 
-# Auto cleanup the tmp directory on startup to ensure "read and burn" for downloads
-if TMP_DIR.exists():
-    shutil.rmtree(TMP_DIR, ignore_errors=True)
-
 DOWNLOADS_DIR = DATA_ROOT / "downloads"
 ARCHIVES_DIR = DATA_ROOT / "archives"
 STATUS_DIR = DATA_ROOT / "status"
@@ -33,6 +29,17 @@ os.makedirs(DOWNLOADS_DIR, exist_ok=True)
 os.makedirs(ARCHIVES_DIR, exist_ok=True)
 os.makedirs(STATUS_DIR, exist_ok=True)
 
+def reset_tmp_dir():
+    """
+    Empties the tmp directory to ensure "read and burn" for downloads.
+    Called once when the main app starts (not on import, so helper processes
+    such as the log endpoint never wipe a running instance's files).
+    """
+    if TMP_DIR.exists():
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+    for directory in (DOWNLOADS_DIR, ARCHIVES_DIR, STATUS_DIR):
+        os.makedirs(directory, exist_ok=True)
+
 PRIVATE_MODE = os.getenv("PRIVATE_MODE", "false").lower() == "true"
 
 # --- User Authentication ---
@@ -1,11 +1,19 @@
 import os
+import json
+import asyncio
+import time
 import logging
+import threading
+import weakref
 from contextlib import contextmanager
+from datetime import datetime
 from urllib.parse import urlparse
-from sqlalchemy import create_engine, Column, Integer, String, Text, Boolean, TIMESTAMP, func, inspect, text
-from sqlalchemy.orm import sessionmaker, declarative_base, Session
+from sqlalchemy import create_engine, event, select, Column, Integer, BigInteger, Float, String, Text, Boolean, TIMESTAMP, func, inspect, text, or_, and_
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.orm import sessionmaker, declarative_base, Session, defer
 from sqlalchemy.exc import SQLAlchemyError
 from pathlib import Path
+from typing import Optional
 
 from .config import DATABASE_URL, BASE_DIR
 
@@ -63,6 +71,7 @@ def create_db_engine(url):
                     **pool_settings,
                     connect_args={"ssl": {"check_hostname": False}}
                 )
+                ssl_engine.info["ssl_unverified"] = True
                 # Test connection
                 with ssl_engine.connect() as conn:
                     logger.info("SSL MySQL connection successful (certificates trusted).")
@@ -70,24 +79,87 @@ def create_db_engine(url):
             except Exception as e2:
                 logger.error(f"MySQL SSL connection failed: {e2}")
                 raise e2
+    elif "sqlite" in url:
+        return create_sqlite_engine(url)
     else:
-        # SQLite or other schemes
-        sqlite_args = {"check_same_thread": False} if "sqlite" in url else {}
-        return create_engine(
-            url, 
-            pool_pre_ping=True,
-            connect_args=sqlite_args
+        return create_engine(url, pool_pre_ping=True)
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the single writer,
+# synchronous=NORMAL is durable across application crashes in WAL mode, and busy_timeout makes
+# a writer wait for the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=10000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+)
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+def create_sqlite_engine(url):
+    """Creates a SQLite engine tuned for one process with many threads."""
+    connect_args = {
+        "check_same_thread": False,
+        # Let the driver wait for locks too, and keep more prepared statements per connection
+        "timeout": 10,
+        "cached_statements": 256,
+    }
+    if ":memory:" in url or url.rstrip("/") in ("sqlite:", "sqlite+pysqlite:"):
+        # One shared connection, otherwise every thread would see its own empty database
+        sqlite_engine = create_engine(url, connect_args=connect_args, poolclass=StaticPool)
+    else:
+        # Local file: no pre-ping round trip needed; a small pool of long-lived connections
+        # keeps their prepared-statement caches warm
+        sqlite_engine = create_engine(
+            url,
+            connect_args=connect_args,
+            poolclass=QueuePool,
+            pool_size=8,
+            max_overflow=8,
+            pool_timeout=30,
         )
+    event.listen(sqlite_engine, "connect", _apply_sqlite_pragmas)
+    return sqlite_engine
+
+# The engine is created on first use rather than at import: for MySQL that means a network
+# round trip (and possibly an SSL retry), which should not be paid just to import the app.
+_engine = None
+_engine_lock = threading.Lock()
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
-try:
-    engine = create_db_engine(FINAL_DATABASE_URL)
-except Exception as e:
-    logger.error(f"Failed to initialize database engine: {e}")
-    logger.warning("Falling back to in-memory SQLite database.")
-    # Fallback to in-memory sqlite to prevent crash
-    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+def get_engine():
+    """Returns the process-wide engine, connecting on the first call."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                try:
+                    new_engine = create_db_engine(FINAL_DATABASE_URL)
+                except Exception as e:
+                    logger.error(f"Failed to initialize database engine: {e}")
+                    logger.warning("Falling back to in-memory SQLite database.")
+                    # Fallback to in-memory sqlite to prevent crash
+                    new_engine = create_sqlite_engine("sqlite:///:memory:")
+                SessionLocal.configure(bind=new_engine)
+                _engine = new_engine
+                if new_engine.url.get_backend_name() == "sqlite":
+                    # A fresh SQLite file (or the in-memory fallback) has no tables yet
+                    init_db()
+    return _engine
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def __getattr__(name):
+    # Keeps `from .database import engine` working for code that needs the engine object itself
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 Base = declarative_base()
 
 # --- Models ---
@@ -107,76 +179,368 @@ class ConfigModel(Base):
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
 
+class ConfigChangeModel(Base):
+    """Append-only log of config writes; the autoincrement id is the config version."""
+    __tablename__ = "config_changes"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    key_name = Column(String(100), nullable=False)
+    changed_at = Column(TIMESTAMP, server_default=func.now())
+
+class TaskModel(Base):
+    __tablename__ = "tasks"
+    id = Column(String(36), primary_key=True)
+    status = Column(String(32), nullable=False, default="queued", index=True)
+    url = Column(Text, nullable=True)
+    downloader = Column(String(50), nullable=True, index=True)
+    upload_service = Column(String(50), nullable=True, index=True)
+    created_by = Column(String(100), nullable=True, index=True)
+    log_path = Column(Text, nullable=True)
+    upload_log_path = Column(Text, nullable=True)
+    # Everything else the workflow reports (params, progress, links...) as JSON
+    data = Column(Text, nullable=True)
+    # Set client-side so SQLite stores the same format the cursor/date filters bind (and keeps sub-second order)
+    created_at = Column(TIMESTAMP, default=datetime.now, server_default=func.now(), index=True)
+    updated_at = Column(TIMESTAMP, default=datetime.now, onupdate=datetime.now, server_default=func.now())
+
+class SyncStateModel(Base):
+    """Scheduling state of a periodic sync task, so schedules and backoff survive restarts."""
+    __tablename__ = "sync_state"
+    name = Column(String(255), primary_key=True)
+    last_run_at = Column(TIMESTAMP, nullable=True)
+    last_success_at = Column(TIMESTAMP, nullable=True)
+    next_run_at = Column(TIMESTAMP, nullable=True)
+    consecutive_failures = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+
+class SyncRunModel(Base):
+    __tablename__ = "sync_runs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    task_name = Column(String(255), nullable=False, index=True)
+    started_at = Column(TIMESTAMP, nullable=False, index=True)
+    duration = Column(Float, nullable=False, default=0)
+    bytes = Column(BigInteger, nullable=True)
+    files = Column(Integer, nullable=True)
+    full = Column(Boolean, default=False)
+    success = Column(Boolean, default=False)
+    error = Column(Text, nullable=True)
+
 class LogModel(Base):
     __tablename__ = "logs"
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(TIMESTAMP, server_default=func.now())
-    level = Column(String(50))
-    logger_name = Column(String(100))
+    timestamp = Column(TIMESTAMP, server_default=func.now(), index=True)
+    level = Column(String(50), index=True)
+    logger_name = Column(String(100), index=True)
     message = Column(Text)
     pathname = Column(Text)
     lineno = Column(Integer)
 
 # --- Database Initialization ---
+def ensure_indexes():
+    """
+    Creates model indexes missing from tables that already existed.
+    create_all() only creates indexes together with new tables.
+    """
+    engine = get_engine()
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info(f"Creating missing index {index.name} on {table.name}.")
+                index.create(bind=engine)
+
+_db_initialized = False
+
 def init_db():
+    """Creates missing tables and indexes and warms the config cache; runs once per process."""
+    global _db_initialized
+    # The first get_engine() call initializes a SQLite database itself
+    engine = get_engine()
+    if _db_initialized:
+        return
     try:
         Base.metadata.create_all(bind=engine)
+        ensure_indexes()
         logger.info("Database tables checked/created.")
+        _db_initialized = True
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
+    # Warm the config cache with a single query
+    db_config.load_all()
 
 @contextmanager
 def get_db_session():
+    get_engine()
     session = SessionLocal()
     try:
         yield session
     finally:
         session.close()
 
+# --- Async access for request handlers ---
+# Request-time queries use SQLAlchemy asyncio (aiosqlite / aiomysql) so a slow database does not
+# block the event loop; background threads keep using the sync engine. Without an async driver,
+# callers fall back to running the sync code in a worker thread (see run_sync).
+# Async connections belong to the loop that opened them, and the camouflage and main apps each run
+# their own loop, so every loop gets its own async engine.
+_async_engines = weakref.WeakKeyDictionary()
+_async_unavailable = False
+_async_lock = threading.Lock()
+
+def _async_url(sync_url) -> Optional[str]:
+    url = str(sync_url)
+    if url.startswith("sqlite") and ":memory:" not in url:
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    if url.startswith("mysql"):
+        return "mysql+aiomysql://" + url.split("://", 1)[1]
+    return None
+
+def _create_async_engine(url: str):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    if url.startswith("sqlite"):
+        async_engine = create_async_engine(url, connect_args={"timeout": 10})
+        event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        return async_engine
+    connect_args = {}
+    if get_engine().info.get("ssl_unverified"):
+        import ssl
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        connect_args["ssl"] = context
+    return create_async_engine(
+        url, pool_size=10, max_overflow=20, pool_recycle=3600, pool_pre_ping=True, connect_args=connect_args
+    )
+
+def get_async_session_factory():
+    """
+    Returns an async sessionmaker for the running event loop, bound to the same database as `engine`,
+    or None when no async driver is available.
+    """
+    global _async_unavailable
+    if _async_unavailable:
+        return None
+    loop = asyncio.get_running_loop()
+    entry = _async_engines.get(loop)
+    if entry is not None:
+        return entry[1]
+    with _async_lock:
+        entry = _async_engines.get(loop)
+        if entry is not None:
+            return entry[1]
+        url = _async_url(get_engine().url.render_as_string(hide_password=False))
+        if url is None:
+            _async_unavailable = True
+            return None
+        try:
+            from sqlalchemy.ext.asyncio import async_sessionmaker
+            async_engine = _create_async_engine(url)
+            factory = async_sessionmaker(async_engine, expire_on_commit=False)
+            _async_engines[loop] = (async_engine, factory)
+            logger.info("Async database engine ready.")
+            return factory
+        except ImportError as e:
+            _async_unavailable = True
+            logger.info(f"Async database driver not installed ({e}); request handlers will use worker threads.")
+        except Exception as e:
+            _async_unavailable = True
+            logger.error(f"Failed to create async database engine: {e}")
+    return None
+
+async def run_sync(func, *args, **kwargs):
+    """Runs a blocking database call in a worker thread so it does not stall the event loop."""
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+async def dispose_async_engine():
+    """Closes the async engine of the running event loop, if one was created."""
+    entry = _async_engines.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        await entry[0].dispose()
+
 # --- Configuration Manager ---
 class ConfigManager:
-    """Manages application configuration stored in database with memory caching."""
+    """
+    Manages application configuration stored in database with memory caching.
+
+    All keys are bulk-loaded in one query. Every write also appends a row to 'config_changes', whose
+    autoincrement id acts as a version counter: other processes pick up new rows on their next sync and
+    re-read only the keys that changed. When Redis is configured, writers also publish the changed key on
+    CONFIG_CHANNEL so subscribers sync immediately instead of waiting for the next poll.
+    """
     
+    CONFIG_CHANNEL = "webdl:config"
+    SYNC_INTERVAL = 5  # seconds between change-log polls
+    SYNC_INTERVAL_WITH_PUBSUB = 60  # safety-net poll when Redis notifications are active
+    MAX_CHANGE_LOG_ROWS = 1000
+    # Change ids below the newest one seen that are re-read on every sync: concurrent writers
+    # can commit autoincrement ids out of order, so a lower id may appear after a higher one
+    RESCAN_WINDOW = 100
+
     _cache = {}
+    _loaded = False
+    _version = 0
+    _applied_ids = frozenset()
+    _last_sync = 0.0
+    _lock = threading.RLock()
+    _pubsub_thread = None
+    _pubsub = None
 
     def get_config(self, key: str, default=None):
         """
         Retrieves a configuration value.
         Strategy:
-        1. Try memory cache.
-        2. Try to fetch from Database.
-        3. If 'DATABASE_URL' env var is set (MySQL mode), strictly return DB value or default.
-        4. If using default SQLite, fallback to os.getenv for backward compatibility.
+        1. Try memory cache (a full copy of the config table, kept fresh via the change log).
+        2. If 'DATABASE_URL' env var is set (MySQL mode), strictly return DB value or default.
+        3. If using default SQLite, fallback to os.getenv for backward compatibility.
         """
         # 1. Try Cache
-        if key in self._cache:
-            return self._cache[key]
-
-        # 2. Try DB
-        db_val = self._get_from_db(key)
+        self._ensure_fresh()
+        db_val = self._cache.get(key)
         if db_val is not None:
-            self._cache[key] = db_val # Update cache
             return db_val
             
-        # 3. Strict Mode Check
+        # 2. Strict Mode Check
         if os.getenv("DATABASE_URL"):
             return default
             
-        # 4. Fallback to Env (SQLite/Default mode)
-        env_val = os.getenv(key, default)
-        if env_val is not None:
-             self._cache[key] = env_val # Cache env fallback too
-        return env_val
+        # 3. Fallback to Env (SQLite/Default mode)
+        return os.getenv(key, default)
 
-    def _get_from_db(self, key: str):
+    def get_configs(self, keys, default=None) -> dict:
+        """
+        Retrieves several configuration values at once, with the same lookup rules as get_config.
+        A cold cache is filled with a single query instead of one query per key.
+        """
+        self._ensure_fresh()
+        strict = bool(os.getenv("DATABASE_URL"))
+        values = {}
+        for key in keys:
+            db_val = self._cache.get(key)
+            if db_val is not None:
+                values[key] = db_val
+            elif strict:
+                values[key] = default
+            else:
+                values[key] = os.getenv(key, default)
+        return values
+
+    def get_all_configs(self) -> dict:
+        """Returns a copy of every config value stored in the database."""
+        self._ensure_fresh()
+        with self._lock:
+            return dict(self._cache)
+
+    def load_all(self):
+        """Loads every config row into the cache in a single query."""
         try:
             with get_db_session() as session:
-                item = session.query(ConfigModel).filter(ConfigModel.key_name == key).first()
-                if item:
-                    return item.key_value
+                rows = session.query(ConfigModel.key_name, ConfigModel.key_value).all()
+                version = session.query(func.max(ConfigChangeModel.id)).scalar() or 0
+                applied = session.query(ConfigChangeModel.id) \
+                    .filter(ConfigChangeModel.id > version - self.RESCAN_WINDOW).all()
+            with self._lock:
+                ConfigManager._cache = {key: value for key, value in rows}
+                ConfigManager._version = version
+                ConfigManager._applied_ids = frozenset(row[0] for row in applied)
+                ConfigManager._loaded = True
+                ConfigManager._last_sync = time.time()
         except Exception as e:
-            logger.error(f"Error getting config '{key}' from DB: {e}")
-        return None
+            logger.error(f"Error loading config from DB: {e}")
+
+    def _is_stale(self) -> bool:
+        if not self._loaded:
+            return True
+        interval = self.SYNC_INTERVAL_WITH_PUBSUB if self._pubsub_thread else self.SYNC_INTERVAL
+        return time.time() - self._last_sync >= interval
+
+    def _ensure_fresh(self):
+        if not self._loaded:
+            self.load_all()
+        elif self._is_stale():
+            self._sync_changes()
+
+    async def aget_config(self, key: str, default=None):
+        """get_config for async handlers: a due cache refresh runs in a worker thread."""
+        if self._is_stale():
+            await run_sync(self._ensure_fresh)
+        return self.get_config(key, default)
+
+    async def aget_configs(self, keys, default=None) -> dict:
+        if self._is_stale():
+            await run_sync(self._ensure_fresh)
+        return self.get_configs(keys, default)
+
+    def _sync_changes(self):
+        """Applies changes recorded by other processes since the last seen version."""
+        ConfigManager._last_sync = time.time()
+        try:
+            with get_db_session() as session:
+                oldest = session.query(func.min(ConfigChangeModel.id)).scalar()
+                changes = session.query(ConfigChangeModel.id, ConfigChangeModel.key_name) \
+                    .filter(ConfigChangeModel.id > self._version - self.RESCAN_WINDOW) \
+                    .order_by(ConfigChangeModel.id).all()
+            if self._version and oldest is not None and oldest > self._version + 1:
+                # The change log was pruned past our version: reload everything
+                self.load_all()
+                return
+            # Ids can be missing for good (rolled back writes), so rows are matched by id, not by gaps
+            changes = [(change_id, key) for change_id, key in changes if change_id not in self._applied_ids]
+            if not changes:
+                return
+            changed_keys = {key for _, key in changes}
+            values = self._get_many_from_db(changed_keys)
+            with self._lock:
+                for key in changed_keys:
+                    if key in values:
+                        self._cache[key] = values[key]
+                    else:
+                        self._cache.pop(key, None)
+                version = max(self._version, changes[-1][0])
+                ConfigManager._applied_ids = frozenset(
+                    change_id for change_id in self._applied_ids.union(change_id for change_id, _ in changes)
+                    if change_id > version - self.RESCAN_WINDOW
+                )
+                ConfigManager._version = version
+            logger.debug(f"Config cache refreshed keys: {sorted(changed_keys)}")
+        except Exception as e:
+            logger.error(f"Error syncing config changes: {e}")
+
+    def _get_many_from_db(self, keys) -> dict:
+        """Fetches the given keys with a single IN (...) query."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        with get_db_session() as session:
+            rows = session.query(ConfigModel.key_name, ConfigModel.key_value) \
+                .filter(ConfigModel.key_name.in_(keys)).all()
+        return {key: value for key, value in rows}
+
+    @classmethod
+    def _record_changes(cls, session, keys):
+        """Appends change-log rows for `keys` to the current transaction and prunes old entries."""
+        for key in keys:
+            session.add(ConfigChangeModel(key_name=key))
+        session.flush()
+        latest = session.query(func.max(ConfigChangeModel.id)).scalar() or 0
+        if latest > cls.MAX_CHANGE_LOG_ROWS:
+            session.query(ConfigChangeModel) \
+                .filter(ConfigChangeModel.id <= latest - cls.MAX_CHANGE_LOG_ROWS) \
+                .delete(synchronize_session=False)
+
+    def _publish_changes(self, keys):
+        """Notifies other processes through Redis, when available."""
+        if not self._pubsub_thread:
+            return
+        try:
+            from .redis_client import get_redis_client
+            client = get_redis_client()
+            if client:
+                client.publish(self.CONFIG_CHANNEL, json.dumps(sorted(keys)))
+        except Exception as e:
+            logger.warning(f"Failed to publish config change: {e}")
 
     def set_config(self, key: str, value: str):
         try:
@@ -187,22 +551,414 @@ class ConfigManager:
                 else:
                     new_config = ConfigModel(key_name=key, key_value=value)
                     session.add(new_config)
+                self._record_changes(session, [key])
                 session.commit()
-                self._cache[key] = value # Update cache
+                with self._lock:
+                    self._cache[key] = value # Update cache
                 logger.info(f"Config '{key}' set.")
+            self._publish_changes([key])
         except Exception as e:
             logger.error(f"Error setting config '{key}': {e}")
 
+    def set_configs(self, values: dict) -> bool:
+        """Saves several config values in a single transaction. Unchanged values are not rewritten."""
+        values = dict(values)
+        if not values:
+            return True
+        try:
+            with get_db_session() as session:
+                existing = {
+                    item.key_name: item
+                    for item in session.query(ConfigModel).filter(ConfigModel.key_name.in_(list(values))).all()
+                }
+                changed = []
+                for key, value in values.items():
+                    if key not in existing:
+                        session.add(ConfigModel(key_name=key, key_value=value))
+                    elif existing[key].key_value != value:
+                        existing[key].key_value = value
+                    else:
+                        continue
+                    changed.append(key)
+                if changed:
+                    self._record_changes(session, changed)
+                    session.commit()
+                with self._lock:
+                    self._cache.update(values)
+            if changed:
+                logger.info(f"Config keys set: {', '.join(sorted(changed))}.")
+                self._publish_changes(changed)
+            return True
+        except Exception as e:
+            logger.error(f"Error setting config keys {sorted(values)}: {e}")
+            return False
+
+    def start_change_listener(self, redis_client):
+        """Subscribes to config change notifications published by other processes."""
+        self.stop_change_listener()
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(self.CONFIG_CHANNEL)
+        except Exception as e:
+            logger.warning(f"Config change notifications unavailable, polling the change log instead: {e}")
+            return
+
+        def listen():
+            try:
+                for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._sync_changes()
+            except Exception as e:
+                logger.warning(f"Config change listener stopped: {e}")
+            finally:
+                if ConfigManager._pubsub is pubsub:
+                    ConfigManager._pubsub_thread = None
+                    ConfigManager._pubsub = None
+
+        ConfigManager._pubsub = pubsub
+        ConfigManager._pubsub_thread = threading.Thread(target=listen, name="config-change-listener", daemon=True)
+        ConfigManager._pubsub_thread.start()
+        logger.info("Listening for config change notifications on Redis.")
+
+    def stop_change_listener(self):
+        pubsub = ConfigManager._pubsub
+        ConfigManager._pubsub = None
+        ConfigManager._pubsub_thread = None
+        if pubsub:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
     def clear_cache(self):
-        self._cache.clear()
+        with self._lock:
+            self._cache.clear()
+            ConfigManager._loaded = False
         logger.info("Configuration cache cleared.")
 
 db_config = ConfigManager()
 
+# --- Task Catalog ---
+class TaskManager:
+    """Stores task metadata in the 'tasks' table. Logs stay on disk, referenced by path."""
+
+    # Keys that live in their own (indexed) columns rather than in the JSON blob
+    COLUMN_KEYS = ("status", "url", "downloader", "upload_service", "created_by", "log_path", "upload_log_path")
+
+    # Keys served straight from table columns, without decoding the JSON blob
+    LIST_COLUMNS = frozenset(COLUMN_KEYS + ("id", "created_at", "updated_at"))
+
+    # Statuses a task never leaves
+    TERMINAL_STATUSES = ("completed", "failed")
+
+    @staticmethod
+    def _columns_to_dict(item: TaskModel) -> dict:
+        return {
+            "id": item.id,
+            "status": item.status,
+            "url": item.url,
+            "downloader": item.downloader,
+            "upload_service": item.upload_service,
+            "created_by": item.created_by,
+            "log_path": item.log_path,
+            "upload_log_path": item.upload_log_path,
+            "created_at": item.created_at.isoformat() if item.created_at else None,
+            "updated_at": item.updated_at.isoformat() if item.updated_at else None,
+        }
+
+    @classmethod
+    def _to_dict(cls, item: TaskModel) -> dict:
+        try:
+            task = json.loads(item.data) if item.data else {}
+        except ValueError:
+            task = {}
+        task.update(cls._columns_to_dict(item))
+        return task
+
+    @staticmethod
+    def _apply_filters(query, status=None, created_by=None, downloader=None, upload_service=None,
+                       created_after=None, created_before=None):
+        if status:
+            if isinstance(status, (list, tuple, set)):
+                query = query.filter(TaskModel.status.in_(list(status)))
+            else:
+                query = query.filter(TaskModel.status == status)
+        if created_by:
+            query = query.filter(TaskModel.created_by == created_by)
+        if downloader:
+            query = query.filter(TaskModel.downloader == downloader)
+        if upload_service:
+            query = query.filter(TaskModel.upload_service == upload_service)
+        if created_after:
+            query = query.filter(TaskModel.created_at >= created_after)
+        if created_before:
+            query = query.filter(TaskModel.created_at < created_before)
+        return query
+
+    _listeners = []
+
+    def subscribe(self, listener):
+        """
+        Registers `listener(event, before, after)` to be called after every committed change.
+        `event` is "upsert" or "delete"; `before`/`after` are task dicts (None when absent).
+        """
+        self._listeners.append(listener)
+
+    def _publish(self, event: str, before, after):
+        for listener in list(self._listeners):
+            try:
+                listener(event, before, after)
+            except Exception as e:
+                logger.error(f"Error in task change listener: {e}")
+
+    def update_task(self, task_id: str, updates: dict):
+        """Creates or updates a task, merging `updates` into the stored metadata."""
+        try:
+            with get_db_session() as session:
+                item = session.get(TaskModel, task_id)
+                if item is None:
+                    before = None
+                    item = TaskModel(id=task_id, status="queued")
+                    session.add(item)
+                    data = {}
+                else:
+                    before = self._columns_to_dict(item)
+                    try:
+                        data = json.loads(item.data) if item.data else {}
+                    except ValueError:
+                        data = {}
+
+                for key, value in updates.items():
+                    if key == "id":
+                        continue
+                    if key in self.COLUMN_KEYS:
+                        setattr(item, key, value)
+                    else:
+                        data[key] = value
+
+                # Fill indexed columns from the submitted form on creation
+                original_params = data.get("original_params") or {}
+                if not item.downloader and original_params.get("downloader"):
+                    item.downloader = original_params.get("downloader")
+                if not item.upload_service and original_params.get("upload_service"):
+                    item.upload_service = original_params.get("upload_service")
+                if not item.url and original_params.get("url"):
+                    item.url = original_params.get("url")
+
+                item.data = json.dumps(data)
+                session.flush()
+                after = self._to_dict(item)
+                session.commit()
+            self._publish("upsert", before, after)
+        except Exception as e:
+            logger.error(f"Error updating task '{task_id}': {e}")
+
+    def get_task(self, task_id: str):
+        try:
+            with get_db_session() as session:
+                item = session.get(TaskModel, task_id)
+                return self._to_dict(item) if item else None
+        except Exception as e:
+            logger.error(f"Error getting task '{task_id}': {e}")
+            return None
+
+    def delete_task(self, task_id: str) -> bool:
+        try:
+            with get_db_session() as session:
+                item = session.get(TaskModel, task_id)
+                if item is None:
+                    return False
+                before = self._columns_to_dict(item)
+                session.delete(item)
+                session.commit()
+            self._publish("delete", before, None)
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting task '{task_id}': {e}")
+            return False
+
+    def list_tasks(self, limit: int = None, offset: int = 0, cursor: tuple = None, fields=None, **filters):
+        """
+        Returns tasks matching the filters, newest first.
+        `cursor` is a (created_at, id) pair; only tasks strictly older than it are returned.
+        `fields` limits the returned keys; the JSON column is not loaded when only indexed columns are requested.
+        """
+        try:
+            with get_db_session() as session:
+                query = self._apply_filters(session.query(TaskModel), **filters)
+                if fields and not (set(fields) - self.LIST_COLUMNS):
+                    query = query.options(defer(TaskModel.data))
+                if cursor:
+                    cursor_created_at, cursor_id = cursor
+                    query = query.filter(or_(
+                        TaskModel.created_at < cursor_created_at,
+                        and_(TaskModel.created_at == cursor_created_at, TaskModel.id < cursor_id)
+                    ))
+                query = query.order_by(TaskModel.created_at.desc(), TaskModel.id.desc())
+                if offset:
+                    query = query.offset(offset)
+                if limit:
+                    query = query.limit(limit)
+
+                tasks = []
+                for item in query.all():
+                    if fields and not (set(fields) - self.LIST_COLUMNS):
+                        task = self._columns_to_dict(item)
+                    else:
+                        task = self._to_dict(item)
+                    if fields:
+                        task = {key: task.get(key) for key in fields}
+                    tasks.append(task)
+                return tasks
+        except Exception as e:
+            logger.error(f"Error listing tasks: {e}")
+            return []
+
+    def fail_interrupted_tasks(self, reason: str) -> int:
+        """
+        Marks every task that is not finished as failed with `reason` and clears its process group.
+        Called at startup: a task the previous process was running cannot be resumed.
+        """
+        try:
+            changes = []
+            with get_db_session() as session:
+                items = session.query(TaskModel).filter(TaskModel.status.notin_(self.TERMINAL_STATUSES)).all()
+                for item in items:
+                    before = self._columns_to_dict(item)
+                    try:
+                        data = json.loads(item.data) if item.data else {}
+                    except ValueError:
+                        data = {}
+                    data.update(error=reason, pgid=None)
+                    item.status = "failed"
+                    item.data = json.dumps(data)
+                    changes.append((before, item))
+                session.flush()
+                changes = [(before, self._to_dict(item)) for before, item in changes]
+                session.commit()
+            for before, after in changes:
+                self._publish("upsert", before, after)
+            return len(changes)
+        except Exception as e:
+            logger.error(f"Error failing interrupted tasks: {e}")
+            return 0
+
+    def count_tasks(self, **filters) -> int:
+        try:
+            with get_db_session() as session:
+                return self._apply_filters(session.query(TaskModel), **filters).count()
+        except Exception as e:
+            logger.error(f"Error counting tasks: {e}")
+            return 0
+
+    def count_by_status(self, created_by=None) -> dict:
+        """Returns a {status: count} mapping computed with a single GROUP BY."""
+        try:
+            with get_db_session() as session:
+                query = self._apply_filters(session.query(TaskModel.status, func.count(TaskModel.id)), created_by=created_by)
+                return {row[0]: row[1] for row in query.group_by(TaskModel.status).all()}
+        except Exception as e:
+            logger.error(f"Error counting tasks by status: {e}")
+            return {}
+
+db_tasks = TaskManager()
+
+# --- Sync Scheduler State ---
+class SyncStateManager:
+    """Persists the schedule of periodic sync tasks ('sync_state') and their run history ('sync_runs')."""
+
+    # Runs kept per task; older ones are pruned when a run is recorded
+    HISTORY_LIMIT = 200
+
+    @staticmethod
+    def _state_to_dict(item: SyncStateModel) -> dict:
+        return {
+            "name": item.name,
+            "last_run_at": item.last_run_at.isoformat() if item.last_run_at else None,
+            "last_success_at": item.last_success_at.isoformat() if item.last_success_at else None,
+            "next_run_at": item.next_run_at.isoformat() if item.next_run_at else None,
+            "consecutive_failures": item.consecutive_failures or 0,
+            "last_error": item.last_error,
+        }
+
+    @staticmethod
+    def _run_to_dict(item: SyncRunModel) -> dict:
+        return {
+            "id": item.id,
+            "task_name": item.task_name,
+            "started_at": item.started_at.isoformat() if item.started_at else None,
+            "duration": round(item.duration or 0, 3),
+            "bytes": item.bytes,
+            "files": item.files,
+            "full": bool(item.full),
+            "success": bool(item.success),
+            "error": item.error,
+        }
+
+    def get_states(self) -> dict:
+        """Returns {task name: state dict} for every task that has run."""
+        try:
+            with get_db_session() as session:
+                return {item.name: self._state_to_dict(item) for item in session.query(SyncStateModel).all()}
+        except Exception as e:
+            logger.error(f"Error loading sync state: {e}")
+            return {}
+
+    def save_state(self, name: str, **fields):
+        """Creates or updates the state of a task; `fields` are SyncStateModel columns."""
+        try:
+            with get_db_session() as session:
+                item = session.get(SyncStateModel, name)
+                if item is None:
+                    item = SyncStateModel(name=name, consecutive_failures=0)
+                    session.add(item)
+                for key, value in fields.items():
+                    setattr(item, key, value)
+                session.commit()
+        except Exception as e:
+            logger.error(f"Error saving sync state for '{name}': {e}")
+
+    def record_run(self, task_name: str, started_at: datetime, duration: float, success: bool,
+                   bytes: Optional[int] = None, files: Optional[int] = None, full: bool = False, error: Optional[str] = None):
+        try:
+            with get_db_session() as session:
+                session.add(SyncRunModel(task_name=task_name, started_at=started_at, duration=duration, success=success,
+                                         bytes=bytes, files=files, full=full, error=error))
+                session.flush()
+                # Keep the newest HISTORY_LIMIT runs of this task
+                cutoff = (session.query(SyncRunModel.id).filter(SyncRunModel.task_name == task_name)
+                          .order_by(SyncRunModel.id.desc()).offset(self.HISTORY_LIMIT).first())
+                if cutoff:
+                    session.query(SyncRunModel).filter(
+                        SyncRunModel.task_name == task_name, SyncRunModel.id <= cutoff[0]
+                    ).delete(synchronize_session=False)
+                session.commit()
+        except Exception as e:
+            logger.error(f"Error recording sync run for '{task_name}': {e}")
+
+    def list_runs(self, task_name: Optional[str] = None, limit: int = 50) -> list:
+        """Returns the most recent runs, newest first, optionally for a single task."""
+        try:
+            with get_db_session() as session:
+                query = session.query(SyncRunModel)
+                if task_name:
+                    query = query.filter(SyncRunModel.task_name == task_name)
+                return [self._run_to_dict(item) for item in query.order_by(SyncRunModel.id.desc()).limit(limit).all()]
+        except Exception as e:
+            logger.error(f"Error listing sync runs: {e}")
+            return []
+
+db_sync = SyncStateManager()
+
 # --- User Helper Wrapper (Adapting to existing code interface) ---
 class User:
     _user_cache = {}
 
+    # Setup state: once any user exists it stays complete, so only "not yet" needs re-checking
+    SETUP_RECHECK_INTERVAL = 5  # seconds
+    _setup_complete = False
+    _setup_checked_at = 0.0
+
     def __init__(self, id: int, username: str, hashed_password: str, is_admin: bool, **kwargs):
         self.id = id
         self.username = username
@@ -235,6 +991,7 @@ class User:
                 session.commit()
                 # Clear user cache on new user creation
                 User._user_cache.pop(username, None)
+                User._setup_complete = True
                 logger.info(f"User '{username}' created successfully.")
                 return True
         except Exception as e:
@@ -250,6 +1007,16 @@ class User:
             logger.error(f"Error counting users: {e}")
             return 0
 
+    @staticmethod
+    def is_setup_complete() -> bool:
+        """Whether at least one user exists. Memoized; create_user flips it without a query."""
+        if User._setup_complete:
+            return True
+        if time.time() - User._setup_checked_at >= User.SETUP_RECHECK_INTERVAL:
+            User._setup_complete = User.count_users() > 0
+            User._setup_checked_at = time.time()
+        return User._setup_complete
+
     @staticmethod
     def update_password(username: str, new_hashed_password: str):
         try:
@@ -268,6 +1035,58 @@ class User:
             logger.error(f"Error updating password for user '{username}': {e}")
             return False
 
+    # --- Async variants for request handlers ---
+    @staticmethod
+    async def aget_user_by_username(username: str):
+        if username in User._user_cache:
+            return User._user_cache[username]
+
+        session_factory = get_async_session_factory()
+        if session_factory is None:
+            return await run_sync(User.get_user_by_username, username)
+        try:
+            async with session_factory() as session:
+                result = await session.execute(select(UserModel).where(UserModel.username == username))
+                user_db = result.scalars().first()
+                if user_db:
+                    user = User(user_db.id, user_db.username, user_db.hashed_password, user_db.is_admin)
+                    User._user_cache[username] = user
+                    return user
+                return None
+        except Exception as e:
+            logger.error(f"Error getting user by username '{username}': {e}")
+            return None
+
+    @staticmethod
+    async def acount_users():
+        session_factory = get_async_session_factory()
+        if session_factory is None:
+            return await run_sync(User.count_users)
+        try:
+            async with session_factory() as session:
+                return (await session.execute(select(func.count()).select_from(UserModel))).scalar_one()
+        except Exception as e:
+            logger.error(f"Error counting users: {e}")
+            return 0
+
+    @staticmethod
+    async def ais_setup_complete() -> bool:
+        if User._setup_complete:
+            return True
+        if time.time() - User._setup_checked_at >= User.SETUP_RECHECK_INTERVAL:
+            User._setup_complete = await User.acount_users() > 0
+            User._setup_checked_at = time.time()
+        return User._setup_complete
+
+    # Writes are rare (setup, password changes); they reuse the sync code off the event loop
+    @staticmethod
+    async def acreate_user(username: str, hashed_password: str, is_admin: bool = False):
+        return await run_sync(User.create_user, username, hashed_password, is_admin)
+
+    @staticmethod
+    async def aupdate_password(username: str, new_hashed_password: str):
+        return await run_sync(User.update_password, username, new_hashed_password)
+
 # --- Database Cleanup ---
 KNOWN_CONFIG_KEYS = {
     # Redis
@@ -289,6 +1108,11 @@ KNOWN_CONFIG_KEYS = {
     "WDM_VERIFICATION_SECRET_KEY",
     "WDM_VERIFICATION_ID",
     "WDM_VERIFICATION_GEETEST_DEMO_TYPE",
+    # Log retention
+    "WDM_LOG_RETENTION_DAYS",
+    "WDM_LOG_MAX_ROWS",
+    "WDM_LOG_MAX_SIZE_MB",
+    "WDM_LOG_PARTITIONING",
     # Tunnel
     "TUNNEL_TOKEN",
     # UI
@@ -313,7 +1137,23 @@ KNOWN_CONFIG_KEYS = {
     "WDM_S3_ENDPOINT",
     # Upload Services - B2
     "WDM_B2_ACCOUNT_ID",
-    "WDM_B2_APPLICATION_KEY"
+    "WDM_B2_APPLICATION_KEY",
+    # Upload Services - rclone transfer profiles
+    "WDM_WEBDAV_TRANSFERS",
+    "WDM_WEBDAV_CHECKERS",
+    "WDM_WEBDAV_MULTI_THREAD_STREAMS",
+    "WDM_WEBDAV_BUFFER_SIZE",
+    "WDM_S3_TRANSFERS",
+    "WDM_S3_CHECKERS",
+    "WDM_S3_MULTI_THREAD_STREAMS",
+    "WDM_S3_BUFFER_SIZE",
+    "WDM_S3_UPLOAD_CONCURRENCY",
+    "WDM_S3_CHUNK_SIZE",
+    "WDM_B2_TRANSFERS",
+    "WDM_B2_CHECKERS",
+    "WDM_B2_MULTI_THREAD_STREAMS",
+    "WDM_B2_BUFFER_SIZE",
+    "WDM_B2_CHUNK_SIZE"
 }
 
 def cleanup_database():
@@ -325,7 +1165,7 @@ def cleanup_database():
     
     try:
         # 1. Clean unused tables
-        inspector = inspect(engine)
+        inspector = inspect(get_engine())
         db_tables = inspector.get_table_names()
         model_tables = Base.metadata.tables.keys()
         
@@ -346,8 +1186,12 @@ def cleanup_database():
                     logger.warning(f"Removing unused config key: {config.key_name}")
                     session.delete(config)
                     cleaned_configs.append(config.key_name)
+            if cleaned_configs:
+                ConfigManager._record_changes(session, cleaned_configs)
             
             session.commit()
+        if cleaned_configs:
+            db_config.clear_cache()
             
     except Exception as e:
         logger.error(f"Error during database cleanup: {e}")
@@ -369,10 +1213,3 @@ def clear_all_caches():
     from . import status
     status.clear_status_cache()
     logger.info("All application caches cleared.")
-
-# Check if we are using SQLite (memory or file) and initialize DB immediately
-# This prevents errors when other modules (like redis_client) try to access config on import
-logger.info(f"Checking database URL for initialization: {engine.url}")
-if "sqlite" in str(engine.url):
-    logger.info("SQLite database detected. Initializing tables immediately.")
-    init_db()
@@ -0,0 +1,216 @@
+import time
+import uuid
+import asyncio
+import logging
+import weakref
+from pathlib import Path
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SERVERS_URL = "https://api.gofile.io/servers"
+# How long the latency-ranked server list is reused before it is fetched again
+SERVER_CACHE_TTL = 600
+PROBE_TIMEOUT = 5
+# Bytes read from disk per chunk of the request body
+CHUNK_SIZE = 1024 * 1024
+# Archives of one job uploaded at the same time
+MAX_PARALLEL_UPLOADS = 3
+UPLOAD_TIMEOUT = 300
+
+# One client (and connection pool) per event loop, shared by every upload
+_clients = weakref.WeakKeyDictionary()
+_servers = {"names": [], "fetched_at": 0.0}
+_server_locks = weakref.WeakKeyDictionary()
+
+class GofileError(Exception):
+    """Custom exception for Gofile errors."""
+    pass
+
+def get_client():
+    """Returns the shared httpx client of the running event loop."""
+    import httpx
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(timeout=httpx.Timeout(UPLOAD_TIMEOUT, connect=15), follow_redirects=True)
+        _clients[loop] = client
+    return client
+
+async def close_client():
+    """Closes the shared client of the running event loop, if one was created."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+async def _probe_server(client, name: str) -> float:
+    started = time.monotonic()
+    try:
+        await client.head(f"https://{name}.gofile.io/", timeout=PROBE_TIMEOUT)
+    except Exception:
+        return float("inf")
+    return time.monotonic() - started
+
+async def get_servers(status_file: Optional[Path] = None) -> List[str]:
+    """
+    Returns upload server names, fastest first. The list is fetched and every server
+    probed concurrently at most once per SERVER_CACHE_TTL; unreachable servers go last.
+    """
+    if _servers["names"] and time.time() - _servers["fetched_at"] < SERVER_CACHE_TTL:
+        return list(_servers["names"])
+    # Parallel uploads share one fetch
+    lock = _server_locks.setdefault(asyncio.get_running_loop(), asyncio.Lock())
+    async with lock:
+        if _servers["names"] and time.time() - _servers["fetched_at"] < SERVER_CACHE_TTL:
+            return list(_servers["names"])
+        return await _fetch_servers(status_file)
+
+async def _fetch_servers(status_file: Optional[Path]) -> List[str]:
+    _status(status_file, "Fetching Gofile server list...")
+    client = get_client()
+    try:
+        response = await client.get(SERVERS_URL, timeout=60)
+        response.raise_for_status()
+        data = response.json()
+        if data.get("status") != "ok":
+            raise GofileError(f"Gofile API did not return 'ok' for server list: {data}")
+        names = [server["name"] for server in data["data"]["servers"]]
+    except Exception as e:
+        error_message = f"FATAL: Could not fetch Gofile server list: {e}"
+        _status(status_file, error_message)
+        raise GofileError(error_message)
+
+    latencies = await asyncio.gather(*(_probe_server(client, name) for name in names))
+    ranked = [name for _, name in sorted(zip(latencies, names))]
+    _servers.update(names=ranked, fetched_at=time.time())
+    _status(status_file, "Gofile servers by latency: " + ", ".join(
+        f"{name} ({latency * 1000:.0f}ms)" if latency != float("inf") else f"{name} (unreachable)"
+        for latency, name in sorted(zip(latencies, names))
+    ))
+    return list(ranked)
+
+def _multipart_parts(boundary: str, fields: dict, filename: str):
+    """Returns the bytes that go before and after the file content in a multipart body."""
+    head = b""
+    for name, value in fields.items():
+        head += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n").encode()
+    quoted = filename.replace("\\", "\\\\").replace('"', "%22").replace("\r", "").replace("\n", "")
+    head += (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{quoted}\"\r\n"
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    return head, f"\r\n--{boundary}--\r\n".encode()
+
+async def _multipart_body(head: bytes, tail: bytes, file_path: Path, progress: Optional[Callable[[int], None]]):
+    """
+    Yields the multipart body with the file streamed from disk: chunks are read in a worker
+    thread and passed on as-is, never buffered into one body or read on the event loop.
+    """
+    yield head
+    with open(file_path, "rb", buffering=0) as f:
+        sent = 0
+        while True:
+            chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+            sent += len(chunk)
+            if progress:
+                progress(sent)
+    yield tail
+
+async def _upload_to_server(server: str, file_path: Path, fields: dict,
+                            progress: Optional[Callable[[int], None]]) -> dict:
+    boundary = uuid.uuid4().hex
+    head, tail = _multipart_parts(boundary, fields, file_path.name)
+    size = file_path.stat().st_size
+    headers = {
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+        "Content-Length": str(len(head) + size + len(tail)),
+    }
+    response = await get_client().post(
+        f"https://{server}.gofile.io/uploadFile",
+        content=_multipart_body(head, tail, file_path, progress),
+        headers=headers,
+    )
+    response.raise_for_status()
+    return response.json()
+
+async def upload_file(file_path: Path, status_file: Path, api_token: Optional[str] = None,
+                      folder_id: Optional[str] = None, progress_callback: Optional[Callable[[int, int], None]] = None) -> str:
+    """
+    Uploads a file to gofile.io and returns its download page. Servers are tried fastest
+    first; an authenticated upload that fails on every server falls back to a public one.
+    `progress_callback(sent, total)` is called as the file is streamed.
+    """
+    servers = await get_servers(status_file)
+    total = file_path.stat().st_size
+
+    def progress(sent):
+        if progress_callback:
+            progress_callback(sent, total)
+
+    attempts = [True, False] if api_token else [False]
+    for use_token in attempts:
+        upload_type = "authenticated" if use_token else "public"
+        fields = {}
+        if use_token:
+            fields["token"] = api_token
+            if folder_id:
+                fields["folderId"] = folder_id
+        _status(status_file, f"Attempting {upload_type} upload of {file_path.name}...")
+
+        for server in servers:
+            _status(status_file, f"Trying {upload_type} upload via server: {server}...")
+            try:
+                # gofile has no resumable uploads, so a failed attempt restarts on the next server
+                progress(0)
+                result = await _upload_to_server(server, file_path, fields, progress)
+            except Exception as e:
+                _status(status_file, f"An exception occurred during {upload_type} upload to {server}: {e}. Trying next server...")
+                continue
+            if result.get("status") == "ok":
+                download_link = result["data"]["downloadPage"]
+                _status(status_file, f"Gofile.io {upload_type} upload successful on server {server}! Link: {download_link}")
+                return download_link
+            _status(status_file, f"Gofile API returned an error on {upload_type} upload to {server}: {result}. Trying next server...")
+
+        _status(status_file, f"All Gofile servers failed for {upload_type} upload.")
+        if use_token and len(attempts) > 1:
+            _status(status_file, "Authenticated upload failed. Falling back to public upload.")
+
+    # Servers that failed everything may be gone; fetch a fresh list next time
+    _servers["fetched_at"] = 0.0
+    raise GofileError("Gofile.io upload failed completely after trying all available servers and fallback options.")
+
+async def upload_files(file_paths: List[Path], status_file: Path, api_token: Optional[str] = None,
+                       folder_id: Optional[str] = None, progress_callback: Optional[Callable[[Path, int, int], None]] = None,
+                       on_uploaded: Optional[Callable[[Path, str], None]] = None,
+                       max_parallel: int = MAX_PARALLEL_UPLOADS) -> List[str]:
+    """
+    Uploads several files (e.g. the volumes of a split archive) at most `max_parallel` at a
+    time and returns their links in the order of `file_paths`.
+    `progress_callback(path, sent, total)` reports bytes per file, `on_uploaded(path, link)` completions.
+    """
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def upload_one(path: Path) -> str:
+        async with semaphore:
+            progress = (lambda sent, total: progress_callback(path, sent, total)) if progress_callback else None
+            link = await upload_file(path, status_file, api_token, folder_id, progress)
+            if on_uploaded:
+                on_uploaded(path, link)
+            return link
+
+    tasks = [asyncio.create_task(upload_one(path)) for path in file_paths]
+    try:
+        return list(await asyncio.gather(*tasks))
+    finally:
+        # One failed volume fails the job; do not leave the others uploading
+        for task in tasks:
+            task.cancel()
+
+def _status(status_file: Optional[Path], message: str):
+    if status_file:
+        with open(status_file, "a", encoding="utf-8") as f:
+            f.write(message + "\n")
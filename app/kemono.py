@@ -0,0 +1,250 @@
+import os
+import re
+import time
+import shutil
+import asyncio
+import logging
+import weakref
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .utils import sanitize_filename, download_file, update_task_status
+from .rate_limit import TokenBucket, host_limiter
+
+logger = logging.getLogger(__name__)
+
+KEMONO_DOMAINS = ["kemono.cr", "kemono.su", "coomer.st", "coomer.su"]
+# Posts returned per page of the creator API
+PAGE_SIZE = 50
+# Downloads running at once per job; connections per host are limited by rate_limit
+MAX_CONCURRENT_DOWNLOADS = 8
+API_RETRIES = 3
+# The API answers with an anti-scraping page unless this Accept header is sent
+API_HEADERS = {"Accept": "text/css"}
+URL_PATTERN = re.compile(r"^(https?://[^/]+)/([^/]+)/user/([^/?#]+)(?:/post/([^/?#]+))?")
+HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+# Keep-alive clients per event loop, one per proxy
+_clients = weakref.WeakKeyDictionary()
+
+class KemonoError(Exception):
+    """Custom exception for kemono/coomer errors."""
+    pass
+
+def is_kemono_url(url: str) -> bool:
+    return any(domain in url for domain in KEMONO_DOMAINS)
+
+def get_client(proxy: Optional[str] = None):
+    """Returns the shared httpx client of the running event loop for `proxy`."""
+    import httpx
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(proxy)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            proxy=proxy,
+            follow_redirects=True,
+            timeout=httpx.Timeout(60, connect=15),
+            limits=httpx.Limits(max_connections=MAX_CONCURRENT_DOWNLOADS * 2, max_keepalive_connections=MAX_CONCURRENT_DOWNLOADS),
+        )
+        clients[proxy] = client
+    return client
+
+async def close_clients():
+    """Closes the shared clients of the running event loop."""
+    for client in _clients.pop(asyncio.get_running_loop(), {}).values():
+        await client.aclose()
+
+class KemonoDownloader:
+    """
+    Downloads a kemono/coomer creator, or a single post, into
+    `{service}/{creator_name}/{post_title}/{filename}` under the task's directory.
+    Posts are paged from the API and every file is planned before downloading. A file
+    attached to several posts is fetched once and hard-linked into the other posts.
+    Downloads share one keep-alive client. Requests go through the shared per-host limiters
+    of rate_limit, and `rate_limit` (bytes/s) caps the speed of the whole job.
+    """
+
+    def __init__(self, url: str, destination: Path, status_file: Path, task_id: Optional[str] = None,
+                 proxy: Optional[str] = None, cookies: Optional[str] = None,
+                 username: Optional[str] = None, password: Optional[str] = None,
+                 rate_limit: Optional[int] = None):
+        match = URL_PATTERN.match(url)
+        if not match:
+            raise KemonoError(f"Unsupported kemono/coomer URL: {url}")
+        self.base, self.service, self.user_id, self.post_id = match.groups()
+        self.destination = destination
+        self.status_file = status_file
+        self.task_id = task_id
+        self.client = get_client(proxy)
+        self.headers = {"Cookie": cookies} if cookies else {}
+        self.username = username
+        self.password = password
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+        self.bandwidth = TokenBucket(rate_limit) if rate_limit else None
+        self.stats = {"total_files": 0, "downloaded_files": 0, "duplicate_files": 0, "failed_files": 0,
+                      "downloaded_bytes": 0}
+        self.active: Dict[str, dict] = {}
+        self._last_report = 0.0
+
+    def _log(self, message: str):
+        with open(self.status_file, "a", encoding="utf-8") as f:
+            f.write(message + "\n")
+
+    # --- API ---
+    async def _api(self, path: str, params: Optional[dict] = None):
+        url = f"{self.base}/api/v1{path}"
+        for attempt in range(API_RETRIES):
+            try:
+                async with host_limiter(url).slot() as observe:
+                    response = await self.client.get(url, params=params, headers={**API_HEADERS, **self.headers})
+                    observe(response.status_code, response.headers.get("Retry-After"))
+                if response.status_code == 429 and attempt + 1 < API_RETRIES:
+                    await asyncio.sleep(10 * (attempt + 1))
+                    continue
+                response.raise_for_status()
+                return response.json()
+            except Exception as e:
+                if attempt + 1 == API_RETRIES:
+                    raise KemonoError(f"API request {path} failed: {e}")
+                await asyncio.sleep(5)
+
+    async def _login(self):
+        response = await self.client.post(f"{self.base}/api/v1/authentication/login",
+                                          json={"username": self.username, "password": self.password},
+                                          headers=API_HEADERS)
+        session = response.cookies.get("session")
+        if response.status_code != 200 or not session:
+            raise KemonoError(f"Login failed with status {response.status_code}")
+        self.headers["Cookie"] = f"session={session}"
+        self._log("Logged in.")
+
+    async def _creator_name(self) -> str:
+        try:
+            profile = await self._api(f"/{self.service}/user/{self.user_id}/profile")
+            return profile.get("name") or self.user_id
+        except KemonoError as e:
+            self._log(f"Could not fetch creator profile, using the id as name: {e}")
+            return self.user_id
+
+    async def _posts(self) -> List[dict]:
+        if self.post_id:
+            data = await self._api(f"/{self.service}/user/{self.user_id}/post/{self.post_id}")
+            # Newer API versions wrap the post
+            return [data.get("post", data) if isinstance(data, dict) else data]
+        posts = []
+        offset = 0
+        while True:
+            page = await self._api(f"/{self.service}/user/{self.user_id}/posts", params={"o": offset})
+            if not page:
+                break
+            posts.extend(page)
+            self._log(f"Fetched {len(posts)} posts...")
+            if len(page) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+        return posts
+
+    # --- Planning ---
+    def _plan(self, creator_name: str, posts: List[dict]) -> Dict[str, List[Path]]:
+        """Returns {file path on the server: destinations}, deduplicated by content hash."""
+        creator_dir = self.destination / sanitize_filename(self.service) / sanitize_filename(creator_name)
+        by_key: Dict[str, str] = {}
+        plan: Dict[str, List[Path]] = {}
+        used_dirs = set()
+        for post in posts:
+            post_dir_name = sanitize_filename(post.get("title")) or str(post.get("id"))
+            # Posts with the same title get their own folders
+            if post_dir_name in used_dirs:
+                post_dir_name = f"{post_dir_name} [{post.get('id')}]"
+            used_dirs.add(post_dir_name)
+            post_dir = creator_dir / post_dir_name
+
+            files = ([post["file"]] if post.get("file") else []) + (post.get("attachments") or [])
+            names_in_post = set()
+            for file in files:
+                server_path = file.get("path")
+                if not server_path:
+                    continue
+                stem = Path(server_path).stem
+                key = stem if HASH_PATTERN.match(stem) else server_path
+                name = sanitize_filename(file.get("name") or Path(server_path).name)
+                if key in by_key:
+                    destinations = plan[by_key[key]]
+                    # The post's main file is usually repeated among its attachments
+                    if any(destination.parent == post_dir for destination in destinations):
+                        continue
+                else:
+                    by_key[key] = server_path
+                    destinations = plan[server_path] = []
+                if name in names_in_post:
+                    name = f"{Path(name).stem}_{stem[:8]}{Path(name).suffix}"
+                names_in_post.add(name)
+                destinations.append(post_dir / name)
+        return plan
+
+    # --- Downloading ---
+    def _report(self, force: bool = False):
+        if not self.task_id:
+            return
+        now = time.time()
+        if not force and now - self._last_report < 0.5:
+            return
+        self._last_report = now
+        done = self.stats["downloaded_files"] + self.stats["failed_files"]
+        update_task_status(self.task_id, {"download_stats": {
+            **self.stats,
+            "percent": int(done / self.stats["total_files"] * 100) if self.stats["total_files"] else 0,
+            "files": [{"name": name, **progress} for name, progress in list(self.active.items())[:10]],
+        }})
+
+    async def _download(self, server_path: str, destinations: List[Path]):
+        url = f"{self.base}/data{server_path}"
+        first = destinations[0]
+        relative = str(first.relative_to(self.destination))
+        async with self.semaphore:
+            progress = self.active[relative] = {"done": 0, "total": 0, "percent": 0}
+
+            def on_progress(done, total):
+                progress.update(done=done, total=total, percent=int(done / total * 100) if total else 0)
+                self._report()
+
+            first.parent.mkdir(parents=True, exist_ok=True)
+            ok = await download_file(url, first, self.client, headers=self.headers, progress_callback=on_progress,
+                                     bandwidth=self.bandwidth)
+            self.active.pop(relative, None)
+
+        if not ok:
+            self.stats["failed_files"] += 1
+            self._log(f"FAILED: {relative}")
+        else:
+            self.stats["downloaded_files"] += 1
+            self.stats["downloaded_bytes"] += progress["done"]
+            self._log(f"Downloaded [{self.stats['downloaded_files']}/{self.stats['total_files']}]: {relative}")
+            for duplicate in destinations[1:]:
+                duplicate.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(first, duplicate)
+                except OSError:
+                    shutil.copy2(first, duplicate)
+        self._report(force=True)
+
+    async def run(self) -> dict:
+        """Downloads everything and returns the final stats."""
+        if self.username and self.password and not self.headers:
+            await self._login()
+        creator_name = await self._creator_name()
+        posts = await self._posts()
+        plan = self._plan(creator_name, posts)
+        self.stats["total_files"] = len(plan)
+        self.stats["duplicate_files"] = sum(len(destinations) - 1 for destinations in plan.values())
+        self._log(f"{len(posts)} post(s) of {creator_name}: {len(plan)} unique file(s), "
+                  f"{self.stats['duplicate_files']} duplicate(s) linked instead of downloaded.")
+        self._report(force=True)
+
+        downloads = [asyncio.create_task(self._download(path, destinations)) for path, destinations in plan.items()]
+        try:
+            await asyncio.gather(*downloads)
+        finally:
+            for download in downloads:
+                download.cancel()
+        return self.stats
@@ -1,16 +1,16 @@
-
+"""
 独立的日志端点应用，运行在端口8901。
 提供调试日志访问功能，即使主应用崩溃也能工作。
 通过请求头 'X-Log-Access-Key' 进行认证。
-
+"""
 import os
 import sys
 from pathlib import Path
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import PlainTextResponse
 import uvicorn
 import subprocess
 from .config import PROJECT_ROOT
+from .log_files import list_log_segments, resolve_log_segment, log_file_response, concatenated_logs_response
 
 # 配置
 LOG_PORT = 8901
@@ -25,26 +25,12 @@ LOG_FILES = [
 
 app = FastAPI(title="Web-DL-Manager Log Endpoint")
 
-def get_log_content(log_file: str) -> str:
-    """读取日志文件内容"""
-    try:
-        log_path = PROJECT_ROOT / log_file
-        if log_path.exists():
-            return log_path.read_text(encoding='utf-8', errors='ignore')
-        else:
-            return f"Log file not found: {log_file}"
-    except Exception as e:
-        return f"Error reading log file {log_file}: {str(e)}"
-
-def get_all_logs() -> str:
-    """获取所有日志文件的内容"""
-    result = []
-    for log_file in LOG_FILES:
-        content = get_log_content(log_file)
-        result.append(f"=== {log_file} ===")
-        result.append(content)
-        result.append("\n")
-    return "\n".join(result)
+def get_log_path(log_file: str, segment: str = None):
+    """日志文件路径（segment 指定已轮转的分段，支持 .gz）"""
+    log_path = PROJECT_ROOT / log_file
+    if segment:
+        return resolve_log_segment(log_path, segment)
+    return log_path
 
 @app.get("/")
 async def root():
@@ -53,10 +39,15 @@ async def root():
         "service": "Web-DL-Manager Log Endpoint",
         "port": LOG_PORT,
         "available_logs": LOG_FILES,
+        # 已轮转（可能已 gzip 压缩）的分段，通过 ?segment=<name> 读取
+        "segments": {
+            log_file: [path.name for path in list_log_segments(PROJECT_ROOT / log_file) if path != PROJECT_ROOT / log_file]
+            for log_file in LOG_FILES
+        },
         "endpoints": {
             "/": "This info",
             "/logs": "Get all logs (requires X-Log-Access-Key header)",
-            "/logs/{filename}": "Get specific log file (requires X-Log-Access-Key header)",
+            "/logs/{filename}": "Get specific log file (requires X-Log-Access-Key header; supports Range, ?segment=, ?follow=true)",
             "/health": "Health check"
         }
     }
@@ -76,11 +67,13 @@ async def get_logs(request: Request, access_key: str = None):
     if access_key != LOG_ACCESS_KEY:
         raise HTTPException(status_code=403, detail="Invalid access key")
     
-    return PlainTextResponse(content=get_all_logs())
+    # 逐块流式输出，避免将所有日志读入内存
+    return concatenated_logs_response(request, [(log_file, get_log_path(log_file)) for log_file in LOG_FILES])
 
-@app.get("/logs/{filename}")
-async def get_log_file(filename: str, request: Request, access_key: str = None):
-    """获取特定日志文件内容，需要认证"""
+@app.get("/logs/{filename:path}")
+async def get_log_file(filename: str, request: Request, access_key: str = None, segment: str = None,
+                       follow: bool = False):
+    """获取特定日志文件内容，需要认证。支持 Range 请求、gzip 传输和 follow=true 实时跟踪"""
     # 优先从URL参数获取密钥，如果没有则从请求头获取
     if access_key is None:
         access_key = request.headers.get("X-Log-Access-Key")
@@ -92,7 +85,10 @@ async def get_log_file(filename: str, request: Request, access_key: str = None):
     if filename not in LOG_FILES:
         raise HTTPException(status_code=404, detail="Log file not found")
     
-    return PlainTextResponse(content=get_log_content(filename))
+    log_path = get_log_path(filename, segment)
+    if log_path is None:
+        raise HTTPException(status_code=404, detail="Log segment not found")
+    return log_file_response(request, log_path, follow=follow)
 
 def start_tunnel_if_needed():
     """启动内网穿透连接到日志端点（8901端口）"""
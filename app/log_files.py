@@ -0,0 +1,330 @@
+"""
+Rotating application log files with background compression and a shared disk budget,
+plus streaming readers for them.
+
+Kept free of database imports so the standalone log endpoint can use the readers.
+"""
+import os
+import re
+import sys
+import gzip
+import zlib
+import asyncio
+import time
+import queue
+import shutil
+import threading
+import datetime
+from logging.handlers import BaseRotatingHandler
+from pathlib import Path
+
+from starlette.responses import PlainTextResponse, StreamingResponse
+
+# Defaults; WDM_LOG_FILE_MAX_MB / WDM_LOG_DISK_BUDGET_MB override them from the environment
+LOG_FILE_MAX_MB = 20
+LOG_DISK_BUDGET_MB = 200
+
+# Rotated segments are named "<file>.<YYYYmmdd-HHMMSS>[-n]" and gain ".gz" once compressed
+SEGMENT_RE = re.compile(r"^(?P<base>.+)\.(?P<stamp>\d{8}-\d{6}(?:-\d+)?)(?P<gz>\.gz)?$")
+
+def _env_mb(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name) or default)
+    except ValueError:
+        return default
+
+# --- Background compression ---
+_jobs = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+def _compress(path: Path):
+    target = path.with_name(path.name + ".gz")
+    partial = path.with_name(path.name + ".gz.part")
+    with open(path, "rb") as src, gzip.open(partial, "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(partial, target)
+    path.unlink()
+
+def _run_jobs():
+    while True:
+        kind, path, budget = _jobs.get()
+        try:
+            if kind == "compress":
+                _compress(path)
+            enforce_disk_budget(path.parent, budget)
+        except Exception as e:
+            # Never log from here: the handler that queued the job may be the one failing
+            sys.stderr.write(f"log_files: {kind} failed for {path}: {e}\n")
+
+def _submit(kind: str, path: Path, budget: int):
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_jobs, name="log-compressor", daemon=True)
+            _worker.start()
+    _jobs.put((kind, path, budget))
+
+def enforce_disk_budget(log_dir: Path, budget_bytes: int):
+    """Deletes the oldest rotated segments in `log_dir` until all log files fit in the budget."""
+    if budget_bytes <= 0:
+        return
+    active, segments = 0, []
+    for entry in os.scandir(log_dir):
+        if not entry.is_file():
+            continue
+        if SEGMENT_RE.match(entry.name):
+            stat = entry.stat()
+            segments.append((stat.st_mtime, entry.path, stat.st_size))
+        elif entry.name.endswith(".log"):
+            active += entry.stat().st_size
+    total = active + sum(size for _, _, size in segments)
+    for _, path, size in sorted(segments):
+        if total <= budget_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+# --- Handler ---
+class CompressingRotatingFileHandler(BaseRotatingHandler):
+    """
+    File handler that rotates when the file exceeds `max_bytes` or at local midnight.
+    Rotated segments are gzipped on a background thread, and the oldest segments in the
+    directory are removed once all log files together exceed `disk_budget` bytes.
+    """
+
+    def __init__(self, filename, max_bytes=None, disk_budget=None, encoding="utf-8", delay=False):
+        filename = os.fspath(filename)
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        super().__init__(filename, mode="a", encoding=encoding, delay=delay)
+        self.max_bytes = max_bytes if max_bytes is not None else _env_mb("WDM_LOG_FILE_MAX_MB", LOG_FILE_MAX_MB) * 1024 * 1024
+        self.disk_budget = disk_budget if disk_budget is not None else _env_mb("WDM_LOG_DISK_BUDGET_MB", LOG_DISK_BUDGET_MB) * 1024 * 1024
+        self.next_rollover = self._next_midnight()
+        self._recover()
+
+    @staticmethod
+    def _next_midnight() -> float:
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        return datetime.datetime.combine(tomorrow, datetime.time.min).timestamp()
+
+    def _recover(self):
+        """Re-queues segments left uncompressed by a previous process and applies the budget."""
+        log_path = Path(self.baseFilename)
+        for path in log_path.parent.glob(log_path.name + ".*"):
+            if path.name.endswith(".gz.part"):
+                path.unlink(missing_ok=True)
+                continue
+            match = SEGMENT_RE.match(path.name)
+            if match and not match["gz"] and match["base"] == log_path.name:
+                _submit("compress", path, self.disk_budget)
+        _submit("budget", log_path, self.disk_budget)
+
+    def shouldRollover(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        position = self.stream.tell()
+        if position == 0:
+            return False
+        if time.time() >= self.next_rollover:
+            return True
+        if self.max_bytes > 0:
+            msg = "%s\n" % self.format(record)
+            return position + len(msg.encode(self.encoding or "utf-8", errors="replace")) > self.max_bytes
+        return False
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        target = Path(f"{self.baseFilename}.{stamp}")
+        n = 1
+        while target.exists() or target.with_name(target.name + ".gz").exists():
+            target = Path(f"{self.baseFilename}.{stamp}-{n}")
+            n += 1
+        if os.path.exists(self.baseFilename):
+            os.rename(self.baseFilename, target)
+            _submit("compress", target, self.disk_budget)
+        self.next_rollover = self._next_midnight()
+        if not self.delay:
+            self.stream = self._open()
+
+# --- Readers ---
+def list_log_segments(path: Path) -> list:
+    """Rotated segments of `path` (compressed or not), oldest first, then the live file."""
+    path = Path(path)
+    segments = {}
+    if path.parent.is_dir():
+        for entry in path.parent.iterdir():
+            match = SEGMENT_RE.match(entry.name)
+            # While a segment is being compressed both forms exist briefly; list it once
+            if match and match["base"] == path.name and (match["gz"] or match["stamp"] not in segments):
+                segments[match["stamp"]] = entry
+    # "<stamp>-10" sorts after "<stamp>-9"
+    result = [segments[stamp] for stamp in sorted(segments, key=lambda stamp: (stamp[:15], int(stamp[16:] or 0)))]
+    if path.exists():
+        result.append(path)
+    return result
+
+def resolve_log_segment(path: Path, segment: str) -> Path:
+    """Returns the segment of `path` named `segment`, or None; only names from list_log_segments are accepted."""
+    for candidate in list_log_segments(path):
+        if candidate.name == segment:
+            return candidate
+    return None
+
+def open_log_segment(path: Path):
+    """Opens a segment for binary reading, decompressing .gz segments transparently."""
+    path = Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+# --- Streaming responses ---
+STREAM_CHUNK_SIZE = 64 * 1024
+FOLLOW_POLL_INTERVAL = 0.5
+# follow=true without a Range header starts this far from the end of the file
+FOLLOW_TAIL_BYTES = 64 * 1024
+
+def parse_byte_range(header: str, size: int):
+    """Parses a single "bytes=start-end" range. Returns (start, end inclusive); raises ValueError if unsatisfiable."""
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header or "")
+    if not match or not (match[1] or match[2]):
+        raise ValueError("Unsupported range")
+    if match[1]:
+        start = int(match[1])
+        end = min(int(match[2]), size - 1) if match[2] else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(0, size - int(match[2]))
+        end = size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+def iter_segment_bytes(path: Path, start: int = 0, end: int = None):
+    """Yields the (decompressed) bytes of a segment in STREAM_CHUNK_SIZE chunks, optionally a byte slice."""
+    with open_log_segment(path) as f:
+        if start:
+            f.seek(start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            chunk = f.read(STREAM_CHUNK_SIZE if remaining is None else min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+def iter_segment_bytes_raw(path: Path):
+    """Yields the stored bytes of a file without decompressing it."""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+def gzip_chunks(chunks):
+    """Gzip-compresses an iterable of byte chunks incrementally."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+async def follow_log_file(path: Path, start: int, request):
+    """Yields bytes appended to `path` from `start` on until the client disconnects; restarts on rotation."""
+    f = open(path, "rb")
+    try:
+        inode = os.fstat(f.fileno()).st_ino
+        f.seek(start)
+        while not await request.is_disconnected():
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            if chunk:
+                yield chunk
+                continue
+            await asyncio.sleep(FOLLOW_POLL_INTERVAL)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_ino != inode or stat.st_size < f.tell():
+                # Rotated or truncated: continue with the new file from its start
+                f.close()
+                f = open(path, "rb")
+                inode = os.fstat(f.fileno()).st_ino
+    finally:
+        f.close()
+
+def _accepts_gzip(request) -> bool:
+    return "gzip" in request.headers.get("accept-encoding", "").lower()
+
+def log_file_response(request, path: Path, follow: bool = False):
+    """
+    Streams a log file or segment without loading it into memory.
+    Supports single byte ranges on uncompressed files, gzip transfer encoding when the client
+    accepts it (.gz segments are sent as stored), and follow=True to keep tailing live output.
+    """
+    path = Path(path)
+    if not path.exists():
+        return PlainTextResponse("Log file not found", status_code=404)
+    media_type = "text/plain; charset=utf-8"
+    compressed = path.suffix == ".gz"
+
+    if compressed:
+        if _accepts_gzip(request):
+            return StreamingResponse(
+                iter_segment_bytes_raw(path), media_type=media_type,
+                headers={"Content-Encoding": "gzip", "Content-Length": str(path.stat().st_size), "Vary": "Accept-Encoding"},
+            )
+        return StreamingResponse(iter_segment_bytes(path), media_type=media_type)
+
+    size = path.stat().st_size
+    headers = {"Accept-Ranges": "bytes"}
+    start, end = 0, None
+    range_header = request.headers.get("range")
+    if range_header:
+        try:
+            start, end = parse_byte_range(range_header, size)
+        except ValueError:
+            return PlainTextResponse("Range not satisfiable", status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    if follow:
+        if not range_header:
+            start = max(0, size - FOLLOW_TAIL_BYTES)
+        return StreamingResponse(follow_log_file(path, start, request), media_type=media_type,
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    if range_header:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(iter_segment_bytes(path, start, end), status_code=206, media_type=media_type, headers=headers)
+
+    # Snapshot the size so a growing file still matches Content-Length
+    end = size - 1
+    if _accepts_gzip(request):
+        headers.update({"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+        return StreamingResponse(gzip_chunks(iter_segment_bytes(path, 0, end)), media_type=media_type, headers=headers)
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(iter_segment_bytes(path, 0, end), media_type=media_type, headers=headers)
+
+def concatenated_logs_response(request, entries):
+    """Streams several logs one after another, each under a "=== name ===" header. `entries` are (name, path) pairs."""
+    def chunks():
+        for name, path in entries:
+            yield f"=== {name} ===\n".encode("utf-8")
+            if path is not None and Path(path).exists():
+                yield from iter_segment_bytes(Path(path))
+            else:
+                yield f"Log file not found: {name}".encode("utf-8")
+            yield b"\n\n"
+
+    if _accepts_gzip(request):
+        return StreamingResponse(gzip_chunks(chunks()), media_type="text/plain; charset=utf-8",
+                                 headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+    return StreamingResponse(chunks(), media_type="text/plain; charset=utf-8")
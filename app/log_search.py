@@ -0,0 +1,241 @@
+import re
+import json
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import text
+
+from .database import get_engine
+from .log_files import open_log_segment
+
+DEFAULT_SEARCH_LIMIT = 500
+MAX_SEARCH_LIMIT = 5000
+# Rows fetched per query while streaming database results
+DB_FETCH_SIZE = 500
+
+# Matches our "%(asctime)s - %(name)s - %(levelname)s - %(message)s" format
+LOG_LINE_RE = re.compile(
+    r"^(?P<timestamp>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:[,.]\d+)?) - (?P<logger>\S+) - (?P<level>[A-Z]+) - "
+)
+
+# --- Database logs ---
+def _escape_like(value: str) -> str:
+    return value.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+
+def search_db_logs(levels=None, logger_prefix=None, since=None, until=None, q=None,
+                   cursor=None, limit=DEFAULT_SEARCH_LIMIT):
+    """
+    Yields matching rows of the 'logs' table, newest first, followed by a final
+    {"next_cursor", "has_more"} item. The cursor is the id of the last row returned.
+    Rows are fetched DB_FETCH_SIZE at a time using keyset pagination on the primary key.
+    """
+    clauses, params = [], {}
+    if levels:
+        names = [f"level_{i}" for i in range(len(levels))]
+        clauses.append(f"level IN ({', '.join(':' + n for n in names)})")
+        params.update(zip(names, [level.upper() for level in levels]))
+    if logger_prefix:
+        clauses.append("logger_name LIKE :logger_prefix ESCAPE '!'")
+        params["logger_prefix"] = _escape_like(logger_prefix) + "%"
+    if since:
+        clauses.append("timestamp >= :since")
+        params["since"] = since
+    if until:
+        clauses.append("timestamp < :until")
+        params["until"] = until
+    if q:
+        clauses.append("message LIKE :q ESCAPE '!'")
+        params["q"] = "%" + _escape_like(q) + "%"
+
+    last_id = int(cursor) if cursor else None
+    returned = 0
+    has_more = False
+    with get_engine().connect() as conn:
+        while True:
+            page_clauses = list(clauses)
+            if last_id is not None:
+                page_clauses.append("id < :last_id")
+                params["last_id"] = last_id
+            where = f"WHERE {' AND '.join(page_clauses)}" if page_clauses else ""
+            # Fetch one extra row to know whether another page exists
+            fetch = min(DB_FETCH_SIZE, limit - returned + 1)
+            rows = conn.execute(text(
+                "SELECT id, timestamp, level, logger_name, message, pathname, lineno "
+                f"FROM logs {where} ORDER BY id DESC LIMIT {fetch}"
+            ), params).fetchall()
+            for row in rows:
+                if returned == limit:
+                    has_more = True
+                    break
+                returned += 1
+                last_id = row.id
+                timestamp = row.timestamp
+                yield {
+                    "id": row.id,
+                    "timestamp": timestamp.isoformat() if hasattr(timestamp, "isoformat") else timestamp,
+                    "level": row.level,
+                    "logger": row.logger_name,
+                    "message": row.message,
+                    "pathname": row.pathname,
+                    "lineno": row.lineno,
+                }
+            if has_more or len(rows) < fetch:
+                break
+    yield {"next_cursor": str(last_id) if has_more else None, "has_more": has_more}
+
+# --- Log files ---
+class LineIndex:
+    """
+    Sparse line-offset index for an append-only text file: the byte offset of every
+    STRIDE-th line. refresh() only scans bytes appended since the previous call, and
+    the index is rebuilt if the file shrank or was replaced (e.g. rotated).
+    """
+
+    STRIDE = 1000
+    READ_SIZE = 1024 * 1024
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.offsets = array("q", [0])  # offsets[i] = byte offset of line i * STRIDE
+        self.line_count = 0  # complete lines indexed so far
+        self.indexed_bytes = 0
+        self.inode = None
+
+    def refresh(self):
+        with self.lock:
+            stat = self.path.stat()
+            if stat.st_ino != self.inode or stat.st_size < self.indexed_bytes:
+                self._reset()
+                self.inode = stat.st_ino
+            if stat.st_size == self.indexed_bytes:
+                return
+            with open(self.path, "rb") as f:
+                f.seek(self.indexed_bytes)
+                position = self.indexed_bytes
+                while True:
+                    chunk = f.read(self.READ_SIZE)
+                    if not chunk:
+                        break
+                    start = 0
+                    while True:
+                        newline = chunk.find(b"\n", start)
+                        if newline < 0:
+                            break
+                        self.line_count += 1
+                        if self.line_count % self.STRIDE == 0:
+                            self.offsets.append(position + newline + 1)
+                        start = newline + 1
+                    if start:
+                        # Only complete lines count; a partial last line is picked up next time
+                        self.indexed_bytes = position + start
+                    position += len(chunk)
+
+    def locate(self, line_no: int):
+        """Returns (byte offset, line number at that offset) of the closest indexed line <= line_no."""
+        with self.lock:
+            slot = min(line_no // self.STRIDE, len(self.offsets) - 1)
+            return self.offsets[slot], slot * self.STRIDE
+
+_line_indexes = OrderedDict()
+_line_indexes_lock = threading.Lock()
+MAX_LINE_INDEXES = 64
+
+def get_line_index(path: Path) -> LineIndex:
+    """Returns the (refreshed) line index for `path`, keeping the most recently used ones."""
+    key = str(path)
+    with _line_indexes_lock:
+        index = _line_indexes.get(key)
+        if index is None:
+            index = LineIndex(path)
+            _line_indexes[key] = index
+        _line_indexes.move_to_end(key)
+        while len(_line_indexes) > MAX_LINE_INDEXES:
+            _line_indexes.popitem(last=False)
+    index.refresh()
+    return index
+
+def iter_file_lines(path: Path, start_line: int = 0):
+    """
+    Yields (line number, text) from `start_line` on, seeking via the line index.
+    Compressed (rotated) segments cannot seek cheaply and are read from the start.
+    """
+    if path.suffix == ".gz":
+        offset, line_no = 0, 0
+    else:
+        offset, line_no = get_line_index(path).locate(start_line)
+    with open_log_segment(path) as f:
+        f.seek(offset)
+        for raw in f:
+            if line_no >= start_line:
+                yield line_no, raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            line_no += 1
+
+def _parse_line_time(value: str):
+    try:
+        return datetime.strptime(value.replace(",", ".")[:26], "%Y-%m-%d %H:%M:%S.%f")
+    except ValueError:
+        try:
+            return datetime.strptime(value[:19], "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return None
+
+def search_log_file(path: Path, levels=None, logger_prefix=None, since=None, until=None, q=None,
+                    cursor=None, limit=DEFAULT_SEARCH_LIMIT):
+    """
+    Yields matching lines of a log file, oldest first, followed by a final
+    {"next_cursor", "has_more"} item. The cursor is the line number to resume from.
+    Lines in our log format are parsed for level/logger/time filters; other lines
+    (tracebacks, subprocess output) inherit the fields of the record they follow.
+    """
+    levels = {level.upper() for level in levels} if levels else None
+    needle = q.lower() if q else None
+    structured = bool(levels or logger_prefix or since or until)
+    current = {"timestamp": None, "level": None, "logger": None}
+    start_line = int(cursor) if cursor else 0
+    returned = 0
+    next_line = None
+
+    # Resuming mid-record: look back for the header line the first lines belong to
+    if structured and start_line:
+        for line_no, line in iter_file_lines(path, max(0, start_line - 200)):
+            if line_no >= start_line:
+                break
+            match = LOG_LINE_RE.match(line)
+            if match:
+                current = {"timestamp": match["timestamp"], "level": match["level"], "logger": match["logger"]}
+
+    for line_no, line in iter_file_lines(path, start_line):
+        match = LOG_LINE_RE.match(line)
+        if match:
+            current = {"timestamp": match["timestamp"], "level": match["level"], "logger": match["logger"]}
+        if levels and current["level"] not in levels:
+            continue
+        if logger_prefix and not (current["logger"] or "").startswith(logger_prefix):
+            continue
+        if since or until:
+            ts = _parse_line_time(current["timestamp"]) if current["timestamp"] else None
+            if ts is None or (since and ts < since) or (until and ts >= until):
+                continue
+        if needle and needle not in line.lower():
+            continue
+        if returned == limit:
+            next_line = line_no
+            break
+        returned += 1
+        item = {"line": line_no, "text": line}
+        if structured or match:
+            item.update(current)
+        yield item
+    yield {"next_cursor": str(next_line) if next_line is not None else None, "has_more": next_line is not None}
+
+def to_ndjson(items):
+    """Encodes an iterable of dicts as newline-delimited JSON, one chunk per item."""
+    for item in items:
+        yield json.dumps(item, ensure_ascii=False, default=str) + "\n"
@@ -1,111 +1,396 @@
+import abc
 import logging
 import datetime
-from .database import engine, db_type
+from .database import get_engine, db_type, db_config
 from sqlalchemy import text
 import sys
 import json
 import time
+import queue
+import threading
 
-class RedisLogHandler(logging.Handler):
-    def __init__(self, key="webdl:logs"):
+class _BatchingHandler(logging.Handler, metaclass=abc.ABCMeta):
+    """
+    Base for handlers that ship records to a remote store.
+    emit() only formats the record and puts it on a bounded queue; a daemon thread writes
+    batches of up to `batch_size` entries every `flush_interval` seconds via write_batch().
+    When the queue is full, records below WARNING are dropped, while WARNING and above
+    evict the oldest queued entry. Remaining entries are written on flush()/close().
+    """
+
+    _STOP = object()
+
+    def __init__(self, capacity=10000, batch_size=500, flush_interval=0.5):
         super().__init__()
-        self.key = key
-        from .redis_client import get_redis_client
-        self.redis = get_redis_client()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=capacity)
+        self._thread = threading.Thread(target=self._run, name=f"{type(self).__name__}-writer", daemon=True)
+        self._thread.start()
+
+    @abc.abstractmethod
+    def prepare(self, record) -> dict:
+        """Turns a record into the entry handed to write_batch(). Runs in the emitting thread."""
+
+    @abc.abstractmethod
+    def write_batch(self, entries: list):
+        """Writes a list of prepared entries. Runs in the writer thread."""
 
     def emit(self, record):
+        # Records logged while writing (e.g. by the DB driver) would feed back into the queue
+        if threading.current_thread() is self._thread:
+            return
+        try:
+            entry = self.prepare(record)
+            if entry is None:
+                return
+        except Exception:
+            self.handleError(record)
+            return
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                self.dropped += 1
+                return
+            try:
+                self._queue.get_nowait()
+                self.dropped += 1
+                self._queue.put_nowait(entry)
+            except (queue.Empty, queue.Full):
+                self.dropped += 1
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, waiters = [], []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+            if stop or waiters:
+                # Drain whatever is still queued before acknowledging
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is self._STOP:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        batch.append(item)
+            for start in range(0, len(batch), self.batch_size):
+                self._write(batch[start:start + self.batch_size])
+            for waiter in waiters:
+                waiter.set()
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            self.write_batch(batch)
+        except Exception as e:
+            sys.stderr.write(f"{type(self).__name__}: failed to write {len(batch)} log records: {e}\n")
+        if self.dropped:
+            sys.stderr.write(f"{type(self).__name__}: dropped {self.dropped} log records under back-pressure\n")
+            self.dropped = 0
+
+    def flush(self, timeout=5.0):
+        if not self._thread.is_alive() or threading.current_thread() is self._thread:
+            return
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def close(self):
+        if self._thread.is_alive():
+            try:
+                self._queue.put(self._STOP, timeout=5.0)
+            except queue.Full:
+                pass
+            self._thread.join(timeout=10.0)
+        super().close()
+
+class RedisLogHandler(_BatchingHandler):
+    """
+    Ships task log records to a Redis list. Batches are sent as one multi-value RPUSH
+    plus an LTRIM in a single pipeline, so the list never grows past `max_entries`.
+    """
+
+    def __init__(self, key="webdl:logs", max_entries=10000):
+        self.key = key
+        self.max_entries = max_entries
+        self.redis = None
+        super().__init__()
+
+    def prepare(self, record):
         # Only log records from the download tasks (app.tasks)
         if not record.name.startswith("app.tasks"):
-            return
+            return None
+        log_entry = {
+            "timestamp": datetime.datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": self.format(record),
+            "pathname": record.pathname,
+            "lineno": record.lineno
+        }
+        return json.dumps(log_entry)
 
+    def write_batch(self, entries):
         if not self.redis:
-            # Try to get client again in case it was initialized later
+            # (Re)connect here in the writer thread, never in the emitting one
             from .redis_client import get_redis_client
             self.redis = get_redis_client()
             if not self.redis:
                 return
-
         try:
-            log_entry = {
-                "timestamp": datetime.datetime.fromtimestamp(record.created).isoformat(),
-                "level": record.levelname,
-                "logger": record.name,
-                "message": self.format(record),
-                "pathname": record.pathname,
-                "lineno": record.lineno
-            }
-            # Use RPUSH to append to the list
-            self.redis.rpush(self.key, json.dumps(log_entry))
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.rpush(self.key, *entries)
+            pipe.ltrim(self.key, -self.max_entries, -1)
+            pipe.execute()
         except Exception:
-            # Fallback or ignore to prevent loop
-            pass
+            # Pick up a fresh client on the next batch
+            self.redis = None
+            raise
 
-class MySQLLogHandler(logging.Handler):
-    def emit(self, record):
-        # Safeguard against infinite recursion if DB logging fails
+# Hoisted so the statement is compiled once
+_INSERT_LOG = text("""
+    INSERT INTO logs (timestamp, level, logger_name, message, pathname, lineno)
+    VALUES (:timestamp, :level, :logger_name, :message, :pathname, :lineno)
+""")
+
+class MySQLLogHandler(_BatchingHandler):
+    """
+    Writes records to the 'logs' table with multi-row inserts from a background thread.
+    That thread is the table's only writer and keeps one dedicated connection, so on SQLite
+    inserts never contend with each other and each batch costs a single WAL commit.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._conn = None
+        super().__init__(*args, **kwargs)
+
+    def prepare(self, record):
+        return {
+            # Keep the time the record was created, not the time its batch was written
+            "timestamp": datetime.datetime.fromtimestamp(record.created),
+            "level": record.levelname,
+            "logger_name": record.name,
+            "message": self.format(record),
+            "pathname": record.pathname,
+            "lineno": record.lineno
+        }
+
+    def write_batch(self, entries):
         try:
-            with engine.connect() as conn:
-                # SQLAlchemy text() allows named parameters.
-                # Note: We rely on SQLAlchemy to handle parameter binding safely.
-                
-                stmt = text("""
-                    INSERT INTO logs (level, logger_name, message, pathname, lineno)
-                    VALUES (:level, :logger_name, :message, :pathname, :lineno)
-                """)
-                
-                conn.execute(stmt, {
-                    "level": record.levelname,
-                    "logger_name": record.name,
-                    "message": self.format(record),
-                    "pathname": record.pathname,
-                    "lineno": record.lineno
-                })
-                conn.commit()
+            if self._conn is None:
+                self._conn = get_engine().connect()
+            # executemany: the driver turns this into multi-row INSERTs
+            with self._conn.begin():
+                self._conn.execute(_INSERT_LOG, entries)
         except Exception as e:
+            self._close_connection()
             # If we can't log to DB, print to stderr to ensure visibility
             db_type_str = "MySQL" if db_type == 'mysql' else "SQLite" if db_type == 'sqlite' else "Unknown"
-            sys.stderr.write(f"Failed to log to {db_type_str}: {e}\n")
-            sys.stderr.write(f"Original log record: {self.format(record)}\n")
+            sys.stderr.write(f"Failed to log {len(entries)} records to {db_type_str}: {e}\n")
+            for entry in entries[:5]:
+                sys.stderr.write(f"Original log record: {entry['message']}\n")
+
+    def _close_connection(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
 
+    def close(self):
+        super().close()
+        self._close_connection()
+
+# --- Log retention ---
+# Defaults; each can be overridden with the matching WDM_LOG_* config key
+LOG_RETENTION_DAYS = 14
+MAX_LOG_ROWS = 1_000_000
 # Maximum log table size in MB
 MAX_LOG_TABLE_SIZE_MB = 500
 MAX_LOG_TABLE_SIZE_BYTES = MAX_LOG_TABLE_SIZE_MB * 1024 * 1024
 
-def cleanup_old_logs():
-    """Deletes the oldest 20% of logs from the database."""
+# Rows removed per DELETE statement; each batch is its own short transaction
+LOG_DELETE_BATCH_SIZE = 5000
+LOG_DELETE_PAUSE = 0.05
+# Daily partitions created ahead of time when MySQL partitioning is enabled
+LOG_PARTITION_DAYS_AHEAD = 3
+
+# Average log row size (bytes) behind the current size trim; reset once the table fits the budget
+_log_size_trim = {"row_bytes": None}
+
+def _get_int_config(key: str, default: int) -> int:
     try:
-        with engine.connect() as conn:
-            
-            result = conn.execute(text("SELECT COUNT(*) FROM logs"))
-            # fetchone() is universal.
-            total_rows = result.fetchone()[0]
-            
-            if total_rows == 0:
-                logging.info("No logs to clean up.")
-                return
+        return int(db_config.get_config(key) or default)
+    except (TypeError, ValueError):
+        return default
 
-            rows_to_delete = int(total_rows * 0.2)
-            
-            if rows_to_delete > 0:
-                if db_type == 'mysql':
-                    conn.execute(
-                        text("DELETE FROM logs ORDER BY timestamp ASC LIMIT :limit"),
-                        {"limit": rows_to_delete}
-                    )
-                elif db_type == 'sqlite':
-                    conn.execute(
-                        text("DELETE FROM logs WHERE id IN (SELECT id FROM logs ORDER BY timestamp ASC LIMIT :limit)"),
-                        {"limit": rows_to_delete}
-                    )
-                
-                conn.commit()
-                logging.info(f"Successfully cleaned up {rows_to_delete} oldest log entries.")
-            else:
-                logging.info("Not enough log entries to perform a cleanup.")
-                
+def _log_table_bytes(conn):
+    """Data + index size of the logs table, or None when the backend cannot tell."""
+    try:
+        if db_type == 'mysql':
+            return conn.execute(text(
+                "SELECT DATA_LENGTH + INDEX_LENGTH FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'logs'"
+            )).scalar()
+        if db_type == 'sqlite':
+            return conn.execute(text("SELECT SUM(pgsize) FROM dbstat WHERE name = 'logs' OR name LIKE 'ix_logs_%'")).scalar()
+    except Exception:
+        # dbstat is an optional SQLite extension
+        return None
+    return None
+
+def _delete_logs_up_to(conn, max_id: int) -> int:
+    """Deletes rows with id <= max_id in primary-key ranges of LOG_DELETE_BATCH_SIZE."""
+    lower = conn.execute(text("SELECT MIN(id) FROM logs")).scalar()
+    deleted = 0
+    while lower is not None and lower <= max_id:
+        upper = min(lower + LOG_DELETE_BATCH_SIZE, max_id + 1)
+        result = conn.execute(
+            text("DELETE FROM logs WHERE id >= :lower AND id < :upper"),
+            {"lower": lower, "upper": upper}
+        )
+        conn.commit()
+        deleted += result.rowcount or 0
+        lower = upper
+        # Give writers a chance to take the lock between batches
+        time.sleep(LOG_DELETE_PAUSE)
+    return deleted
+
+def _day_start(day: datetime.date) -> int:
+    return int(datetime.datetime.combine(day, datetime.time.min).timestamp())
+
+def _log_partitions(conn) -> dict:
+    """Maps partition name -> upper bound (unix time, None for MAXVALUE) of the logs table."""
+    rows = conn.execute(text(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'logs' AND PARTITION_NAME IS NOT NULL"
+    )).fetchall()
+    return {name: (None if desc == "MAXVALUE" else int(desc)) for name, desc in rows}
+
+def _partition_clause(days) -> str:
+    parts = [f"PARTITION p{day:%Y%m%d} VALUES LESS THAN ({_day_start(day + datetime.timedelta(days=1))})" for day in days]
+    parts.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return ", ".join(parts)
+
+def maintain_log_partitions(conn, retention_days: int) -> list:
+    """
+    MySQL only: keeps 'logs' range-partitioned by day on UNIX_TIMESTAMP(timestamp), creates
+    upcoming partitions and drops those past the retention window. Returns the dropped names.
+    """
+    today = datetime.date.today()
+    upcoming = [today + datetime.timedelta(days=i) for i in range(LOG_PARTITION_DAYS_AHEAD + 1)]
+    partitions = _log_partitions(conn)
+
+    if not partitions:
+        logging.info("Converting the logs table to daily partitions.")
+        # Every unique key of a partitioned table must include the partitioning column
+        conn.execute(text("ALTER TABLE logs DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp)"))
+        conn.execute(text(
+            "ALTER TABLE logs PARTITION BY RANGE (UNIX_TIMESTAMP(timestamp)) ("
+            f"PARTITION p_old VALUES LESS THAN ({_day_start(today)}), {_partition_clause(upcoming)})"
+        ))
+        conn.commit()
+        partitions = _log_partitions(conn)
+
+    missing = [day for day in upcoming if f"p{day:%Y%m%d}" not in partitions]
+    if missing and "pmax" in partitions:
+        newest = max((bound for bound in partitions.values() if bound is not None), default=0)
+        missing = [day for day in missing if _day_start(day) >= newest]
+        if missing:
+            conn.execute(text(f"ALTER TABLE logs REORGANIZE PARTITION pmax INTO ({_partition_clause(missing)})"))
+            conn.commit()
+
+    cutoff = _day_start(today - datetime.timedelta(days=retention_days))
+    expired = [name for name, bound in partitions.items() if bound is not None and bound <= cutoff]
+    if expired:
+        conn.execute(text(f"ALTER TABLE logs DROP PARTITION {', '.join(expired)}"))
+        conn.commit()
+    return expired
+
+def cleanup_old_logs() -> dict:
+    """
+    Enforces log retention: rows older than WDM_LOG_RETENTION_DAYS go first, then the oldest rows
+    until the table fits both WDM_LOG_MAX_ROWS and WDM_LOG_MAX_SIZE_MB. Deletes run in bounded
+    primary-key batches. With WDM_LOG_PARTITIONING=true on MySQL, expiry is a partition drop.
+    """
+    retention_days = _get_int_config("WDM_LOG_RETENTION_DAYS", LOG_RETENTION_DAYS)
+    max_rows = _get_int_config("WDM_LOG_MAX_ROWS", MAX_LOG_ROWS)
+    max_bytes = _get_int_config("WDM_LOG_MAX_SIZE_MB", MAX_LOG_TABLE_SIZE_MB) * 1024 * 1024
+    partitioning = str(db_config.get_config("WDM_LOG_PARTITIONING", "false")).lower() == "true"
+    stats = {"dropped_partitions": [], "deleted_by_age": 0, "deleted_by_size": 0}
+
+    try:
+        with get_engine().connect() as conn:
+            # 1. Age
+            if partitioning and db_type == 'mysql':
+                stats["dropped_partitions"] = maintain_log_partitions(conn, retention_days)
+            if retention_days > 0:
+                cutoff = datetime.datetime.now() - datetime.timedelta(days=retention_days)
+                # Uses the timestamp index; ids grow with time, so the rest is a primary-key range
+                max_id = conn.execute(
+                    text("SELECT MAX(id) FROM logs WHERE timestamp < :cutoff"), {"cutoff": cutoff}
+                ).scalar()
+                if max_id is not None:
+                    stats["deleted_by_age"] = _delete_logs_up_to(conn, max_id)
+
+            # 2. Row and byte budget
+            total_rows = conn.execute(text("SELECT COUNT(*) FROM logs")).scalar() or 0
+            keep_rows = min(total_rows, max_rows) if max_rows > 0 else total_rows
+            table_bytes = _log_table_bytes(conn)
+            if table_bytes and max_bytes > 0 and table_bytes > max_bytes and total_rows:
+                # The reported size does not shrink after DELETE (InnoDB keeps the pages, MySQL 8
+                # caches the statistics), so the budget becomes a row target from the average row
+                # size measured the first time the table went over it
+                if not _log_size_trim["row_bytes"]:
+                    _log_size_trim["row_bytes"] = table_bytes / total_rows
+                # Trim to 90% of the budget so the next run is not triggered immediately
+                keep_rows = min(keep_rows, int(max_bytes * 0.9 / _log_size_trim["row_bytes"]))
+            elif table_bytes:
+                _log_size_trim["row_bytes"] = None
+            if keep_rows < total_rows:
+                max_id = conn.execute(
+                    text("SELECT id FROM logs ORDER BY id DESC LIMIT 1 OFFSET :offset"), {"offset": keep_rows}
+                ).scalar()
+                if max_id is not None:
+                    stats["deleted_by_size"] = _delete_logs_up_to(conn, max_id)
+
+        if stats["dropped_partitions"] or stats["deleted_by_age"] or stats["deleted_by_size"]:
+            logging.info(
+                f"Log cleanup: dropped partitions {stats['dropped_partitions']}, "
+                f"deleted {stats['deleted_by_age']} expired and {stats['deleted_by_size']} over-budget entries."
+            )
+        else:
+            logging.info("No logs to clean up.")
     except Exception as e:
         sys.stderr.write(f"Error during log cleanup: {e}\n")
         logging.error(f"Error during log cleanup: {e}")
+    return stats
 
 def update_log_handlers():
     """Updates the root logger to include/exclude RedisLogHandler based on configuration."""
@@ -115,6 +400,7 @@ def update_log_handlers():
     for h in root_logger.handlers[:]:
         if isinstance(h, RedisLogHandler):
             root_logger.removeHandler(h)
+            h.close()
             
     # Check if Redis is available
     from .redis_client import get_redis_client
@@ -7,6 +7,8 @@ project_root = Path(__file__).resolve().parent.parent
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
+from .startup_profile import profiler
+
 import os
 import asyncio
 import logging
@@ -22,28 +24,50 @@ from fastapi import FastAPI, Request, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
+profiler.mark("import framework")
 
-from .database import init_db, User, db_config
-from . import redis_client  # Initialize Redis client
+# Heavy or optional clients (database engine, Redis, httpx, ptyprocess, updater) are created
+# or imported on first use, so importing the app stays cheap.
+from .database import init_db, User, db_config, db_tasks, dispose_async_engine
 from .logging_handler import MySQLLogHandler, cleanup_old_logs, update_log_handlers
+from .log_files import CompressingRotatingFileHandler
 from .utils import restore_gallery_dl_config, backup_gallery_dl_config
-from .config import BASE_DIR, APP_USERNAME, APP_PASSWORD, PROJECT_ROOT
+from .config import BASE_DIR, APP_USERNAME, APP_PASSWORD, PROJECT_ROOT, reset_tmp_dir
 from .auth import get_password_hash
 from .templating import templates
 from .i18n import get_lang
-from .tasks import unified_periodic_sync
+from .sync_scheduler import unified_periodic_sync
+from .proxy_pool import proxy_pool
+from . import gofile
+from . import kemono
+from .rclone_rc import rclone_daemon
 
 # Import routers
 from .routers import camouflage, main_ui, api, terminal
+profiler.mark("import app modules")
 
 # --- App Lifespan Management ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    profiler.mark("start server")
+
+    # Start from an empty tmp directory ("read and burn" for downloads)
+    await asyncio.to_thread(reset_tmp_dir)
+    profiler.mark("reset tmp dir")
+
     # Initialize database
     init_db()
+    profiler.mark("init database")
+
+    # Tasks of the previous process were killed with it and their logs were wiped above
+    interrupted = db_tasks.fail_interrupted_tasks("Interrupted by an application restart.")
+    if interrupted:
+        logging.warning(f"Marked {interrupted} unfinished task(s) from before the restart as failed.")
+    profiler.mark("fail interrupted tasks")
     
     # Restore gallery-dl config from rclone remote on startup
     await restore_gallery_dl_config()
+    profiler.mark("restore gallery-dl config")
     
     # Create changelog if it doesn't exist
     changelog_file = PROJECT_ROOT / "CHANGELOG.md"
@@ -64,28 +88,37 @@ async def lifespan(app: FastAPI):
     logs_dir.mkdir(exist_ok=True)
     
     # Add file handler for startup logs, regardless of DEBUG_MODE
-    file_handler = logging.FileHandler(logs_dir / "app.log", encoding="utf-8")
+    file_handler = CompressingRotatingFileHandler(logs_dir / "app.log", encoding="utf-8")
     file_handler.setLevel(logging.DEBUG)
     formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
     file_handler.setFormatter(formatter)
     logging.getLogger().addHandler(file_handler)
     logging.info("File logging configured for startup logs.")
     
-    # Configure Redis logging if available
+    # Ship log records to the 'logs' table; writes are batched off the request path
+    db_log_handler = MySQLLogHandler()
+    db_log_handler.setLevel(log_level)
+    db_log_handler.setFormatter(formatter)
+    logging.getLogger().addHandler(db_log_handler)
+    
+    # Connect to Redis (if configured) and add Redis logging
     update_log_handlers()
+    profiler.mark("configure logging")
 
     # Auto-create admin user from environment variables if no users exist
-    if APP_USERNAME and APP_PASSWORD and User.count_users() == 0:
+    if APP_USERNAME and APP_PASSWORD and not await User.ais_setup_complete():
         logging.info(f"Creating admin user '{APP_USERNAME}' from environment variables.")
         hashed_password = get_password_hash(APP_PASSWORD)
-        if User.create_user(username=APP_USERNAME, hashed_password=hashed_password, is_admin=True):
+        if await User.acreate_user(username=APP_USERNAME, hashed_password=hashed_password, is_admin=True):
             logging.info(f"Admin user '{APP_USERNAME}' created successfully.")
         else:
             logging.error(f"Failed to create admin user '{APP_USERNAME}'.")
+    profiler.mark("check admin user")
     
     # Start periodic background tasks
     cleanup_task = asyncio.create_task(periodic_log_cleanup())
     sync_task = asyncio.create_task(unified_periodic_sync())
+    profiler.finish(logs_dir / "startup_profile.json")
     
     yield
     
@@ -95,20 +128,31 @@ async def lifespan(app: FastAPI):
     
     cleanup_task.cancel()
     sync_task.cancel()
+    await proxy_pool.stop()
+    await gofile.close_client()
+    await kemono.close_clients()
+    await rclone_daemon.stop()
+    
+    await dispose_async_engine()
+    
+    # Write out any log records still queued
+    logging.getLogger().removeHandler(db_log_handler)
+    db_log_handler.close()
 
 async def periodic_log_cleanup():
     while True:
         await asyncio.sleep(3600)  # Run every hour
-        cleanup_old_logs()
+        # Batched deletes pause between batches; keep them off the event loop
+        await asyncio.to_thread(cleanup_old_logs)
 
 # --- Dependencies for Setup Checks ---
 async def check_setup_needed_camouflage(request: Request):
-    if User.count_users() == 0 and request.url.path not in ["/setup", "/static", "/", "/docs", "/openapi.json"]:
+    if not await User.ais_setup_complete() and request.url.path not in ["/setup", "/static", "/", "/docs", "/openapi.json"]:
         redirect_url = str(request.base_url.replace(path="/setup"))
         raise HTTPException(status_code=307, detail="Setup required", headers={"Location": redirect_url})
 
 async def check_setup_needed_main(request: Request):
-    if User.count_users() == 0:
+    if not await User.ais_setup_complete():
         return templates.TemplateResponse("service_unavailable.html", {"request": request, "lang": get_lang(request)}, status_code=503)
 
 # --- App Definitions ---
@@ -148,6 +192,7 @@ camouflage_app.include_router(camouflage.router, dependencies=[Depends(check_set
 main_app.include_router(main_ui.router)
 main_app.include_router(terminal.router)
 main_app.include_router(api.router, prefix="/api")
+profiler.mark("build apps")
 
 
 # --- Main Execution Block ---
@@ -170,11 +215,10 @@ def run_camouflage_app():
         },
         "handlers": {
             "file": {
-                "class": "logging.FileHandler",
+                "()": CompressingRotatingFileHandler,
                 "formatter": "default",
                 "level": "DEBUG",
                 "filename": str(logs_dir / "camouflage.log"),
-                "mode": "a",
                 "encoding": "utf-8",
             }
         },
@@ -216,11 +260,10 @@ def run_main_app():
         },
         "handlers": {
             "file": {
-                "class": "logging.FileHandler",
+                "()": CompressingRotatingFileHandler,
                 "formatter": "default",
                 "level": "DEBUG",
                 "filename": str(logs_dir / "main.log"),
-                "mode": "a",
                 "encoding": "utf-8",
             }
         },
@@ -298,6 +341,7 @@ def main():
         print("--- RUNNING IN FOREGROUND DEBUG MODE ---")
         # Run both apps even in debug mode to test API endpoints
         init_db()
+        profiler.mark("init database")
         
         if tunnel_token := db_config.get_config("TUNNEL_TOKEN"):
             os.environ.setdefault("TUNNEL_TOKEN", tunnel_token)
@@ -323,6 +367,7 @@ def main():
             sys.exit(0)
     else:
         init_db()
+        profiler.mark("init database")
     
         if tunnel_token := db_config.get_config("TUNNEL_TOKEN"):
             os.environ.setdefault("TUNNEL_TOKEN", tunnel_token)
@@ -0,0 +1,347 @@
+import json
+import math
+import time
+import random
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROXY_LIST_URL = "https://raw.githubusercontent.com/TheSpeedX/PROXY-List/master/http.txt"
+PROBE_URL = "https://www.google.com"
+# Seconds between background refreshes of the list and the scores
+REFRESH_INTERVAL = 1800
+# Probes in flight at once; they all share one connection pool
+PROBE_CONCURRENCY = 100
+PROBE_TIMEOUT = 5
+# Unknown proxies probed per refresh (known ones are always re-probed)
+PROBE_BATCH_SIZE = 1000
+# Longest a job waits for a working proxy when the pool has nothing to offer
+GET_PROXY_TIMEOUT = 60
+# Proxies that failed this many times in a row are forgotten
+MAX_CONSECUTIVE_FAILURES = 3
+REDIS_KEY = "wdm:proxy_pool"
+
+class ProxyStats:
+    """Health record of one proxy; latency and throughput are moving averages."""
+
+    ALPHA = 0.3
+
+    def __init__(self, successes=0, failures=0, consecutive_failures=0, latency=None,
+                 throughput=None, last_checked=0.0, in_use=0):
+        self.successes = successes
+        self.failures = failures
+        self.consecutive_failures = consecutive_failures
+        self.latency = latency  # seconds
+        self.throughput = throughput  # bytes/s
+        self.last_checked = last_checked
+        # Leases handed out to running jobs (not persisted)
+        self.in_use = in_use
+
+    def record(self, ok: bool, latency: Optional[float] = None, size: Optional[int] = None):
+        self.last_checked = time.time()
+        if not ok:
+            self.failures += 1
+            self.consecutive_failures += 1
+            return
+        self.successes += 1
+        self.consecutive_failures = 0
+        if latency is not None:
+            self.latency = latency if self.latency is None else self.latency + self.ALPHA * (latency - self.latency)
+            if size:
+                rate = size / max(latency, 1e-3)
+                self.throughput = rate if self.throughput is None else self.throughput + self.ALPHA * (rate - self.throughput)
+
+    @property
+    def success_rate(self) -> float:
+        # Smoothed so one lucky probe does not outrank a long track record
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    @property
+    def healthy(self) -> bool:
+        return self.successes > 0 and self.consecutive_failures == 0
+
+    @property
+    def score(self) -> float:
+        """Higher is better: reliable first, then fast to answer, then fast to transfer."""
+        if not self.healthy:
+            return 0.0
+        latency = self.latency if self.latency is not None else PROBE_TIMEOUT
+        throughput_bonus = 1 + math.log10(1 + (self.throughput or 0) / 100_000)
+        return self.success_rate ** 2 / (0.2 + latency) * throughput_bonus
+
+    def to_dict(self) -> dict:
+        return {
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "latency": self.latency,
+            "throughput": self.throughput,
+            "last_checked": self.last_checked,
+        }
+
+class ProxyPool:
+    """
+    Long-lived pool of public HTTP proxies. The list is refreshed and probed in the
+    background, and scores are kept in memory (and in Redis when available, so they
+    survive restarts), letting jobs take the best known proxy without waiting.
+    """
+
+    def __init__(self):
+        self.stats: Dict[str, ProxyStats] = {}
+        self.candidates: List[str] = []
+        self.last_refresh = 0.0
+        self._refresh_task = None
+        self._background_task = None
+        # Set whenever a probe succeeds during the current round
+        self._found = asyncio.Event()
+        self._loaded = False
+
+    # --- Scores ---
+    def best(self, exclude: Iterable[str] = (), spread: bool = False) -> Optional[str]:
+        """
+        Returns the best healthy proxy. With `spread`, proxies leased to fewer running jobs
+        come first, so concurrent jobs end up on different IPs.
+        """
+        exclude = set(exclude)
+        ranked = [(stats.in_use if spread else 0, -stats.score, proxy) for proxy, stats in self.stats.items()
+                  if proxy not in exclude and stats.healthy]
+        return min(ranked)[2] if ranked else None
+
+    def report(self, proxy: str, ok: bool, latency: Optional[float] = None, size: Optional[int] = None):
+        """Feeds the outcome of real traffic through `proxy` back into its score (saved on the next refresh)."""
+        self.stats.setdefault(proxy, ProxyStats()).record(ok, latency, size)
+
+    def acquire(self, proxy: str):
+        self.stats.setdefault(proxy, ProxyStats()).in_use += 1
+
+    def release(self, proxy: str):
+        stats = self.stats.get(proxy)
+        if stats and stats.in_use:
+            stats.in_use -= 1
+
+    def summary(self) -> dict:
+        ranked = sorted(self.stats.items(), key=lambda item: item[1].score, reverse=True)
+        return {
+            "known": len(self.stats),
+            "healthy": sum(1 for _, stats in ranked if stats.healthy),
+            "candidates": len(self.candidates),
+            "last_refresh": self.last_refresh,
+            "refreshing": self._refresh_task is not None and not self._refresh_task.done(),
+            "top": [dict(stats.to_dict(), proxy=proxy, score=round(stats.score, 4), in_use=stats.in_use)
+                    for proxy, stats in ranked[:20]],
+        }
+
+    # --- Redis persistence ---
+    def _redis(self):
+        from .redis_client import get_redis_client
+        return get_redis_client()
+
+    def _load(self):
+        client = self._redis()
+        if not client:
+            return
+        try:
+            for proxy, raw in client.hgetall(REDIS_KEY).items():
+                self.stats.setdefault(proxy, ProxyStats(**json.loads(raw)))
+            logger.info(f"Loaded {len(self.stats)} proxy scores from Redis.")
+        except Exception as e:
+            logger.error(f"Failed to load proxy scores from Redis: {e}")
+
+    def _save(self, stats: Dict[str, ProxyStats]):
+        client = self._redis()
+        if not client or not stats:
+            return
+        try:
+            client.hset(REDIS_KEY, mapping={proxy: json.dumps(s.to_dict()) for proxy, s in stats.items()})
+        except Exception as e:
+            logger.error(f"Failed to save proxy scores to Redis: {e}")
+
+    def _forget(self, *proxies: str):
+        client = self._redis()
+        if not client or not proxies:
+            return
+        try:
+            client.hdel(REDIS_KEY, *proxies)
+        except Exception as e:
+            logger.error(f"Failed to remove proxy scores from Redis: {e}")
+
+    # --- Probing ---
+    async def _fetch_list(self, session) -> List[str]:
+        async with session.get(PROXY_LIST_URL) as response:
+            response.raise_for_status()
+            text = await response.text()
+        return [line.strip() for line in text.splitlines() if line.strip()]
+
+    async def _probe(self, session, proxy: str) -> bool:
+        import aiohttp
+        started = time.monotonic()
+        try:
+            async with session.get(PROBE_URL, proxy=f"http://{proxy}",
+                                   timeout=aiohttp.ClientTimeout(total=PROBE_TIMEOUT)) as response:
+                response.raise_for_status()
+                size = len(await response.read())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.stats.setdefault(proxy, ProxyStats()).record(False)
+            return False
+        self.stats.setdefault(proxy, ProxyStats()).record(True, time.monotonic() - started, size)
+        self._found.set()
+        return True
+
+    async def refresh(self):
+        """Re-downloads the proxy list and probes known proxies plus a random batch of new ones."""
+        import aiohttp
+        if not self._loaded:
+            self._loaded = True
+            await asyncio.to_thread(self._load)
+
+        connector = aiohttp.TCPConnector(limit=PROBE_CONCURRENCY)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            try:
+                self.candidates = await self._fetch_list(session)
+            except Exception as e:
+                logger.error(f"Failed to fetch proxy list: {e}")
+
+            known = list(self.stats)
+            fresh = [proxy for proxy in self.candidates if proxy not in self.stats]
+            batch = known + random.sample(fresh, min(len(fresh), PROBE_BATCH_SIZE))
+            semaphore = asyncio.Semaphore(PROBE_CONCURRENCY)
+
+            async def probe(proxy):
+                async with semaphore:
+                    await self._probe(session, proxy)
+
+            tasks = [asyncio.create_task(probe(proxy)) for proxy in batch]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        dead = [proxy for proxy, stats in self.stats.items()
+                if stats.consecutive_failures >= MAX_CONSECUTIVE_FAILURES or (not stats.successes and not stats.in_use)]
+        for proxy in dead:
+            del self.stats[proxy]
+        self.last_refresh = time.time()
+        healthy = {proxy: stats for proxy, stats in self.stats.items() if stats.healthy}
+        await asyncio.to_thread(self._forget, *dead)
+        await asyncio.to_thread(self._save, healthy)
+        logger.info(f"Proxy pool refreshed: {len(healthy)} healthy of {len(batch)} probed.")
+
+    def _start_refresh(self) -> asyncio.Task:
+        # Concurrent callers share one probing round
+        if self._refresh_task is None or self._refresh_task.done():
+            self._found = asyncio.Event()
+            self._refresh_task = asyncio.create_task(self.refresh())
+        return self._refresh_task
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self._start_refresh()
+            except Exception as e:
+                logger.error(f"Proxy pool refresh failed: {e}")
+            await asyncio.sleep(REFRESH_INTERVAL)
+
+    def start(self):
+        """Starts the background refresh loop (idempotent)."""
+        if self._background_task is None or self._background_task.done():
+            self._background_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        for task in (self._background_task, self._refresh_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._background_task = self._refresh_task = None
+
+    async def get_proxy(self, status_file: Optional[Path] = None, exclude: Iterable[str] = (),
+                        spread: bool = False) -> Optional[str]:
+        """
+        Returns the best healthy proxy, or None if none could be found. Only when the pool
+        has nothing to offer does the caller wait, for at most GET_PROXY_TIMEOUT seconds.
+        """
+        # The pool is only kept warm once something actually asks for proxies
+        self.start()
+        if not self._loaded:
+            self._loaded = True
+            await asyncio.to_thread(self._load)
+        proxy = self.best(exclude, spread)
+        if proxy is None:
+            _status(status_file, "No known working proxy, probing the proxy list...")
+            # Wait for the first proxy that answers (or the end of the round), not the whole round
+            refresh_task = self._start_refresh()
+            waiter = asyncio.create_task(self._found.wait())
+            try:
+                await asyncio.wait({refresh_task, waiter}, timeout=GET_PROXY_TIMEOUT,
+                                   return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            proxy = self.best(exclude, spread)
+        if proxy:
+            stats = self.stats[proxy]
+            latency = f"{stats.latency:.2f}s" if stats.latency is not None else "n/a"
+            _status(status_file, f"Using proxy {proxy} (score {stats.score:.3f}, latency {latency}).")
+        else:
+            _status(status_file, "No working proxy found.")
+        return proxy
+
+class ProxyLease:
+    """
+    A job's hold on a pool proxy. rotate() reports the current proxy as failed and
+    switches to the next best one the job has not tried yet.
+    """
+
+    def __init__(self, pool: ProxyPool, status_file: Optional[Path] = None, spread: bool = False):
+        self.pool = pool
+        self.status_file = status_file
+        self.spread = spread
+        self.proxy = None
+        self.tried = set()
+        self._started = None
+
+    async def acquire(self) -> Optional[str]:
+        self.release()
+        self.proxy = await self.pool.get_proxy(self.status_file, exclude=self.tried, spread=self.spread)
+        if self.proxy:
+            # Taken before the next await so concurrent jobs see the lease
+            self.tried.add(self.proxy)
+            self.pool.acquire(self.proxy)
+            self._started = time.monotonic()
+        return self.proxy
+
+    async def rotate(self) -> Optional[str]:
+        if self.proxy:
+            self.pool.report(self.proxy, False)
+            _status(self.status_file, f"Proxy {self.proxy} failed, switching to another one...")
+        proxy = await self.acquire()
+        if proxy is None and self.tried:
+            # Every known proxy was tried once; start over with the best of them
+            self.tried.clear()
+            proxy = await self.acquire()
+        return proxy
+
+    def succeeded(self, size: Optional[int] = None):
+        """Credits the current proxy with a completed run (and its transfer rate, if `size` is known)."""
+        if self.proxy:
+            self.pool.report(self.proxy, True, time.monotonic() - self._started if size else None, size)
+
+    def release(self):
+        if self.proxy:
+            self.pool.release(self.proxy)
+            self.proxy = None
+
+def _status(status_file: Optional[Path], message: str):
+    if status_file:
+        with open(status_file, "a") as f:
+            f.write(message + "\n")
+
+proxy_pool = ProxyPool()
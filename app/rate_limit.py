@@ -0,0 +1,170 @@
+import re
+import time
+import asyncio
+import logging
+import weakref
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Requests per second a host starts at, and the bounds the AIMD control keeps it in
+INITIAL_REQUEST_RATE = 8.0
+MIN_REQUEST_RATE = 0.5
+MAX_REQUEST_RATE = 50.0
+# Requests in flight against one host (shared by every job), same idea
+INITIAL_CONCURRENCY = 4
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 16
+# Multiplicative decrease on a throttling answer, and how long the host is left alone
+DECREASE_FACTOR = 0.5
+THROTTLE_COOLDOWN = 10
+# Throttling answers closer together than this count as one signal, so a burst of 429s
+# from requests already in flight halves the limits once instead of collapsing them
+DECREASE_INTERVAL = 2.0
+THROTTLE_STATUSES = {403, 429, 503}
+RATE_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)\s*([KMG]?)I?B?$")
+RATE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+def parse_rate(value) -> Optional[int]:
+    """
+    Parses a speed limit like "500K", "2M", "1.5G" or a plain number of bytes into bytes/s,
+    the way gallery-dl and rclone read them. Returns None for an empty or invalid limit.
+    """
+    if value is None:
+        return None
+    match = RATE_PATTERN.match(str(value).strip().upper())
+    if not match:
+        return None
+    rate = int(float(match.group(1)) * RATE_UNITS[match.group(2)])
+    return rate or None
+
+class TokenBucket:
+    """
+    Lets `rate` units per second through with bursts of up to `burst`. Callers reserve their
+    tokens up front and sleep off the debt, so waiters are served in order without a lock.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        self._refill()
+        self.tokens -= amount
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+class HostLimiter:
+    """
+    Request rate (token bucket) and concurrency limit for one host, shared by every job of
+    the event loop. Both follow AIMD: each successful request raises them a little, a 429,
+    403 or 503 halves them and pauses the host for Retry-After or THROTTLE_COOLDOWN.
+    """
+
+    def __init__(self, host: str):
+        self.host = host
+        self.bucket = TokenBucket(INITIAL_REQUEST_RATE)
+        self.concurrency = float(INITIAL_CONCURRENCY)
+        self.active = 0
+        self.waiting = 0
+        self.paused_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.last_decrease = 0.0
+        self._changed = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Waits for a free slot and a request token, then yields a callable the caller passes
+        the response status (and Retry-After) to. A request that raises without reporting
+        a status counts as an error and leaves the limits alone.
+        """
+        outcome = {}
+
+        def report(status: int, retry_after: Optional[str] = None):
+            outcome.update(status=status, retry_after=retry_after)
+
+        async with self._changed:
+            self.waiting += 1
+            try:
+                await self._changed.wait_for(lambda: self.active < int(self.concurrency))
+            finally:
+                self.waiting -= 1
+            self.active += 1
+        try:
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self.bucket.acquire()
+            yield report
+        finally:
+            self._record(outcome.get("status"), outcome.get("retry_after"))
+            async with self._changed:
+                self.active -= 1
+                self._changed.notify_all()
+
+    def _record(self, status: Optional[int], retry_after: Optional[str]):
+        self.requests += 1
+        if status is None:
+            self.errors += 1
+        elif status in THROTTLE_STATUSES:
+            self.throttled += 1
+            self._decrease(int(retry_after) if retry_after and retry_after.isdigit() else THROTTLE_COOLDOWN)
+        elif status < 400:
+            # Additive increase: about one more slot per window of successful requests
+            self.concurrency = min(MAX_CONCURRENCY, self.concurrency + 1 / self.concurrency)
+            self.bucket.rate = min(MAX_REQUEST_RATE, self.bucket.rate + 1 / self.bucket.rate)
+            self.bucket.burst = max(1.0, self.bucket.rate)
+
+    def _decrease(self, cooldown: int):
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + cooldown)
+        if now - self.last_decrease < DECREASE_INTERVAL:
+            return
+        self.last_decrease = now
+        self.concurrency = max(MIN_CONCURRENCY, self.concurrency * DECREASE_FACTOR)
+        self.bucket.rate = max(MIN_REQUEST_RATE, self.bucket.rate * DECREASE_FACTOR)
+        self.bucket.burst = max(1.0, self.bucket.rate)
+        logger.warning(f"[RateLimit] {self.host} is throttling; backing off to {int(self.concurrency)} "
+                       f"connection(s) and {self.bucket.rate:.1f} request(s)/s for {cooldown}s.")
+
+    def to_dict(self) -> dict:
+        return {
+            "host": self.host,
+            "concurrency": int(self.concurrency),
+            "request_rate": round(self.bucket.rate, 2),
+            "active": self.active,
+            "waiting": self.waiting,
+            "paused_for": max(0, round(self.paused_until - time.monotonic(), 1)),
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "errors": self.errors,
+        }
+
+# Event loop -> {host: HostLimiter}
+_limiters = weakref.WeakKeyDictionary()
+
+def host_limiter(url: str) -> HostLimiter:
+    """Returns the limiter shared by every request to the host of `url` on the running event loop."""
+    host = urlparse(url).hostname or url
+    limiters = _limiters.setdefault(asyncio.get_running_loop(), {})
+    limiter = limiters.get(host)
+    if limiter is None:
+        limiter = limiters[host] = HostLimiter(host)
+    return limiter
+
+def summary() -> Dict[str, list]:
+    """Limits and counters of every host seen so far, busiest first."""
+    hosts = [limiter.to_dict() for limiters in list(_limiters.values()) for limiter in list(limiters.values())]
+    return {"hosts": sorted(hosts, key=lambda host: host["requests"], reverse=True)}
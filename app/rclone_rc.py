@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import hashlib
+import logging
+import secrets
+import weakref
+import subprocess
+import configparser
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from .config import TMP_DIR, PROJECT_ROOT
+from .utils import format_size
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a freshly started daemon to answer
+START_TIMEOUT = 15
+# Seconds between job/status + core/stats polls of a running transfer
+POLL_INTERVAL = 1.0
+# Seconds between progress lines written to the task log
+LOG_INTERVAL = 5.0
+# Whole-transfer attempts, like `--retries` of the command line
+JOB_RETRIES = 3
+RETRY_DELAYS = [5, 10, 15]
+# Global options of a transfer profile, as named in the rc `_config` parameter;
+# the other profile fields are backend options of the destination remote
+RC_CONFIG_NAMES = {
+    "transfers": "Transfers",
+    "checkers": "Checkers",
+    "multi_thread_streams": "MultiThreadStreams",
+    "buffer_size": "BufferSize",
+}
+
+class RcloneRCError(Exception):
+    """An rc call or transfer job failed."""
+    pass
+
+class RcloneRCUnavailable(RcloneRCError):
+    """The daemon is not running or cannot be reached; callers fall back to the rclone CLI."""
+    pass
+
+def _log(log_file: Optional[Path], message: str):
+    if log_file:
+        with open(log_file, "a", encoding="utf-8") as f:
+            f.write(message + "\n")
+    else:
+        logger.info(message)
+
+class RcloneDaemon:
+    """
+    One long-lived `rclone rcd` that transfers are submitted to over its remote control API.
+    Remotes are created once in the daemon's own config (config/create) and reused by name,
+    so a transfer costs an HTTP call instead of a process start, and backend connections and
+    logins survive between transfers. The daemon is started on first use.
+    """
+
+    def __init__(self):
+        self.process = None
+        self.url = None
+        self.auth = None
+        self.config_path = TMP_DIR / "rclone" / "rclone.conf"
+        # Remote name -> fingerprint of the options it was created with
+        self._remotes: Dict[str, str] = {}
+        self._imported_config = None
+        self._clients = weakref.WeakKeyDictionary()
+        self._locks = weakref.WeakKeyDictionary()
+        self._failed_at = 0.0
+
+    # --- Process management ---
+    def _lock(self) -> asyncio.Lock:
+        return self._locks.setdefault(asyncio.get_running_loop(), asyncio.Lock())
+
+    def _client(self):
+        import httpx
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            # Transfers run as async jobs, so every call returns quickly
+            client = httpx.AsyncClient(auth=self.auth, timeout=httpx.Timeout(60, connect=5))
+            self._clients[loop] = client
+        return client
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    async def ensure_started(self) -> bool:
+        """Starts the daemon if needed; returns False when rclone is unavailable."""
+        if self.running:
+            return True
+        async with self._lock():
+            if self.running:
+                return True
+            # Do not retry a broken installation on every transfer
+            if time.time() - self._failed_at < 300:
+                return False
+            try:
+                await self._start()
+                return True
+            except Exception as e:
+                self._failed_at = time.time()
+                logger.error(f"Failed to start rclone rc daemon, using the rclone command line instead: {e}")
+                self._terminate()
+                return False
+
+    async def _start(self):
+        self.config_path.parent.mkdir(parents=True, exist_ok=True)
+        os.chmod(self.config_path.parent, 0o700)
+        self.config_path.touch(mode=0o600, exist_ok=True)
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        user, password = "wdm", secrets.token_urlsafe(24)
+        logs_dir = PROJECT_ROOT / "logs"
+        logs_dir.mkdir(exist_ok=True)
+        self.process = subprocess.Popen(
+            [
+                "rclone", "rcd",
+                "--rc-addr", f"127.0.0.1:{port}",
+                "--rc-user", user, "--rc-pass", password,
+                "--config", str(self.config_path),
+                "--log-level", "INFO", "--log-file", str(logs_dir / "rclone.log"),
+            ],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self.url = f"http://127.0.0.1:{port}"
+        self.auth = (user, password)
+        self._remotes.clear()
+        self._imported_config = None
+        for client in list(self._clients.values()):
+            await client.aclose()
+        self._clients.clear()
+
+        deadline = time.monotonic() + START_TIMEOUT
+        while True:
+            if not self.running:
+                raise RcloneRCError(f"rclone rcd exited with code {self.process.returncode}")
+            try:
+                await self.call("rc/noop")
+                break
+            except RcloneRCUnavailable:
+                if time.monotonic() > deadline:
+                    raise RcloneRCError("rclone rcd did not answer in time")
+                await asyncio.sleep(0.2)
+        logger.info(f"rclone rc daemon started on port {port}.")
+
+    def _terminate(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    async def stop(self):
+        """Stops the daemon (running transfers are aborted)."""
+        if self.running:
+            try:
+                await self.call("core/quit")
+                await asyncio.to_thread(self.process.wait, 5)
+            except Exception:
+                pass
+        self._terminate()
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    # --- API ---
+    async def call(self, command: str, **params) -> dict:
+        import httpx
+        if self.url is None:
+            raise RcloneRCUnavailable("rclone rc daemon is not running")
+        try:
+            response = await self._client().post(f"{self.url}/{command}", json=params)
+        except httpx.TransportError as e:
+            raise RcloneRCUnavailable(f"rclone rc daemon unreachable: {e}")
+        try:
+            result = response.json()
+        except ValueError:
+            result = {"error": response.text}
+        if response.status_code != 200:
+            raise RcloneRCError(f"{command} failed: {result.get('error', response.status_code)}")
+        return result
+
+    async def ensure_remote(self, prefix: str, options: dict) -> str:
+        """
+        Returns the name of a daemon remote with these options ({"type": ..., <backend options>}),
+        creating it on first use. Plain-text passwords are obscured by rclone itself.
+        """
+        fingerprint = hashlib.sha256(json.dumps(options, sort_keys=True).encode()).hexdigest()
+        name = f"wdm_{prefix}_{fingerprint[:12]}"
+        if self._remotes.get(name) != fingerprint:
+            parameters = {key: value for key, value in options.items() if key != "type"}
+            await self.call("config/create", name=name, type=options["type"], parameters=parameters,
+                            opt={"obscure": True, "nonInteractive": True})
+            self._remotes[name] = fingerprint
+        return name
+
+    async def import_config(self, config_text: str):
+        """Loads the remotes of an rclone config file (passwords already obscured) into the daemon."""
+        if self._imported_config == config_text:
+            return
+        parser = configparser.ConfigParser(interpolation=None)
+        parser.read_string(config_text)
+        for section in parser.sections():
+            options = dict(parser.items(section))
+            remote_type = options.pop("type", None)
+            if not remote_type:
+                continue
+            await self.call("config/create", name=section, type=remote_type, parameters=options,
+                            opt={"noObscure": True, "nonInteractive": True})
+        self._imported_config = config_text
+
+    async def run_job(self, command: str, params: dict, log_file: Optional[Path] = None,
+                      progress_callback: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Submits `command` as an async rc job, polls its status and stats until it finishes
+        and returns the final stats. The job is retried as a whole up to JOB_RETRIES times.
+        """
+        last_error = None
+        for attempt in range(JOB_RETRIES):
+            _log(log_file, f"[Attempt {attempt + 1}/{JOB_RETRIES}] rclone rc {command} {json.dumps(params)}")
+            try:
+                stats = await self._run_job_once(command, params, log_file, progress_callback)
+                _log(log_file, "rclone transfer finished successfully. " + _describe_stats(stats))
+                return stats
+            except RcloneRCUnavailable:
+                raise
+            except RcloneRCError as e:
+                last_error = e
+                _log(log_file, f"rclone transfer failed: {e}")
+                if attempt < JOB_RETRIES - 1:
+                    _log(log_file, f"Waiting {RETRY_DELAYS[attempt]} seconds before retry...")
+                    await asyncio.sleep(RETRY_DELAYS[attempt])
+        raise last_error
+
+    async def _run_job_once(self, command, params, log_file, progress_callback) -> dict:
+        jobid = (await self.call(command, _async=True, **params))["jobid"]
+        group = f"job/{jobid}"
+        last_log = time.monotonic()
+        try:
+            while True:
+                status = await self.call("job/status", jobid=jobid)
+                stats = await self.call("core/stats", group=group)
+                if progress_callback:
+                    progress_callback(stats)
+                if status.get("finished"):
+                    if not status.get("success"):
+                        raise RcloneRCError(status.get("error") or "transfer failed")
+                    return stats
+                if time.monotonic() - last_log >= LOG_INTERVAL:
+                    last_log = time.monotonic()
+                    _log(log_file, "Progress: " + _describe_stats(stats))
+                await asyncio.sleep(POLL_INTERVAL)
+        except asyncio.CancelledError:
+            try:
+                await self.call("job/stop", jobid=jobid)
+            except Exception:
+                pass
+            raise
+        finally:
+            try:
+                await self.call("core/stats-delete", group=group)
+            except Exception:
+                pass
+
+    async def copy(self, source: Path, destination: str, log_file: Optional[Path] = None,
+                   progress_callback: Optional[Callable[[dict], None]] = None, profile: Optional[dict] = None,
+                   files_from: Optional[Path] = None) -> dict:
+        """
+        Copies a local directory into `destination` ("remote:path") with sync/copy, or a single
+        file to exactly `destination` with operations/copyfile. `profile` holds transfer settings
+        (see utils.rclone_transfer_profile) that apply to this transfer only. `files_from` lists
+        the paths (relative to `source`, one per line) to copy instead of the whole directory.
+        """
+        remote, _, path = destination.partition(":")
+        config = {}
+        extra = {}
+        if profile:
+            config.update({RC_CONFIG_NAMES[field]: value for field, value in profile.items() if field in RC_CONFIG_NAMES})
+            # Backend overrides go into the connection string, so the remote itself is reused
+            remote += "".join(f",{field}={value}" for field, value in profile.items() if field not in RC_CONFIG_NAMES)
+        if files_from:
+            extra["_filter"] = {"FilesFromRaw": [str(files_from)]}
+            # Only the listed files are checked; the destination is not listed
+            config["NoTraverse"] = True
+        if config:
+            extra["_config"] = config
+        source = Path(source)
+        if source.is_dir():
+            return await self.run_job("sync/copy", dict(srcFs=str(source), dstFs=f"{remote}:{path}", **extra),
+                                      log_file, progress_callback)
+        return await self.run_job("operations/copyfile", dict(
+            srcFs=str(source.parent), srcRemote=source.name, dstFs=f"{remote}:", dstRemote=path, **extra
+        ), log_file, progress_callback)
+
+def _describe_stats(stats: dict) -> str:
+    done, total = stats.get("bytes", 0), stats.get("totalBytes", 0)
+    percent = int(done / total * 100) if total else 100
+    return (f"{format_size(done)} / {format_size(total)}, {percent}%, {format_size(stats.get('speed', 0))}/s, "
+            f"files {stats.get('transfers', 0)}/{stats.get('totalTransfers', 0)}, errors {stats.get('errors', 0)}")
+
+rclone_daemon = RcloneDaemon()
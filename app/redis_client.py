@@ -1,22 +1,38 @@
-import redis
 import logging
 import os
+import threading
 from .database import db_config
 
 logger = logging.getLogger(__name__)
 
 redis_client = None
+# Redis is optional: the client (and the redis package) is only set up on first use
+_initialized = False
+# Set while init_redis runs; log records emitted while connecting may ask for the client again
+_initializing = False
+_init_lock = threading.RLock()
 
 def init_redis():
     """Initializes the Redis client. Priorities: DB config > Environment variable."""
+    global _initialized, _initializing
+    with _init_lock:
+        _initializing = True
+        try:
+            _connect()
+        finally:
+            _initializing = False
+        # Only now may get_redis_client() skip initialization
+        _initialized = True
+
+def _connect():
     global redis_client
-    
     # Try DB config first, then env var
     redis_url = db_config.get_config("REDIS_URL")
     if not redis_url:
         redis_url = os.getenv("REDIS_URL")
 
     if not redis_url:
+        db_config.stop_change_listener()
         if redis_client:
             logger.info("REDIS_URL cleared. Disabling Redis support.")
             try:
@@ -28,6 +44,12 @@ def init_redis():
             logger.debug("REDIS_URL not set. Redis support disabled.")
         return
 
+    try:
+        import redis
+    except ImportError:
+        logger.error("REDIS_URL is set but the redis package is not installed.")
+        return
+
     try:
         # If we already have a client, check if the URL changed. 
         # For simplicity, we just close and recreate.
@@ -48,19 +70,27 @@ def init_redis():
         # Test the connection
         redis_client.ping()
         logger.info("Successfully connected to Redis.")
+
+        # Get notified of settings saved by the other apps/processes
+        db_config.start_change_listener(redis_client)
     except redis.AuthenticationError:
         logger.error("Redis authentication failed. Check your password.")
+        db_config.stop_change_listener()
         redis_client = None
     except redis.ConnectionError as e:
         logger.error(f"Failed to connect to Redis: {e}")
+        db_config.stop_change_listener()
         redis_client = None
     except Exception as e:
         logger.error(f"Unexpected error initializing Redis: {e}")
+        db_config.stop_change_listener()
         redis_client = None
 
 def get_redis_client():
-    """Returns the initialized Redis client instance or None."""
+    """Returns the Redis client instance or None, connecting on the first call."""
+    if not _initialized:
+        with _init_lock:
+            # Other threads wait here; a reentrant call during initialization gets None
+            if not _initialized and not _initializing:
+                init_redis()
     return redis_client
-
-# Initialize on module load
-init_redis()
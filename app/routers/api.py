@@ -3,22 +3,26 @@ import re
 import uuid
 import json
 import signal
+import hashlib
 import asyncio
 import subprocess
-import httpx
 from pathlib import Path
+from datetime import datetime
 from typing import Optional
 from pydantic import BaseModel
 
-from fastapi import APIRouter, Request, Depends, Form, HTTPException, BackgroundTasks, Response
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi import APIRouter, Request, Depends, Form, HTTPException, BackgroundTasks, Response, Query
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 
-from .. import updater, status
+from .. import status, log_search, log_files, rate_limit
 from ..auth import get_current_user
-from ..database import User
+from ..database import User, db_tasks, db_sync, run_sync
 from ..config import BASE_DIR, STATUS_DIR, PROJECT_ROOT
+from ..startup_profile import profiler
+from ..proxy_pool import proxy_pool
+from ..sync_scheduler import sync_scheduler
 from ..tasks import process_download_job
-from ..utils import get_task_status_path, update_task_status, get_net_speed
+from ..utils import get_task_status, get_task_log_paths, update_task_status, get_net_speed
 
 
 router = APIRouter(
@@ -29,6 +33,7 @@ router = APIRouter(
 # --- App Management ---
 @router.post("/update")
 async def update_app(background_tasks: BackgroundTasks):
+    from .. import updater
     result = updater.run_update()
     if result.get("status") == "success" and result.get("updated"):
         background_tasks.add_task(updater.restart_application)
@@ -36,10 +41,31 @@ async def update_app(background_tasks: BackgroundTasks):
 
 @router.get("/version")
 async def get_version():
+    from .. import updater
     sha = updater.get_local_commit_sha()
     version = sha[:7] if sha else "N/A"
     return {"version": version}
 
+@router.get("/startup-profile")
+async def get_startup_profile():
+    return profiler.report()
+
+@router.get("/proxies")
+async def get_proxy_pool():
+    return proxy_pool.summary()
+
+@router.get("/rate-limits")
+async def get_rate_limits():
+    return rate_limit.summary()
+
+@router.get("/sync/tasks")
+async def get_sync_tasks():
+    return {"tasks": sync_scheduler.status()}
+
+@router.get("/sync/history")
+async def get_sync_history(task: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
+    return {"runs": await run_sync(db_sync.list_runs, task, limit)}
+
 # Cache for changelog to avoid frequent remote fetches
 changelog_cache = {"content": None, "last_fetch": 0}
 CHANGELOG_CACHE_TTL = 3600  # 1 hour
@@ -55,6 +81,7 @@ async def get_changelog():
     # Try fetching from GitHub
     remote_url = "https://raw.githubusercontent.com/Jyf0214/web-dl-manager/main/CHANGELOG.md"
     try:
+        import httpx
         async with httpx.AsyncClient(timeout=3.0) as client:
             response = await client.get(remote_url)
             if response.status_code == 200:
@@ -82,21 +109,25 @@ async def get_changelog():
 
 @router.get("/updates/check")
 async def check_updates():
+    from .. import updater
     result = updater.check_for_updates()
     return JSONResponse(content=result)
 
 @router.get("/updates/info")
 async def get_update_info():
+    from .. import updater
     result = updater.get_update_info()
     return JSONResponse(content=result)
 
 @router.post("/updates/dependencies")
 async def update_dependencies_api():
+    from .. import updater
     result = updater.update_dependencies()
     return JSONResponse(content=result)
 
 @router.post("/updates/pages")
 async def update_page_library_api():
+    from .. import updater
     result = updater.update_page_library()
     return JSONResponse(content=result)
 
@@ -150,7 +181,11 @@ async def create_download_job(
     
     for single_url in urls:
         task_id = str(uuid.uuid4())
-        update_task_status(task_id, {"id": task_id, "status": "queued", "original_params": dict(params), "created_by": current_user.username, "url": single_url})
+        log_path, upload_log_path = get_task_log_paths(task_id)
+        update_task_status(task_id, {
+            "id": task_id, "status": "queued", "original_params": dict(params), "created_by": current_user.username, "url": single_url,
+            "log_path": str(log_path), "upload_log_path": str(upload_log_path)
+        })
         
         asyncio.create_task(process_download_job(
             task_id=task_id, url=single_url, downloader=downloader, service=upload_service, upload_path=upload_path,
@@ -167,18 +202,20 @@ async def create_download_job(
 
 @router.post("/retry/{task_id}", response_class=RedirectResponse)
 async def retry_task(task_id: str, current_user: User = Depends(get_current_user)):
-    status_path = get_task_status_path(task_id)
-    if not status_path.exists():
+    task_data = get_task_status(task_id)
+    if not task_data:
         raise HTTPException(status_code=404, detail="Task to retry not found.")
-    with open(status_path, "r") as f:
-        task_data = json.load(f)
     
     original_params = task_data.get("original_params")
     if not original_params:
         raise HTTPException(status_code=400, detail="Cannot retry task: original parameters not found.")
 
     new_task_id = str(uuid.uuid4())
-    update_task_status(new_task_id, {"id": new_task_id, "status": "queued", "original_params": original_params, "retry_of": task_id, "created_by": current_user.username})
+    log_path, upload_log_path = get_task_log_paths(new_task_id)
+    update_task_status(new_task_id, {
+        "id": new_task_id, "status": "queued", "original_params": original_params, "retry_of": task_id, "created_by": current_user.username,
+        "log_path": str(log_path), "upload_log_path": str(upload_log_path)
+    })
     
     asyncio.create_task(process_download_job(
         task_id=new_task_id, url=original_params.get("url"), downloader=original_params.get("downloader"),
@@ -189,9 +226,8 @@ async def retry_task(task_id: str, current_user: User = Depends(get_current_user
 
 @router.post("/pause/{task_id}", response_class=RedirectResponse)
 async def pause_task(task_id: str):
-    status_path = get_task_status_path(task_id)
-    if not status_path.exists(): raise HTTPException(status_code=404, detail="Task not found.")
-    with open(status_path, "r") as f: task_data = json.load(f)
+    task_data = get_task_status(task_id)
+    if not task_data: raise HTTPException(status_code=404, detail="Task not found.")
     
     pgid = task_data.get("pgid")
     if not pgid: raise HTTPException(status_code=400, detail="Task is not running or cannot be paused.")
@@ -207,9 +243,8 @@ async def pause_task(task_id: str):
 
 @router.post("/resume/{task_id}", response_class=RedirectResponse)
 async def resume_task(task_id: str):
-    status_path = get_task_status_path(task_id)
-    if not status_path.exists(): raise HTTPException(status_code=404, detail="Task not found.")
-    with open(status_path, "r") as f: task_data = json.load(f)
+    task_data = get_task_status(task_id)
+    if not task_data: raise HTTPException(status_code=404, detail="Task not found.")
 
     pgid = task_data.get("pgid")
     if not pgid: raise HTTPException(status_code=400, detail="Task is not paused or cannot be resumed.")
@@ -225,15 +260,10 @@ async def resume_task(task_id: str):
 
 @router.post("/delete/{task_id}", response_class=RedirectResponse)
 async def delete_task(task_id: str):
-    status_path = get_task_status_path(task_id)
-    log_path = STATUS_DIR / f"{task_id}.log"
-    upload_log_path = STATUS_DIR / f"{task_id}_upload.log"
+    log_path, upload_log_path = get_task_log_paths(task_id)
     oauth_log_path = STATUS_DIR / f"oauth_{task_id}.log"
 
-    deleted = False
-    if status_path.exists():
-        status_path.unlink()
-        deleted = True
+    deleted = db_tasks.delete_task(task_id)
     if log_path.exists():
         log_path.unlink()
         deleted = True
@@ -251,16 +281,8 @@ async def delete_task(task_id: str):
 
 @router.get("/status/{task_id}/json")
 async def get_status_json(task_id: str):
-    status_path = get_task_status_path(task_id)
-    download_log_path = STATUS_DIR / f"{task_id}.log"
-    upload_log_path = STATUS_DIR / f"{task_id}_upload.log"
-    status_data = {}
-    if status_path.exists():
-        with open(status_path, "r") as f:
-            try:
-                status_data = json.load(f)
-            except json.JSONDecodeError:
-                status_data = {"status": "error", "error": "Invalid status file"}
+    download_log_path, upload_log_path = get_task_log_paths(task_id)
+    status_data = get_task_status(task_id) or {}
     
     download_log = ""
     if download_log_path.exists():
@@ -319,8 +341,8 @@ async def get_status_raw(task_id: str):
 async def cleanup_logs_api():
     from ..logging_handler import cleanup_old_logs
     try:
-        cleanup_old_logs()
-        return JSONResponse(content={"status": "success", "message": "Log cleanup completed."})
+        stats = await asyncio.to_thread(cleanup_old_logs)
+        return JSONResponse(content={"status": "success", "message": "Log cleanup completed.", "details": stats})
     except Exception as e:
         return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
 
@@ -353,12 +375,62 @@ def get_system_uptime():
     hours, minutes = divmod(remainder, 60)
     return f"{delta.days}d {days}h {minutes}m"
 
+TASK_LIST_MAX_LIMIT = 200
+
+def _parse_datetime_param(name: str, value: Optional[str]):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid '{name}' value, expected an ISO 8601 date/time.")
+
 @router.get("/status/all_tasks")
-async def get_all_tasks_json():
-    """Returns all tasks as a JSON list for the frontend."""
-    from ..status import get_all_tasks
-    tasks = get_all_tasks()
-    return JSONResponse(content=tasks)
+async def get_all_tasks_json(
+    request: Request,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    downloader: Optional[str] = None,
+    service: Optional[str] = None,
+    user: Optional[str] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    Returns a cursor-paginated page of tasks for the frontend.
+    `status` accepts a comma-separated list. `fields` selects the returned keys ("*" for everything);
+    by default the submitted form parameters are left out. Supports ETag / If-None-Match.
+    """
+    limit = min(max(1, limit), TASK_LIST_MAX_LIMIT)
+    if fields == "*":
+        selected_fields = None
+    elif fields:
+        selected_fields = [f.strip() for f in fields.split(",") if f.strip()]
+    else:
+        selected_fields = status.DEFAULT_TASK_LIST_FIELDS
+
+    # The ETag only depends on the task change counter and the query, so a client that is
+    # up to date gets its 304 without touching the database
+    etag = '"' + hashlib.sha1(f"{status.get_tasks_version()}?{request.url.query}".encode("utf-8")).hexdigest() + '"'
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers={"ETag": etag})
+
+    statuses = [s.strip() for s in status_filter.split(",") if s.strip()] if status_filter else None
+    try:
+        page = status.query_tasks(
+            limit=limit, cursor=cursor, fields=selected_fields,
+            status=statuses, downloader=downloader, upload_service=service, created_by=user,
+            created_after=_parse_datetime_param("created_after", created_after),
+            created_before=_parse_datetime_param("created_before", created_before),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    body = json.dumps(page, separators=(",", ":")).encode("utf-8")
+    return Response(content=body, media_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 @router.get("/server-status/json")
 async def get_server_status():
@@ -375,7 +447,7 @@ async def get_server_status():
         "system": {"uptime": get_system_uptime(), "platform": f"{platform.system()} {platform.release()}", "cpu_usage": psutil.cpu_percent(interval=1)},
         "memory": {"total": (mem := psutil.virtual_memory()).total, "used": mem.used, "percent": mem.percent},
         "disk": disk_info,
-        "application": {"active_tasks": status.get_active_tasks_count(), "versions": get_dependency_versions()}
+        "application": {"active_tasks": status.get_active_tasks(), "versions": get_dependency_versions()}
     })
 
 # --- Session Management ---
@@ -401,28 +473,24 @@ LOG_FILES = [
     "logs/startup2.log",
 ]
 
-def get_log_content(log_file: str) -> str:
-    """读取日志文件内容"""
-    try:
-        # 使用项目根目录路径
-        project_root = Path(__file__).resolve().parent.parent.parent
-        log_path = project_root / log_file
-        if log_path.exists():
-            return log_path.read_text(encoding='utf-8', errors='ignore')
-        else:
-            return f"Log file not found: {log_file}"
-    except Exception as e:
-        return f"Error reading log file {log_file}: {str(e)}"
-
-def get_all_logs() -> str:
-    """获取所有日志文件的内容"""
-    result = []
+def get_log_path(log_file: str, segment: Optional[str] = None) -> Optional[Path]:
+    """日志文件路径（segment 指定已轮转的分段，支持 .gz）"""
+    # 使用项目根目录路径
+    project_root = Path(__file__).resolve().parent.parent.parent
+    log_path = project_root / log_file
+    if segment:
+        return log_files.resolve_log_segment(log_path, segment)
+    return log_path
+
+def _list_rotated_segments() -> dict:
+    project_root = Path(__file__).resolve().parent.parent.parent
+    segments = {}
     for log_file in LOG_FILES:
-        content = get_log_content(log_file)
-        result.append(f"=== {log_file} ===")
-        result.append(content)
-        result.append("\n")
-    return "\n".join(result)
+        log_path = project_root / log_file
+        names = [path.name for path in log_files.list_log_segments(log_path) if path != log_path]
+        if names:
+            segments[log_file] = names
+    return segments
 
 @router.get("/logs/health")
 async def log_health_check():
@@ -435,14 +503,77 @@ async def log_info():
     return {
         "service": "Web-DL-Manager Log Viewer",
         "available_logs": LOG_FILES,
+        # Rotated (possibly gzipped) segments, readable via ?segment=<name>
+        "segments": _list_rotated_segments(),
         "endpoints": {
             "/api/logs/health": "Health check",
             "/api/logs/info": "This info",
+            "/api/logs/search": "Search the logs table, task logs or log files (NDJSON, paginated)",
             "/api/logs/all": "Get all logs (requires X-Log-Access-Key header)",
-            "/api/logs/{filename}": "Get specific log file (requires X-Log-Access-Key header)"
+            "/api/logs/{filename}": "Get specific log file (requires X-Log-Access-Key header; supports Range, ?segment=, ?follow=true)"
         }
     }
 
+def _resolve_log_source(source: str, task_id: Optional[str], upload: bool, filename: Optional[str],
+                        segment: Optional[str] = None) -> Path:
+    if source == "task":
+        if not task_id:
+            raise HTTPException(status_code=400, detail="'task_id' is required for task logs.")
+        task = get_task_status(task_id) or {}
+        log_path, upload_log_path = get_task_log_paths(task_id)
+        path = Path(task.get("upload_log_path") or upload_log_path) if upload else Path(task.get("log_path") or log_path)
+    elif source == "file":
+        # 安全验证：只允许访问预定义的日志文件
+        if filename not in LOG_FILES:
+            raise HTTPException(status_code=404, detail="Log file not found")
+        path = get_log_path(filename, segment)
+        if path is None:
+            raise HTTPException(status_code=404, detail="Log segment not found")
+    else:
+        raise HTTPException(status_code=400, detail="'source' must be one of: db, task, file.")
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Log file not found")
+    return path
+
+@router.get("/logs/search")
+async def search_logs_api(
+    source: str = "db",
+    task_id: Optional[str] = None,
+    upload: bool = False,
+    file: Optional[str] = None,
+    segment: Optional[str] = None,
+    level: Optional[str] = None,
+    logger: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    q: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = log_search.DEFAULT_SEARCH_LIMIT,
+):
+    """
+    Searches the 'logs' table (source=db), a task log (source=task) or an application log file
+    (source=file). Results are streamed as NDJSON; the last line carries next_cursor/has_more.
+    """
+    limit = max(1, min(limit, log_search.MAX_SEARCH_LIMIT))
+    if cursor and not cursor.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    filters = {
+        "levels": [item.strip() for item in level.split(",") if item.strip()] if level else None,
+        "logger_prefix": logger,
+        "since": _parse_datetime_param("since", since),
+        "until": _parse_datetime_param("until", until),
+        "q": q,
+        "cursor": cursor,
+        "limit": limit,
+    }
+    if source == "db":
+        results = log_search.search_db_logs(**filters)
+    else:
+        path = _resolve_log_source(source, task_id, upload, file, segment)
+        results = log_search.search_log_file(path, **filters)
+    # A sync generator: Starlette iterates it in the threadpool, off the event loop
+    return StreamingResponse(log_search.to_ndjson(results), media_type="application/x-ndjson")
+
 @router.get("/logs/all")
 async def get_all_logs_api(request: Request, access_key: str = None):
     """获取所有日志内容，需要认证"""
@@ -453,12 +584,13 @@ async def get_all_logs_api(request: Request, access_key: str = None):
     if access_key != LOG_ACCESS_KEY:
         raise HTTPException(status_code=403, detail="Invalid access key")
     
-    from fastapi.responses import PlainTextResponse
-    return PlainTextResponse(content=get_all_logs())
+    # 逐块流式输出，避免将所有日志读入内存
+    return log_files.concatenated_logs_response(request, [(log_file, get_log_path(log_file)) for log_file in LOG_FILES])
 
-@router.get("/logs/{filename}")
-async def get_log_file_api(filename: str, request: Request, access_key: str = None):
-    """获取特定日志文件内容，需要认证"""
+@router.get("/logs/{filename:path}")
+async def get_log_file_api(filename: str, request: Request, access_key: str = None, segment: Optional[str] = None,
+                           follow: bool = False):
+    """获取特定日志文件内容，需要认证。支持 Range 请求、gzip 传输和 follow=true 实时跟踪"""
     # 优先从URL参数获取密钥，如果没有则从请求头获取
     if access_key is None:
         access_key = request.headers.get("X-Log-Access-Key")
@@ -470,5 +602,7 @@ async def get_log_file_api(filename: str, request: Request, access_key: str = No
     if filename not in LOG_FILES:
         raise HTTPException(status_code=404, detail="Log file not found")
     
-    from fastapi.responses import PlainTextResponse
-    return PlainTextResponse(content=get_log_content(filename))
+    log_path = get_log_path(filename, segment)
+    if log_path is None:
+        raise HTTPException(status_code=404, detail="Log segment not found")
+    return log_files.log_file_response(request, log_path, follow=follow)
@@ -4,7 +4,7 @@ from pathlib import Path
 from fastapi import APIRouter, Request, Form, Response
 from fastapi.responses import HTMLResponse, RedirectResponse
 
-from ..database import User, db_config
+from ..database import User, db_config, run_sync
 from ..auth import get_password_hash, verify_password
 from ..i18n import get_lang
 from ..templating import templates
@@ -14,7 +14,7 @@ router = APIRouter()
 
 @router.get("/setup", response_class=HTMLResponse)
 async def get_setup_form(request: Request):
-    if User.count_users() > 0:
+    if await User.ais_setup_complete():
         return RedirectResponse(url="/login", status_code=302)
     lang = get_lang(request)
     return templates.TemplateResponse("setup.html", {"request": request, "lang": lang, "error": None})
@@ -34,7 +34,7 @@ async def post_setup_form(
     WDM_OPENLIST_PASS: str = Form(None)
 ):
     lang = get_lang(request)
-    if User.count_users() > 0:
+    if await User.ais_setup_complete():
         return RedirectResponse(url="/login", status_code=302)
     if password != confirm_password:
         return templates.TemplateResponse("setup.html", {"request": request, "lang": lang, "error": "Passwords do not match."})
@@ -42,14 +42,17 @@ async def post_setup_form(
         return templates.TemplateResponse("setup.html", {"request": request, "lang": lang, "error": "Username and password cannot be empty."})
     
     hashed_password = get_password_hash(password)
-    if User.create_user(username=username, hashed_password=hashed_password, is_admin=True):
+    if await User.acreate_user(username=username, hashed_password=hashed_password, is_admin=True):
         # Save Configuration
-        if TUNNEL_TOKEN: db_config.set_config("TUNNEL_TOKEN", TUNNEL_TOKEN)
-        if WDM_GOFILE_TOKEN: db_config.set_config("WDM_GOFILE_TOKEN", WDM_GOFILE_TOKEN)
-        if WDM_GOFILE_FOLDER_ID: db_config.set_config("WDM_GOFILE_FOLDER_ID", WDM_GOFILE_FOLDER_ID)
-        if WDM_OPENLIST_URL: db_config.set_config("WDM_OPENLIST_URL", WDM_OPENLIST_URL)
-        if WDM_OPENLIST_USER: db_config.set_config("WDM_OPENLIST_USER", WDM_OPENLIST_USER)
-        if WDM_OPENLIST_PASS: db_config.set_config("WDM_OPENLIST_PASS", WDM_OPENLIST_PASS)
+        setup_config = {
+            "TUNNEL_TOKEN": TUNNEL_TOKEN,
+            "WDM_GOFILE_TOKEN": WDM_GOFILE_TOKEN,
+            "WDM_GOFILE_FOLDER_ID": WDM_GOFILE_FOLDER_ID,
+            "WDM_OPENLIST_URL": WDM_OPENLIST_URL,
+            "WDM_OPENLIST_USER": WDM_OPENLIST_USER,
+            "WDM_OPENLIST_PASS": WDM_OPENLIST_PASS,
+        }
+        await run_sync(db_config.set_configs, {key: value for key, value in setup_config.items() if value})
         
         request.session["user"] = username
         request.session["last_activity"] = time.time()
@@ -61,7 +64,7 @@ async def post_setup_form(
 @router.get("/login", response_class=HTMLResponse)
 async def get_login_form(request: Request):
     if request.session.get("user"):
-        domain = db_config.get_config("login_domain") or request.headers.get("host", "localhost").split(":")[0]
+        domain = await db_config.aget_config("login_domain") or request.headers.get("host", "localhost").split(":")[0]
         return RedirectResponse(url=f"http://{domain}:6275/downloader", status_code=303)
     lang = get_lang(request)
     return templates.TemplateResponse("login.html", {"request": request, "lang": lang, "error": None})
@@ -79,17 +82,17 @@ async def login(request: Request, username: str = Form(...), password: str = For
         host = request.headers.get("host", "localhost")
         domain = host.split(":")[0]
         
-        db_config.set_config("login_domain", domain)
-        
+        login_config = {"login_domain": domain}
         tunnel_token = os.getenv("TUNNEL_TOKEN")
         if tunnel_token:
-            db_config.set_config("TUNNEL_TOKEN", tunnel_token)
+            login_config["TUNNEL_TOKEN"] = tunnel_token
+        await run_sync(db_config.set_configs, login_config)
         
         main_app_url = f"http://{domain}:6275"
         response_content = f"Login successful. Please access the main application at: {main_app_url}"
         return Response(content=response_content, media_type="text/plain")
     
-    user = User.get_user_by_username(username)
+    user = await User.aget_user_by_username(username)
     
     if not user or not verify_password(password, user.hashed_password):
         error_message = lang.get("login_error", "Invalid username or password")
@@ -104,11 +107,11 @@ async def login(request: Request, username: str = Form(...), password: str = For
     
     host = request.headers.get("host", "localhost")
     domain = host.split(":")[0]
-    db_config.set_config("login_domain", domain)
-    
+    login_config = {"login_domain": domain}
     tunnel_token = os.getenv("TUNNEL_TOKEN")
     if tunnel_token:
-        db_config.set_config("TUNNEL_TOKEN", tunnel_token)
+        login_config["TUNNEL_TOKEN"] = tunnel_token
+    await run_sync(db_config.set_configs, login_config)
     
     main_app_url = f"http://{domain}:6275"
     response_content = f"Login successful. Please access the main application at: {main_app_url}"
@@ -118,7 +121,7 @@ async def login(request: Request, username: str = Form(...), password: str = For
 @router.get("/", response_class=HTMLResponse)
 async def get_blog_index(request: Request):
     if request.session.get("user"):
-        domain = db_config.get_config("login_domain") or request.headers.get("host", "localhost").split(":")[0]
+        domain = await db_config.aget_config("login_domain") or request.headers.get("host", "localhost").split(":")[0]
         return RedirectResponse(url=f"http://{domain}:6275/downloader", status_code=303)
     
     # This serves a static blog index if it exists, otherwise falls back to a template.
@@ -1,17 +1,20 @@
 import os
 import json
 import time
-from fastapi import APIRouter, Request, Depends, Form
+from pathlib import Path
+from typing import Optional
+from fastapi import APIRouter, Request, Depends, Form, Query
 from fastapi.responses import HTMLResponse, RedirectResponse
 
 from .. import status
 from ..auth import get_current_user, verify_password
-from ..database import User, db_config
+from ..database import User, db_config, run_sync
 from ..i18n import get_lang
 from ..templating import templates
 from ..config import AVATAR_URL
 from .. import redis_client
 from ..logging_handler import update_log_handlers
+from ..utils import get_task_status, get_task_log_paths, transfer_profile_settings_keys
 
 # --- Constants & Helpers ---
 SECRET_KEYS = [
@@ -21,6 +24,33 @@ SECRET_KEYS = [
     "WDM_KEMONO_USERNAME", "WDM_KEMONO_PASSWORD"
 ]
 
+SETTINGS_KEYS = [
+    "TUNNEL_TOKEN",
+    "WDM_GOFILE_TOKEN", "WDM_GOFILE_FOLDER_ID",
+    "WDM_OPENLIST_URL", "WDM_OPENLIST_USER", "WDM_OPENLIST_PASS",
+    "WDM_WEBDAV_URL", "WDM_WEBDAV_USER", "WDM_WEBDAV_PASS",
+    "WDM_S3_PROVIDER", "WDM_S3_ACCESS_KEY_ID", "WDM_S3_SECRET_ACCESS_KEY", "WDM_S3_REGION", "WDM_S3_ENDPOINT",
+    "WDM_B2_ACCOUNT_ID", "WDM_B2_APPLICATION_KEY",
+    *transfer_profile_settings_keys(),
+    "WDM_CONFIG_BACKUP_RCLONE_BASE64", "WDM_CONFIG_BACKUP_REMOTE_PATH",
+    "WDM_SYNC_TASKS_JSON",
+    "WDM_VERIFICATION_TYPE", "WDM_VERIFICATION_SITE_KEY", "WDM_VERIFICATION_SECRET_KEY", "WDM_VERIFICATION_ID",
+    "WDM_VERIFICATION_GEETEST_DEMO_TYPE",
+    "WDM_GALLERY_DL_ARGS",
+    "WDM_KEMONO_USERNAME", "WDM_KEMONO_PASSWORD",
+    "AVATAR_URL", "login_domain", "PRIVATE_MODE", "DEBUG_MODE", "GITHUB_TOKEN",
+    "REDIS_URL", "TERMINAL_ENABLED"
+]
+
+# Keys behind the "configured" hints on the downloader page
+UPLOAD_SERVICE_KEYS = [
+    "WDM_WEBDAV_URL", "WDM_WEBDAV_USER", "WDM_WEBDAV_PASS",
+    "WDM_S3_PROVIDER", "WDM_S3_ACCESS_KEY_ID", "WDM_S3_SECRET_ACCESS_KEY", "WDM_S3_REGION", "WDM_S3_ENDPOINT",
+    "WDM_B2_ACCOUNT_ID", "WDM_B2_APPLICATION_KEY",
+    "WDM_GOFILE_TOKEN", "WDM_GOFILE_FOLDER_ID",
+    "WDM_OPENLIST_URL", "WDM_OPENLIST_USER", "WDM_OPENLIST_PASS",
+]
+
 def mask_secret(value: str) -> str:
     if not value:
         return ""
@@ -31,6 +61,14 @@ def mask_secret(value: str) -> str:
         return f"{value[:2]}...{value[-2:]}"
     return value
 
+async def get_settings_view() -> dict:
+    """Current settings for the settings form, with secrets masked."""
+    current_config = await db_config.aget_configs(SETTINGS_KEYS, "")
+    for key in SECRET_KEYS:
+        if current_config.get(key):
+            current_config[key] = mask_secret(current_config[key])
+    return current_config
+
 router = APIRouter(
     tags=["main_ui"],
 )
@@ -46,27 +84,28 @@ async def get_downloader(request: Request, current_user: User = Depends(get_curr
     lang = get_lang(request)
     
     # Check which upload services are configured to give hints to the UI
+    cfg = {key: bool(value) for key, value in (await db_config.aget_configs(UPLOAD_SERVICE_KEYS)).items()}
     services_configured = {
-        "webdav_configured": bool(db_config.get_config("WDM_WEBDAV_URL") and db_config.get_config("WDM_WEBDAV_USER")),
-        "s3_configured": bool(db_config.get_config("WDM_S3_ACCESS_KEY_ID") and db_config.get_config("WDM_S3_SECRET_ACCESS_KEY")),
-        "b2_configured": bool(db_config.get_config("WDM_B2_ACCOUNT_ID") and db_config.get_config("WDM_B2_APPLICATION_KEY")),
-        "gofile_configured": bool(db_config.get_config("WDM_GOFILE_TOKEN")),
-        "openlist_configured": bool(db_config.get_config("WDM_OPENLIST_URL") and db_config.get_config("WDM_OPENLIST_USER")),
+        "webdav_configured": cfg["WDM_WEBDAV_URL"] and cfg["WDM_WEBDAV_USER"],
+        "s3_configured": cfg["WDM_S3_ACCESS_KEY_ID"] and cfg["WDM_S3_SECRET_ACCESS_KEY"],
+        "b2_configured": cfg["WDM_B2_ACCOUNT_ID"] and cfg["WDM_B2_APPLICATION_KEY"],
+        "gofile_configured": cfg["WDM_GOFILE_TOKEN"],
+        "openlist_configured": cfg["WDM_OPENLIST_URL"] and cfg["WDM_OPENLIST_USER"],
     }
     
     upload_configs = {
-        "webdav": {"url_configured": bool(db_config.get_config("WDM_WEBDAV_URL")), "user_configured": bool(db_config.get_config("WDM_WEBDAV_USER")), "pass_configured": bool(db_config.get_config("WDM_WEBDAV_PASS"))},
-        "s3": {"provider_configured": bool(db_config.get_config("WDM_S3_PROVIDER")), "access_key_id_configured": bool(db_config.get_config("WDM_S3_ACCESS_KEY_ID")), "secret_access_key_configured": bool(db_config.get_config("WDM_S3_SECRET_ACCESS_KEY")), "region_configured": bool(db_config.get_config("WDM_S3_REGION")), "endpoint_configured": bool(db_config.get_config("WDM_S3_ENDPOINT"))},
-        "b2": {"account_id_configured": bool(db_config.get_config("WDM_B2_ACCOUNT_ID")), "application_key_configured": bool(db_config.get_config("WDM_B2_APPLICATION_KEY"))},
-        "gofile": {"token_configured": bool(db_config.get_config("WDM_GOFILE_TOKEN")), "folder_id_configured": bool(db_config.get_config("WDM_GOFILE_FOLDER_ID"))},
-        "openlist": {"url_configured": bool(db_config.get_config("WDM_OPENLIST_URL")), "user_configured": bool(db_config.get_config("WDM_OPENLIST_USER")), "pass_configured": bool(db_config.get_config("WDM_OPENLIST_PASS"))}
+        "webdav": {"url_configured": cfg["WDM_WEBDAV_URL"], "user_configured": cfg["WDM_WEBDAV_USER"], "pass_configured": cfg["WDM_WEBDAV_PASS"]},
+        "s3": {"provider_configured": cfg["WDM_S3_PROVIDER"], "access_key_id_configured": cfg["WDM_S3_ACCESS_KEY_ID"], "secret_access_key_configured": cfg["WDM_S3_SECRET_ACCESS_KEY"], "region_configured": cfg["WDM_S3_REGION"], "endpoint_configured": cfg["WDM_S3_ENDPOINT"]},
+        "b2": {"account_id_configured": cfg["WDM_B2_ACCOUNT_ID"], "application_key_configured": cfg["WDM_B2_APPLICATION_KEY"]},
+        "gofile": {"token_configured": cfg["WDM_GOFILE_TOKEN"], "folder_id_configured": cfg["WDM_GOFILE_FOLDER_ID"]},
+        "openlist": {"url_configured": cfg["WDM_OPENLIST_URL"], "user_configured": cfg["WDM_OPENLIST_USER"], "pass_configured": cfg["WDM_OPENLIST_PASS"]}
     }
     
     return templates.TemplateResponse("downloader.html", {
         "request": request, 
         "lang": lang, 
         "user": current_user.username, 
-        "avatar_url": db_config.get_config("AVATAR_URL", AVATAR_URL),
+        "avatar_url": await db_config.aget_config("AVATAR_URL", AVATAR_URL),
         "services_configured": services_configured,
         "upload_configs": upload_configs
     })
@@ -75,10 +114,24 @@ async def get_downloader(request: Request, current_user: User = Depends(get_curr
 
 
 @router.get("/tasks", response_class=HTMLResponse)
-async def get_tasks(request: Request, current_user: User = Depends(get_current_user)):
+async def get_tasks(
+    request: Request,
+    page: int = 1,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    created_by: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
     lang = get_lang(request)
-    tasks_list = status.get_all_tasks()
-    return templates.TemplateResponse("tasks.html", {"request": request, "tasks": tasks_list, "lang": lang, "user": current_user.username})
+    tasks_page = status.get_tasks_page(page=page, status=status_filter or None, created_by=created_by or None)
+    return templates.TemplateResponse("tasks.html", {
+        "request": request,
+        "tasks": tasks_page["tasks"],
+        "pagination": tasks_page,
+        "status_filter": status_filter or "",
+        "created_by": created_by or "",
+        "lang": lang,
+        "user": current_user.username
+    })
 
 @router.get("/updates", response_class=HTMLResponse)
 async def updates_page(request: Request, current_user: User = Depends(get_current_user)):
@@ -99,30 +152,7 @@ async def settings_page(request: Request, current_user: User = Depends(get_curre
     lang = get_lang(request)
     
     # Fetch current configuration from database
-    config_keys = [
-        "TUNNEL_TOKEN", 
-        "WDM_GOFILE_TOKEN", "WDM_GOFILE_FOLDER_ID",
-        "WDM_OPENLIST_URL", "WDM_OPENLIST_USER", "WDM_OPENLIST_PASS",
-        "WDM_WEBDAV_URL", "WDM_WEBDAV_USER", "WDM_WEBDAV_PASS",
-        "WDM_S3_PROVIDER", "WDM_S3_ACCESS_KEY_ID", "WDM_S3_SECRET_ACCESS_KEY", "WDM_S3_REGION", "WDM_S3_ENDPOINT",
-        "WDM_B2_ACCOUNT_ID", "WDM_B2_APPLICATION_KEY",
-        "WDM_CONFIG_BACKUP_RCLONE_BASE64", "WDM_CONFIG_BACKUP_REMOTE_PATH",
-        "WDM_SYNC_TASKS_JSON",
-        "WDM_VERIFICATION_TYPE", "WDM_VERIFICATION_SITE_KEY", "WDM_VERIFICATION_SECRET_KEY", "WDM_VERIFICATION_ID",
-        "WDM_VERIFICATION_GEETEST_DEMO_TYPE",
-        "WDM_GALLERY_DL_ARGS",
-        "WDM_KEMONO_USERNAME", "WDM_KEMONO_PASSWORD",
-        "AVATAR_URL", "login_domain", "PRIVATE_MODE", "DEBUG_MODE", "GITHUB_TOKEN",
-        "REDIS_URL", "TERMINAL_ENABLED"
-    ]
-    
-    current_config = {}
-    for key in config_keys:
-        val = db_config.get_config(key, "")
-        if key in SECRET_KEYS and val:
-            current_config[key] = mask_secret(val)
-        else:
-            current_config[key] = val
+    current_config = await get_settings_view()
     
     return templates.TemplateResponse("settings.html", {
         "request": request,
@@ -139,26 +169,10 @@ async def save_settings(
     lang = get_lang(request)
     form_data = await request.form()
     
-    config_keys = [
-        "TUNNEL_TOKEN", 
-        "WDM_GOFILE_TOKEN", "WDM_GOFILE_FOLDER_ID",
-        "WDM_OPENLIST_URL", "WDM_OPENLIST_USER", "WDM_OPENLIST_PASS",
-        "WDM_WEBDAV_URL", "WDM_WEBDAV_USER", "WDM_WEBDAV_PASS",
-        "WDM_S3_PROVIDER", "WDM_S3_ACCESS_KEY_ID", "WDM_S3_SECRET_ACCESS_KEY", "WDM_S3_REGION", "WDM_S3_ENDPOINT",
-        "WDM_B2_ACCOUNT_ID", "WDM_B2_APPLICATION_KEY",
-        "WDM_CONFIG_BACKUP_RCLONE_BASE64", "WDM_CONFIG_BACKUP_REMOTE_PATH",
-        "WDM_SYNC_TASKS_JSON",
-        "WDM_VERIFICATION_TYPE", "WDM_VERIFICATION_SITE_KEY", "WDM_VERIFICATION_SECRET_KEY", "WDM_VERIFICATION_ID",
-        "WDM_VERIFICATION_GEETEST_DEMO_TYPE",
-        "WDM_GALLERY_DL_ARGS",
-        "WDM_KEMONO_USERNAME", "WDM_KEMONO_PASSWORD",
-        "AVATAR_URL", "login_domain", "PRIVATE_MODE", "DEBUG_MODE", "GITHUB_TOKEN",
-        "REDIS_URL", "TERMINAL_ENABLED"
-    ]
-    
     try:
+        updates = {}
         # Save all configs that are present in the form
-        for key in config_keys:
+        for key in SETTINGS_KEYS:
             # Handle AVATAR_URL separately because the input name is AVATAR_URL_INPUT in the template
             form_key = "AVATAR_URL_INPUT" if key == "AVATAR_URL" else key
             if form_key in form_data:
@@ -166,41 +180,36 @@ async def save_settings(
                 
                 # If it's a secret key, check if user actually changed it
                 if key in SECRET_KEYS:
-                    old_value = db_config.get_config(key, "")
+                    old_value = await db_config.aget_config(key, "")
                     # If submitted value matches the masked version of the old value, user didn't change it
                     if old_value and new_value == mask_secret(old_value):
                         continue
                 
-                db_config.set_config(key, new_value)
+                updates[key] = new_value
         
-        # Clear cache to ensure new settings are picked up
-        db_config.clear_cache()
+        if not await run_sync(db_config.set_configs, updates):
+            raise RuntimeError("database write failed")
         
         # Reload Redis connection and log handlers
         redis_client.init_redis()
         update_log_handlers()
         
-        # Fetch updated config for rendering
-        current_config = {key: db_config.get_config(key, "") for key in config_keys}
-        
         return templates.TemplateResponse("settings.html", {
             "request": request,
             "user": current_user.username,
             "lang": lang,
-            "config": current_config,
+            "config": await get_settings_view(),
             "success": lang["settings_saved_success"],
-            "avatar_url": db_config.get_config("AVATAR_URL", AVATAR_URL)
+            "avatar_url": await db_config.aget_config("AVATAR_URL", AVATAR_URL)
         })
     except Exception as e:
-        # Re-fetch for rendering on error
-        current_config = {key: db_config.get_config(key, "") for key in config_keys}
         return templates.TemplateResponse("settings.html", {
             "request": request,
             "user": current_user.username,
             "lang": lang,
-            "config": current_config,
+            "config": await get_settings_view(),
             "error": f"{lang['settings_update_failed']}: {str(e)}",
-            "avatar_url": db_config.get_config("AVATAR_URL", AVATAR_URL)
+            "avatar_url": await db_config.aget_config("AVATAR_URL", AVATAR_URL)
         })
 
 @router.post("/change_password", response_class=HTMLResponse)
@@ -224,7 +233,7 @@ async def change_password(
     
     from ..auth import get_password_hash
     new_hashed_password = get_password_hash(new_password)
-    if User.update_password(user.username, new_hashed_password):
+    if await User.aupdate_password(user.username, new_hashed_password):
         return templates.TemplateResponse("change_password.html", {"request": request, "user": user.username, "lang": lang, "success": lang["password_changed_success"]})
     else:
         return templates.TemplateResponse("change_password.html", {"request": request, "user": user.username, "lang": lang, "error": lang["password_update_failed"]})
@@ -232,8 +241,11 @@ async def change_password(
 @router.get("/status/{task_id}", response_class=HTMLResponse)
 async def get_status(request: Request, task_id: str, current_user: User = Depends(get_current_user)):
     lang = get_lang(request)
-    status_file = status.STATUS_DIR / f"{task_id}.log"
-    upload_log_file = status.STATUS_DIR / f"{task_id}_upload.log"
+    status_file, upload_log_file = get_task_log_paths(task_id)
+    task_data = get_task_status(task_id)
+    if task_data and task_data.get("log_path"):
+        status_file = Path(task_data["log_path"])
+        upload_log_file = Path(task_data.get("upload_log_path") or upload_log_file)
     
     if not status_file.exists():
         from fastapi import HTTPException
@@ -257,7 +269,7 @@ async def get_status(request: Request, task_id: str, current_user: User = Depend
 
 @router.get("/setup", response_class=HTMLResponse)
 async def get_setup_form_main(request: Request):
-    if User.count_users() > 0:
+    if await User.ais_setup_complete():
         return RedirectResponse(url="/login", status_code=302)
     lang = get_lang(request)
     return templates.TemplateResponse("setup.html", {"request": request, "lang": lang, "error": None})
@@ -276,7 +288,7 @@ async def post_setup_form_main(
     WDM_OPENLIST_PASS: str = Form(None)
 ):
     lang = get_lang(request)
-    if User.count_users() > 0:
+    if await User.ais_setup_complete():
         return RedirectResponse(url="/login", status_code=302)
     if password != confirm_password:
         return templates.TemplateResponse("setup.html", {"request": request, "lang": lang, "error": "Passwords do not match."})
@@ -285,14 +297,17 @@ async def post_setup_form_main(
     
     from ..auth import get_password_hash
     hashed_password = get_password_hash(password)
-    if User.create_user(username=username, hashed_password=hashed_password, is_admin=True):
+    if await User.acreate_user(username=username, hashed_password=hashed_password, is_admin=True):
         # Save Configuration
-        if TUNNEL_TOKEN: db_config.set_config("TUNNEL_TOKEN", TUNNEL_TOKEN)
-        if WDM_GOFILE_TOKEN: db_config.set_config("WDM_GOFILE_TOKEN", WDM_GOFILE_TOKEN)
-        if WDM_GOFILE_FOLDER_ID: db_config.set_config("WDM_GOFILE_FOLDER_ID", WDM_GOFILE_FOLDER_ID)
-        if WDM_OPENLIST_URL: db_config.set_config("WDM_OPENLIST_URL", WDM_OPENLIST_URL)
-        if WDM_OPENLIST_USER: db_config.set_config("WDM_OPENLIST_USER", WDM_OPENLIST_USER)
-        if WDM_OPENLIST_PASS: db_config.set_config("WDM_OPENLIST_PASS", WDM_OPENLIST_PASS)
+        setup_config = {
+            "TUNNEL_TOKEN": TUNNEL_TOKEN,
+            "WDM_GOFILE_TOKEN": WDM_GOFILE_TOKEN,
+            "WDM_GOFILE_FOLDER_ID": WDM_GOFILE_FOLDER_ID,
+            "WDM_OPENLIST_URL": WDM_OPENLIST_URL,
+            "WDM_OPENLIST_USER": WDM_OPENLIST_USER,
+            "WDM_OPENLIST_PASS": WDM_OPENLIST_PASS,
+        }
+        await run_sync(db_config.set_configs, {key: value for key, value in setup_config.items() if value})
         
         request.session["user"] = username
         request.session["last_activity"] = time.time()
@@ -320,7 +335,7 @@ async def login_main(request: Request, username: str = Form(...), password: str
     lang = get_lang(request)
     
     # Authenticate User
-    user = User.get_user_by_username(username)
+    user = await User.aget_user_by_username(username)
     if user and verify_password(password, user.hashed_password):
         request.session["user"] = username
         request.session["last_activity"] = time.time()
@@ -3,7 +3,6 @@ import asyncio
 import logging
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Request, Depends, Form
 from fastapi.responses import RedirectResponse
-from ptyprocess import PtyProcessUnicode
 
 from ..auth import get_current_user
 from ..database import User, db_config
@@ -28,7 +27,6 @@ async def get_terminal(request: Request, current_user: User = Depends(get_curren
 async def enable_terminal(request: Request, confirm: bool = Form(...), current_user: User = Depends(get_current_user)):
     if confirm:
         db_config.set_config("TERMINAL_ENABLED", "true")
-        db_config.clear_cache()
     return RedirectResponse(url="/terminal", status_code=303)
 
 @router.websocket("/ws/terminal")
@@ -62,6 +60,8 @@ async def terminal_websocket(websocket: WebSocket):
     # 启动伪终端进程
     # 设置 TERM 环境变量以便支持颜色和复杂 UI
     try:
+        # 仅在首次打开终端时导入 ptyprocess
+        from ptyprocess import PtyProcessUnicode
         # 确保所有环境变量都是字符串
         env = {str(k): str(v) for k, v in os.environ.items()}
         env["TERM"] = "xterm-256color"
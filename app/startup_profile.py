@@ -0,0 +1,62 @@
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class StartupProfiler:
+    """
+    Records how long each startup phase takes. Phases are marked in order with mark();
+    finish() logs the report once the app is ready and writes it next to the log files.
+    For a per-module breakdown of the import phases, run with `python -X importtime`.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = []
+        self.ready = False
+        self._lock = threading.Lock()
+
+    def mark(self, name: str):
+        """Records the time spent since the previous mark as phase `name`."""
+        with self._lock:
+            now = time.perf_counter()
+            self.phases.append((name, now - self._last))
+            self._last = now
+
+    def report(self) -> dict:
+        with self._lock:
+            phases = [{"phase": name, "ms": round(seconds * 1000, 1)} for name, seconds in self.phases]
+            total = self._last - self.started
+        report = {
+            "ready": self.ready,
+            "total_ms": round(total * 1000, 1),
+            "phases": phases,
+            "slowest": sorted(phases, key=lambda phase: phase["ms"], reverse=True)[:5],
+        }
+        try:
+            import psutil
+            # Includes interpreter start-up and everything before this module was imported
+            report["process_age_ms"] = round((time.time() - psutil.Process().create_time()) * 1000, 1)
+        except Exception:
+            pass
+        return report
+
+    def finish(self, report_file: Optional[Path] = None) -> dict:
+        """Marks startup as complete, logs the report and optionally saves it as JSON."""
+        self.ready = True
+        report = self.report()
+        summary = ", ".join(f"{phase['phase']}={phase['ms']}ms" for phase in report["phases"])
+        logger.info(f"Startup finished in {report['total_ms']}ms ({summary})")
+        if report_file:
+            try:
+                report_file.write_text(json.dumps(report, indent=2), encoding="utf-8")
+            except OSError as e:
+                logger.error(f"Failed to write startup profile: {e}")
+        return report
+
+profiler = StartupProfiler()
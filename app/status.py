@@ -6,6 +6,7 @@ import sys
 from datetime import datetime, timedelta
 
 from .config import STATUS_DIR
+from .database import db_tasks
 
 START_TIME = datetime.utcnow()
 
@@ -42,50 +43,130 @@ def get_disk_usage():
     }
 
 import time
+import json
+import base64
+import threading
 
 # In-memory cache for status data
 _status_cache = {
-    "tasks": None,
-    "tasks_time": 0,
-    "active_count": None,
-    "active_count_time": 0,
     "versions": None,
     "versions_time": 0
 }
-CACHE_TTL = 30  # 30 seconds for general status
 VERSIONS_TTL = 3600  # 1 hour for versions
 
+ACTIVE_STATUSES = ("running", "paused")
+
+# Task aggregates, loaded once and then kept current by change events published by db_tasks.
+# Reads never rescan: counts are maintained per event, and the newest tasks are kept in list order.
+_task_aggregates_lock = threading.RLock()
+_task_aggregates = {
+    "loaded": False,
+    "task_status": {},      # task id -> status, makes event application idempotent
+    "status_counts": {},    # status -> number of tasks
+    "recent": [],           # newest tasks (list view fields), newest first
+    "recent_stale": False,  # set when a delete left "recent" shorter than the table
+    "version": 0,           # bumped on every change, used for cheap ETags
+    "epoch": str(int(time.time())),
+}
+
 def clear_status_cache():
     """Clears the status cache."""
     global _status_cache
     _status_cache = {
-        "tasks": None,
-        "tasks_time": 0,
-        "active_count": None,
-        "active_count_time": 0,
         "versions": None,
         "versions_time": 0
     }
+    with _task_aggregates_lock:
+        _task_aggregates["loaded"] = False
+        _task_aggregates["version"] += 1
+
+def _load_task_aggregates():
+    """Builds the task aggregates from the database (one-off, on first read or after a cache clear)."""
+    for _ in range(3):
+        start_version = _task_aggregates["version"]
+        rows = db_tasks.list_tasks(fields=["id", "status"])
+        recent = db_tasks.list_tasks(limit=RECENT_TASKS_LIMIT, fields=TASK_PAGE_FIELDS)
+        # Events published while we were reading would be lost; read again if any arrived
+        if _task_aggregates["version"] == start_version:
+            break
+    with _task_aggregates_lock:
+        task_status = {row["id"]: row["status"] for row in rows}
+        status_counts = {}
+        for task_status_value in task_status.values():
+            status_counts[task_status_value] = status_counts.get(task_status_value, 0) + 1
+        _task_aggregates.update({
+            "loaded": True,
+            "task_status": task_status,
+            "status_counts": status_counts,
+            "recent": recent,
+            "recent_stale": False,
+        })
+
+def _ensure_task_aggregates():
+    if not _task_aggregates["loaded"]:
+        _load_task_aggregates()
+    elif _task_aggregates["recent_stale"]:
+        recent = db_tasks.list_tasks(limit=RECENT_TASKS_LIMIT, fields=TASK_PAGE_FIELDS)
+        with _task_aggregates_lock:
+            _task_aggregates["recent"] = recent
+            _task_aggregates["recent_stale"] = False
+
+def _on_task_change(event: str, before, after):
+    """Applies a task change event from db_tasks to the cached aggregates in place."""
+    with _task_aggregates_lock:
+        _task_aggregates["version"] += 1
+        if not _task_aggregates["loaded"]:
+            return
+
+        task_id = (after or before)["id"]
+        task_status = _task_aggregates["task_status"]
+        status_counts = _task_aggregates["status_counts"]
+        old_status = task_status.get(task_id)
+        new_status = after["status"] if event != "delete" else None
+
+        if old_status != new_status:
+            if old_status is not None:
+                status_counts[old_status] = status_counts.get(old_status, 1) - 1
+                if status_counts[old_status] <= 0:
+                    del status_counts[old_status]
+            if new_status is not None:
+                status_counts[new_status] = status_counts.get(new_status, 0) + 1
+                task_status[task_id] = new_status
+            else:
+                task_status.pop(task_id, None)
+
+        recent = _task_aggregates["recent"]
+        index = next((i for i, task in enumerate(recent) if task["id"] == task_id), None)
+        if event == "delete":
+            if index is not None:
+                recent.pop(index)
+                if len(task_status) > len(recent):
+                    _task_aggregates["recent_stale"] = True
+        else:
+            row = {key: after.get(key) for key in TASK_PAGE_FIELDS}
+            if index is not None:
+                recent[index] = row
+            elif before is None:
+                # New tasks are always the newest
+                recent.insert(0, row)
+                del recent[RECENT_TASKS_LIMIT:]
+
+db_tasks.subscribe(_on_task_change)
+
+def get_task_status_counts() -> dict:
+    """Returns a {status: count} mapping over all tasks."""
+    _ensure_task_aggregates()
+    with _task_aggregates_lock:
+        return dict(_task_aggregates["status_counts"])
+
+def get_tasks_version() -> str:
+    """Returns a token that changes whenever any task changes."""
+    return f"{_task_aggregates['epoch']}-{_task_aggregates['version']}"
 
 def get_active_tasks():
     """Returns the number of currently active (running or paused) tasks."""
-    now = time.time()
-    if _status_cache["active_count"] is not None and (now - _status_cache["active_count_time"] < CACHE_TTL):
-        return _status_cache["active_count"]
-
-    count = 0
-    for status_file in STATUS_DIR.glob("*.json"):
-        try:
-            with open(status_file, "r") as f:
-                task_data = f.read()
-                if '"status": "running"' in task_data or '"status": "paused"' in task_data:
-                    count += 1
-        except (IOError, ValueError):
-            continue
-    
-    _status_cache["active_count"] = count
-    _status_cache["active_count_time"] = now
-    return count
+    counts = get_task_status_counts()
+    return sum(counts.get(s, 0) for s in ACTIVE_STATUSES)
 
 def get_dependency_versions():
     """Returns a dictionary with versions of key dependencies."""
@@ -118,33 +199,74 @@ def get_dependency_versions():
     _status_cache["versions_time"] = now
     return versions
 
-import json
-from app.config import STATUS_DIR
+# Fields returned by list views unless the caller asks for more; original_params is left out on purpose
+DEFAULT_TASK_LIST_FIELDS = (
+    "id", "status", "url", "downloader", "upload_service", "created_by",
+    "created_at", "updated_at", "error", "gofile_link", "upload_stats",
+)
 
-def get_all_tasks():
-    """Scans the status directory and returns a list of all tasks, sorted by modification time."""
-    now = time.time()
-    if _status_cache["tasks"] is not None and (now - _status_cache["tasks_time"] < CACHE_TTL):
-        return _status_cache["tasks"]
+# Fields rendered by the /tasks page
+TASK_PAGE_FIELDS = DEFAULT_TASK_LIST_FIELDS + ("command",)
 
-    tasks = []
-    status_files = list(STATUS_DIR.glob("*.json"))
-    
-    # Sort files by modification time (newest first)
-    status_files.sort(key=lambda f: f.stat().st_mtime, reverse=True)
-
-    for status_file in status_files:
-        try:
-            with open(status_file, "r") as f:
-                task_data = json.load(f)
-                tasks.append(task_data)
-        except (IOError, json.JSONDecodeError):
-            # In case of read error or malformed JSON, skip the file
-            continue
-    
-    _status_cache["tasks"] = tasks
-    _status_cache["tasks_time"] = now
-    return tasks
+TASKS_PAGE_SIZE = 20
+# The first unfiltered page is served straight from the cached aggregates
+RECENT_TASKS_LIMIT = TASKS_PAGE_SIZE
+
+def get_tasks_page(page: int = 1, status: str = None, created_by: str = None, page_size: int = TASKS_PAGE_SIZE):
+    """Returns one page of tasks plus the counts needed to render filters and pagination."""
+    if created_by:
+        status_counts = db_tasks.count_by_status(created_by=created_by)
+    else:
+        status_counts = get_task_status_counts()
+    total = status_counts.get(status, 0) if status else sum(status_counts.values())
+    pages = max(1, (total + page_size - 1) // page_size)
+    page = min(max(1, page), pages)
+
+    if not status and not created_by and page * page_size <= RECENT_TASKS_LIMIT:
+        with _task_aggregates_lock:
+            tasks = list(_task_aggregates["recent"][(page - 1) * page_size:page * page_size])
+    else:
+        tasks = db_tasks.list_tasks(
+            status=status, created_by=created_by, limit=page_size, offset=(page - 1) * page_size,
+            fields=TASK_PAGE_FIELDS
+        )
+    return {
+        "tasks": tasks,
+        "total": total,
+        "page": page,
+        "pages": pages,
+        "page_size": page_size,
+        "status_counts": status_counts,
+    }
+
+def encode_task_cursor(task: dict) -> str:
+    """Encodes the (created_at, id) position of a task into an opaque cursor string."""
+    raw = json.dumps([task.get("created_at"), task.get("id")]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_task_cursor(cursor: str) -> tuple:
+    """Decodes a cursor produced by encode_task_cursor. Raises ValueError if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, task_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(created_at), str(task_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def query_tasks(limit: int = 50, cursor: str = None, fields=DEFAULT_TASK_LIST_FIELDS, **filters):
+    """Returns one cursor-paginated page of tasks as {"tasks", "next_cursor", "has_more"}."""
+    position = decode_task_cursor(cursor) if cursor else None
+    # Always fetch the cursor columns, and one extra row to know whether another page exists
+    query_fields = None
+    if fields:
+        query_fields = list(dict.fromkeys(list(fields) + ["id", "created_at"]))
+    rows = db_tasks.list_tasks(limit=limit + 1, cursor=position, fields=query_fields, **filters)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_task_cursor(rows[-1]) if has_more and rows else None
+    if fields:
+        rows = [{key: row.get(key) for key in fields} for row in rows]
+    return {"tasks": rows, "next_cursor": next_cursor, "has_more": has_more}
 
 def get_all_status():
     """Aggregates all status information into a single dictionary."""
@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import random
+import asyncio
+import base64
+import logging
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .database import db_config, db_sync, run_sync
+from .config import GALLERY_DL_CONFIG_DIR, CONFIG_BACKUP_REMOTE_PATH
+from .rclone_rc import rclone_daemon, RcloneRCError, RcloneRCUnavailable
+from . import sync_tracker
+from .sync_tracker import change_tracker
+
+logger = logging.getLogger(__name__)
+
+# Sync tasks running at the same time
+SYNC_CONCURRENCY = 3
+# Longest sleep between scheduling passes (seconds); settings changes are picked up this fast
+TICK_INTERVAL = 30
+# Retry delay after the first failure, doubled per further failure up to BACKOFF_MAX (seconds)
+BACKOFF_BASE = 60
+BACKOFF_MAX = 3600
+# Every delay is randomized by +/- this fraction so tasks with equal intervals drift apart
+JITTER = 0.1
+# Tasks that never ran start at a random point within this many seconds of startup
+START_SPREAD = 60
+
+async def sync_with_daemon(rclone_config_content: str, local_path: str, remote_path: str,
+                           files_from: Optional[Path] = None) -> Optional[dict]:
+    """
+    Copies a sync task through the rclone rc daemon and returns the transfer stats;
+    returns None when the daemon is unavailable and raises RcloneRCError when the copy fails.
+    """
+    if not await rclone_daemon.ensure_started():
+        return None
+    try:
+        await rclone_daemon.import_config(rclone_config_content)
+        source = Path(local_path)
+        # `rclone copy` puts a single file into the destination directory
+        if not source.is_dir():
+            remote_path = remote_path.rstrip("/") + ("" if remote_path.endswith(":") else "/") + source.name
+        return await rclone_daemon.copy(source, remote_path, files_from=files_from)
+    except RcloneRCUnavailable:
+        return None
+
+async def sync_with_cli(rclone_config_content: str, local_path: str, remote_path: str,
+                        files_from: Optional[Path] = None) -> bool:
+    """Copies a sync task with an rclone process and a temporary config file."""
+    from .utils import _run_rclone_command
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.conf', delete=False) as tmp_file:
+        tmp_config_path = tmp_file.name
+        tmp_file.write(rclone_config_content)
+    try:
+        rclone_cmd = (f"rclone copy \"{local_path}\" \"{remote_path}\" "
+                      f"--config \"{tmp_config_path}\" "
+                      f"--log-level=INFO")
+        if files_from:
+            rclone_cmd += f" --files-from-raw \"{files_from}\" --no-traverse"
+        return await _run_rclone_command(rclone_cmd)
+    finally:
+        if os.path.exists(tmp_config_path):
+            os.unlink(tmp_config_path)
+
+async def run_sync_task(task_name: str, local_path: str, remote_path: str, rclone_config_content: str) -> dict:
+    """
+    Syncs one task if its local tree changed since the last successful run. Only new and
+    changed files are passed to rclone (--files-from-raw), so the remote is not listed;
+    the first run after a start, and one run a day, copy the whole tree.
+    Returns {"success", "skipped", "full", "bytes", "files", "error"}.
+    """
+    key = f"{local_path}\n{remote_path}"
+    source = Path(local_path)
+    snapshot = await asyncio.to_thread(sync_tracker.scan, source)
+    changed = change_tracker.changes(key, snapshot)
+    if changed == []:
+        logger.debug(f"[Sync] No changes: {task_name}")
+        return {"success": True, "skipped": True, "full": False, "bytes": 0, "files": 0, "error": None}
+
+    files_from = None
+    if changed is not None and source.is_dir():
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as f:
+            f.write("\n".join(changed) + "\n")
+            files_from = Path(f.name)
+    # Without rc stats, report the size of the files handed to rclone
+    offered = snapshot.keys() if changed is None else changed
+    result = {
+        "success": False, "skipped": False, "full": changed is None, "error": None,
+        "bytes": sum(snapshot[name][0] for name in offered), "files": len(offered),
+    }
+    try:
+        scope = "all files" if changed is None else f"{len(changed)} changed file(s)"
+        logger.info(f"[Sync] Running task: {task_name} ({local_path} -> {remote_path}, {scope})")
+        try:
+            stats = await sync_with_daemon(rclone_config_content, local_path, remote_path, files_from)
+        except RcloneRCError as e:
+            result["error"] = f"rclone rc error: {e}"
+            return result
+        if stats is not None:
+            result.update(success=True, bytes=stats.get("bytes", 0), files=stats.get("transfers", 0))
+        elif await sync_with_cli(rclone_config_content, local_path, remote_path, files_from):
+            result["success"] = True
+        else:
+            result["error"] = "rclone exited with an error"
+    finally:
+        if files_from and files_from.exists():
+            files_from.unlink()
+    if result["success"]:
+        change_tracker.commit(key, snapshot, full=changed is None)
+    return result
+
+def load_sync_tasks() -> List[dict]:
+    """Returns the configured sync tasks (the gallery-dl config backup first), normalized."""
+    tasks_json = db_config.get_config("WDM_SYNC_TASKS_JSON", "[]")
+    try:
+        custom_tasks = json.loads(tasks_json)
+    except Exception as e:
+        logger.error(f"[Sync] Failed to parse sync tasks JSON: {e}")
+        custom_tasks = []
+
+    system_task = {
+        "name": "System: Gallery-dl Config",
+        "local_path": str(GALLERY_DL_CONFIG_DIR),
+        "remote_path": CONFIG_BACKUP_REMOTE_PATH,
+        "interval": 10, # Minutes
+        "priority": 100,
+        "enabled": True,
+        "is_system": True
+    }
+
+    tasks = []
+    for task in [system_task] + custom_tasks:
+        try:
+            interval = max(int(task.get("interval", 60)), 1) * 60
+            priority = int(task.get("priority", 0))
+        except (TypeError, ValueError):
+            logger.error(f"[Sync] Invalid interval or priority in task: {task.get('name')}")
+            continue
+        tasks.append({
+            "name": task.get("name", "Unnamed Task"),
+            "local_path": task.get("local_path"),
+            "remote_path": task.get("remote_path"),
+            "interval": interval,
+            "priority": priority,
+            "enabled": str(task.get("enabled", "false")).lower() == "true",
+            "is_system": bool(task.get("is_system")),
+        })
+    return tasks
+
+def _jittered(seconds: float) -> float:
+    return seconds * random.uniform(1 - JITTER, 1 + JITTER)
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+class SyncScheduler:
+    """
+    Runs the periodic sync tasks. Each task's last and next run, failure count and last error
+    are persisted (db_sync), so schedules and backoff survive restarts. Due tasks start in
+    priority order, at most SYNC_CONCURRENCY at once. A failing task is retried after an
+    exponentially growing delay, and every delay is jittered. Each run is recorded with its
+    duration, size and outcome.
+    """
+
+    def __init__(self):
+        self.states: Dict[str, dict] = {}
+        self.running: Dict[str, asyncio.Task] = {}
+        self._wake: Optional[asyncio.Event] = None
+
+    def next_run(self, task: dict, now: datetime) -> datetime:
+        state = self.states.get(task["name"])
+        if state is None:
+            state = self.states[task["name"]] = {"consecutive_failures": 0}
+        if state.get("next_run_at") is None:
+            state["next_run_at"] = now + timedelta(seconds=random.uniform(0, min(START_SPREAD, task["interval"])))
+        next_run_at = state["next_run_at"]
+        # A shortened interval takes effect without waiting out the old schedule
+        if not state.get("consecutive_failures") and state.get("last_run_at"):
+            next_run_at = min(next_run_at, state["last_run_at"] + timedelta(seconds=task["interval"] * (1 + JITTER)))
+        return next_run_at
+
+    def retry_delay(self, failures: int) -> float:
+        return _jittered(min(BACKOFF_BASE * 2 ** (failures - 1), BACKOFF_MAX))
+
+    async def run(self):
+        """The scheduler loop; runs until cancelled."""
+        self._wake = asyncio.Event()
+        for name, state in (await run_sync(db_sync.get_states)).items():
+            self.states[name] = {
+                "last_run_at": _parse_time(state["last_run_at"]),
+                "last_success_at": _parse_time(state["last_success_at"]),
+                "next_run_at": _parse_time(state["next_run_at"]),
+                "consecutive_failures": state["consecutive_failures"],
+                "last_error": state["last_error"],
+            }
+        try:
+            while True:
+                tasks = [task for task in load_sync_tasks() if task["enabled"] and task["local_path"] and task["remote_path"]]
+                rclone_config_content = self._rclone_config()
+                now = datetime.now()
+                if rclone_config_content:
+                    self._start_due(tasks, now, rclone_config_content)
+
+                # Sleep until the next task is due, a running one finishes, or the next tick
+                waiting = [self.next_run(task, now) for task in tasks if task["name"] not in self.running]
+                timeout = TICK_INTERVAL
+                if waiting:
+                    timeout = min(timeout, max((min(waiting) - now).total_seconds(), 1))
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for sync in list(self.running.values()):
+                sync.cancel()
+
+    def _rclone_config(self) -> Optional[str]:
+        rclone_base64 = db_config.get_config("WDM_CONFIG_BACKUP_RCLONE_BASE64")
+        if not rclone_base64:
+            return None
+        try:
+            return base64.b64decode(rclone_base64).decode('utf-8')
+        except Exception as e:
+            logger.error(f"[Sync] Failed to decode rclone config: {e}")
+            return None
+
+    def _start_due(self, tasks: List[dict], now: datetime, rclone_config_content: str):
+        due = [task for task in tasks if task["name"] not in self.running and self.next_run(task, now) <= now]
+        due.sort(key=lambda task: (-task["priority"], self.next_run(task, now)))
+        for task in due:
+            if len(self.running) >= SYNC_CONCURRENCY:
+                break
+            if not os.path.exists(task["local_path"]):
+                logger.warning(f"[Sync] Local path not found for {task['name']}: {task['local_path']}")
+                self.states[task["name"]]["next_run_at"] = now + timedelta(seconds=_jittered(task["interval"]))
+                continue
+            sync = asyncio.create_task(self._run_task(task, rclone_config_content))
+            self.running[task["name"]] = sync
+            sync.add_done_callback(lambda _, name=task["name"]: self._finished(name))
+
+    def _finished(self, name: str):
+        self.running.pop(name, None)
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run_task(self, task: dict, rclone_config_content: str):
+        name = task["name"]
+        started_at = datetime.now()
+        started = time.monotonic()
+        try:
+            result = await run_sync_task(name, task["local_path"], task["remote_path"], rclone_config_content)
+        except Exception as e:
+            result = {"success": False, "skipped": False, "full": False, "bytes": None, "files": None, "error": str(e)}
+        duration = time.monotonic() - started
+        finished_at = datetime.now()
+
+        state = self.states.setdefault(name, {"consecutive_failures": 0})
+        state["last_run_at"] = started_at
+        if result["success"]:
+            state.update(consecutive_failures=0, last_error=None, last_success_at=finished_at,
+                         next_run_at=finished_at + timedelta(seconds=_jittered(task["interval"])))
+            if not result["skipped"]:
+                logger.info(f"[Sync] Success: {name} ({result['files']} file(s), {duration:.1f}s)")
+        else:
+            state["consecutive_failures"] = state.get("consecutive_failures", 0) + 1
+            delay = self.retry_delay(state["consecutive_failures"])
+            state.update(last_error=result["error"], next_run_at=finished_at + timedelta(seconds=delay))
+            logger.error(f"[Sync] Failed: {name} ({result['error']}); attempt {state['consecutive_failures']}, "
+                         f"retrying in {delay:.0f}s")
+
+        await run_sync(db_sync.save_state, name, **state)
+        # Ticks without changes only move the schedule
+        if not result["skipped"]:
+            await run_sync(db_sync.record_run, name, started_at, duration, result["success"],
+                           result["bytes"], result["files"], result["full"], result["error"])
+
+    def status(self) -> List[dict]:
+        """The configured tasks with their schedule, for the API."""
+        now = datetime.now()
+        statuses = []
+        for task in load_sync_tasks():
+            state = self.states.get(task["name"], {})
+            next_run_at = self.next_run(task, now) if task["enabled"] and task["name"] not in self.running else None
+            statuses.append({
+                **task,
+                "running": task["name"] in self.running,
+                "last_run_at": state["last_run_at"].isoformat() if state.get("last_run_at") else None,
+                "last_success_at": state["last_success_at"].isoformat() if state.get("last_success_at") else None,
+                "next_run_at": next_run_at.isoformat() if next_run_at else None,
+                "consecutive_failures": state.get("consecutive_failures", 0),
+                "last_error": state.get("last_error"),
+            })
+        return statuses
+
+sync_scheduler = SyncScheduler()
+
+async def unified_periodic_sync():
+    """Periodically syncs multiple tasks (including gallery-dl) to remote storage via rclone."""
+    await sync_scheduler.run()
@@ -0,0 +1,74 @@
+import os
+import time
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A tracked tree is synced in full at least this often (seconds), so files that were
+# removed or changed on the remote side are put back even if nothing changed locally
+FULL_SYNC_INTERVAL = 24 * 3600
+
+# Relative path -> (size, mtime in ns)
+Snapshot = Dict[str, Tuple[int, int]]
+
+def scan(path: Path) -> Snapshot:
+    """Returns the size and mtime of every file under `path` (or of `path` itself if it is a file)."""
+    if path.is_file():
+        stat = path.stat()
+        return {path.name: (stat.st_size, stat.st_mtime_ns)}
+    snapshot = {}
+    stack = [path]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError as e:
+            logger.warning(f"[Sync] Cannot scan {directory}: {e}")
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(Path(entry.path))
+                elif entry.is_file():
+                    stat = entry.stat()
+                    snapshot[os.path.relpath(entry.path, path)] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                # Removed while scanning
+                continue
+    return snapshot
+
+class ChangeTracker:
+    """
+    Remembers an mtime/size manifest per synced tree, so a sync only has to send the files that
+    changed since its last successful run instead of listing and comparing the whole remote.
+    Manifests live in memory; after a restart each tree is synced in full once.
+    """
+
+    def __init__(self):
+        # key -> (snapshot of the last successful sync, time of the last full sync)
+        self._manifests: Dict[str, Tuple[Snapshot, float]] = {}
+
+    def changes(self, key: str, snapshot: Snapshot) -> Optional[List[str]]:
+        """
+        Returns the files of `snapshot` that are new or changed since the last committed sync,
+        or None when the tree has to be synced in full. Deleted files are not reported because
+        `rclone copy` never deletes on the remote.
+        """
+        manifest = self._manifests.get(key)
+        if manifest is None or time.time() - manifest[1] >= FULL_SYNC_INTERVAL:
+            return None
+        previous = manifest[0]
+        return sorted(name for name, state in snapshot.items() if previous.get(name) != state)
+
+    def commit(self, key: str, snapshot: Snapshot, full: bool):
+        """Records a successful sync of `snapshot`."""
+        manifest = self._manifests.get(key)
+        full_synced_at = time.time() if full or manifest is None else manifest[1]
+        self._manifests[key] = (snapshot, full_synced_at)
+
+    def forget(self, key: str):
+        self._manifests.pop(key, None)
+
+change_tracker = ChangeTracker()
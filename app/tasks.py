@@ -2,24 +2,30 @@ import os
 import asyncio
 import signal
 import shutil
-import random
 import time
 import logging
 from pathlib import Path
+from typing import Callable, Optional, Tuple
 import json
-import tempfile
 
-from . import openlist
 from .database import db_config
 from .config import DOWNLOADS_DIR, ARCHIVES_DIR, STATUS_DIR
+from .proxy_pool import proxy_pool, ProxyLease
+from . import gofile
+from . import kemono
+from .rclone_rc import rclone_daemon, RcloneRCUnavailable
+from .rate_limit import parse_rate
 from .utils import (
-    get_working_proxy,
-    upload_to_gofile,
     create_rclone_config,
+    rclone_remote_options,
+    rclone_transfer_profile,
+    transfer_profile_flags,
     generate_archive_name,
     update_task_status,
+    get_task_log_paths,
     convert_rate_limit_to_kbps,
     count_files_in_dir,
+    format_size,
 )
 
 # 获取logger
@@ -31,112 +37,15 @@ debug_enabled = os.getenv("DEBUG_MODE", "false").lower() == "true"
 # 全局并发控制：同时最多运行2个任务
 task_semaphore = asyncio.Semaphore(2)
 
-def create_netscape_cookies(cookies_str: str) -> str:
-    """Converts a standard cookie string to a Netscape format cookie file."""
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
-        f.write("# Netscape HTTP Cookie File\n")
-        f.write("# http://curl.haxx.se/rfc/cookie_spec.html\n")
-        f.write("# This is a generated file!  Do not edit.\n\n")
-        
-        for cookie in cookies_str.split(';'):
-            if '=' in cookie:
-                name, value = cookie.strip().split('=', 1)
-                # domains for kemono/coomer
-                f.write(f".kemono.cr\tTRUE\t/\tFALSE\t0\t{name}\t{value}\n")
-                f.write(f".kemono.su\tTRUE\t/\tFALSE\t0\t{name}\t{value}\n")
-                f.write(f".coomer.st\tTRUE\t/\tFALSE\t0\t{name}\t{value}\n")
-                f.write(f".coomer.su\tTRUE\t/\tFALSE\t0\t{name}\t{value}\n")
-        return f.name
-
-
-async def unified_periodic_sync():
-    """Periodically syncs multiple tasks (including gallery-dl) to remote storage via rclone."""
-    from .utils import _run_rclone_command, GALLERY_DL_CONFIG_DIR, CONFIG_BACKUP_REMOTE_PATH
-    import base64
-    import tempfile
-    import json
-    
-    # Store last run times for each task to manage intervals
-    # Key: task identifier, Value: timestamp
-    last_run_times = {}
-
-    while True:
-        # 1. Load Custom Tasks from JSON
-        tasks_json = db_config.get_config("WDM_SYNC_TASKS_JSON", "[]")
-        try:
-            custom_tasks = json.loads(tasks_json)
-        except Exception as e:
-            logger.error(f"[Sync] Failed to parse sync tasks JSON: {e}")
-            custom_tasks = []
-
-        # 2. Add System Task (Gallery-dl Config)
-        system_task = {
-            "name": "System: Gallery-dl Config",
-            "local_path": str(GALLERY_DL_CONFIG_DIR),
-            "remote_path": CONFIG_BACKUP_REMOTE_PATH,
-            "interval": 10, # Minutes
-            "enabled": True,
-            "is_system": True
-        }
-        
-        # Merge all tasks
-        all_tasks = [system_task] + custom_tasks
-        rclone_base64 = db_config.get_config("WDM_CONFIG_BACKUP_RCLONE_BASE64")
-        
-        if rclone_base64:
-            current_time = time.time()
-            
-            for task in all_tasks:
-                task_name = task.get("name", "Unnamed Task")
-                enabled = str(task.get("enabled", "false")).lower() == "true"
-                local_path = task.get("local_path")
-                remote_path = task.get("remote_path")
-                interval_min = task.get("interval", 60)
-                
-                if not enabled or not local_path or not remote_path:
-                    continue
-                
-                # Check interval
-                interval_sec = int(interval_min) * 60
-                last_run = last_run_times.get(task_name, 0)
-                
-                if current_time - last_run >= interval_sec:
-                    if os.path.exists(local_path):
-                        logger.info(f"[Sync] Running task: {task_name} ({local_path} -> {remote_path})")
-                        try:
-                            rclone_config_content = base64.b64decode(rclone_base64).decode('utf-8')
-                            with tempfile.NamedTemporaryFile(mode='w', suffix='.conf', delete=False) as tmp_file:
-                                tmp_config_path = tmp_file.name
-                                tmp_file.write(rclone_config_content)
-                            
-                            try:
-                                rclone_cmd = (f"rclone copy \"{local_path}\" \"{remote_path}\" "
-                                              f"--config \"{tmp_config_path}\" "
-                                              f"--log-level=INFO")
-                                success = await _run_rclone_command(rclone_cmd)
-                                if success:
-                                    logger.info(f"[Sync] Success: {task_name}")
-                                    last_run_times[task_name] = current_time
-                                else:
-                                    logger.error(f"[Sync] Failed: {task_name} (Rclone error)")
-                            finally:
-                                if os.path.exists(tmp_config_path):
-                                    os.unlink(tmp_config_path)
-                        except Exception as e:
-                            logger.error(f"[Sync] Error in {task_name}: {e}")
-                    else:
-                        logger.warning(f"[Sync] Local path not found for {task_name}: {local_path}")
-
-        # Sleep for a short while before checking again
-        await asyncio.sleep(30) # Tick every 30 seconds
-
-
 
-
-async def run_command(command: str, command_to_log: str, status_file: Path, task_id: str):
+async def run_command(command: str, command_to_log: str, status_file: Path, task_id: str,
+                      build_command: Optional[Callable[[Optional[str]], Tuple[str, str]]] = None,
+                      proxy_lease: Optional[ProxyLease] = None):
     """
     Runs a shell command asynchronously with auto-retry and improved error logging.
     The actual command output is captured and logged for debugging.
+    With a proxy lease and a `build_command(proxy) -> (command, command_to_log)` callback,
+    each retry switches to the next best proxy of the pool instead of reusing a dead one.
     """
     max_retries = 3
     retry_delays = [5, 10, 15]  # seconds
@@ -171,6 +80,8 @@ async def run_command(command: str, command_to_log: str, status_file: Path, task
             if process.returncode == 0:
                 with open(status_file, "a") as f:
                     f.write(f"\n[Attempt {attempt + 1}] Task finished successfully.\n")
+                if proxy_lease:
+                    proxy_lease.succeeded()
                 return
             else:
                 # Log detailed error information
@@ -194,6 +105,10 @@ async def run_command(command: str, command_to_log: str, status_file: Path, task
                     f.write(f"Waiting {retry_delay} seconds before retry...\n")
                 await asyncio.sleep(retry_delay)
                 
+                if proxy_lease and build_command:
+                    command, command_to_log = build_command(await proxy_lease.rotate())
+                    update_task_status(task_id, {"command": command_to_log})
+
                 with open(status_file, "a") as f:
                     f.write(f"Retrying command...\n")
                     
@@ -223,6 +138,111 @@ async def run_command(command: str, command_to_log: str, status_file: Path, task
         raise last_exception
 
 
+async def upload_archives_to_gofile(task_id: str, archive_paths: list[Path], upload_log_file: Path,
+                                    api_token: Optional[str], folder_id: Optional[str]) -> list[str]:
+    """Uploads the archives of a job to gofile.io in parallel, reporting byte-level progress."""
+    sizes = {path: path.stat().st_size for path in archive_paths}
+    total_size = sum(sizes.values())
+    sent = {path: 0 for path in archive_paths}
+    uploaded = []
+    last_update_time = 0
+
+    def report(current_path=None):
+        transferred = sum(sent.values())
+        stats = {
+            "total_files": len(archive_paths),
+            "uploaded_files": len(uploaded),
+            "percent": int(transferred / total_size * 100) if total_size > 0 else 0,
+            "transferred": format_size(transferred),
+            "total": format_size(total_size),
+        }
+        if current_path is not None:
+            stats["current_file"] = current_path.name
+            stats["file_percent"] = int(sent[current_path] / sizes[current_path] * 100) if sizes[current_path] > 0 else 100
+        update_task_status(task_id, {"upload_stats": stats})
+
+    def progress_handler(path, current, total):
+        nonlocal last_update_time
+        sent[path] = current
+        now = time.time()
+        if now - last_update_time < 0.5 and current < total:
+            return
+        last_update_time = now
+        report(path)
+
+    def on_uploaded(path, link):
+        sent[path] = sizes[path]
+        uploaded.append(path)
+        update_task_status(task_id, {"gofile_link": link})
+        report()
+
+    return await gofile.upload_files(archive_paths, upload_log_file, api_token, folder_id,
+                                     progress_callback=progress_handler, on_uploaded=on_uploaded)
+
+def rclone_progress_handler(task_id: str, total_files: int, total_size: int, done_files: int = 0, done_size: int = 0):
+    """Returns an rc stats callback that reports a transfer as upload_stats, on top of the files already uploaded."""
+    def handler(stats: dict):
+        transferred = done_size + stats.get("bytes", 0)
+        upload_stats = {
+            "total_files": total_files,
+            "total_size": total_size,
+            "uploaded_files": done_files + stats.get("transfers", 0),
+            "percent": min(100, int(transferred / total_size * 100)) if total_size > 0 else 0,
+            "transferred": format_size(transferred),
+            "total": format_size(total_size),
+        }
+        transferring = stats.get("transferring") or []
+        if transferring:
+            upload_stats["current_file"] = Path(transferring[0].get("name", "")).name
+            upload_stats["file_percent"] = transferring[0].get("percentage", 0)
+        update_task_status(task_id, {"upload_stats": upload_stats})
+    return handler
+
+async def rclone_upload(task_id: str, service: str, params: dict, source: Path, remote_path: str, log_file: Path,
+                        progress_callback: Optional[Callable[[dict], None]] = None, stats: Optional[dict] = None):
+    """
+    Copies a directory into `remote_path`, or a single file to exactly `remote_path`, on the job's remote.
+    Transfers go through the shared rclone rc daemon. An rclone process with a temporary config is used
+    instead when the daemon is unavailable or the job sets a bandwidth limit (the daemon's limit is global).
+    `stats` (from count_files_in_dir) picks the automatic transfer settings; it is computed if not given.
+    """
+    options = rclone_remote_options(task_id, service, params)
+    if not options:
+        raise RuntimeError(f"Failed to create rclone configuration for {service}. Please check your settings in the Settings page.")
+
+    if stats is None:
+        stats = await asyncio.to_thread(count_files_in_dir, source)
+    profile = rclone_transfer_profile(service, params, stats)
+    with open(log_file, "a") as f:
+        f.write(f"\nTransfer settings for {stats['count']} file(s), {format_size(stats['size'])}: "
+                f"{', '.join(f'{field}={value}' for field, value in profile.items())}\n")
+
+    bwlimit = params.get("upload_rate_limit")
+    if not bwlimit and await rclone_daemon.ensure_started():
+        try:
+            remote = await rclone_daemon.ensure_remote(service, options)
+            await rclone_daemon.copy(source, f"{remote}:{remote_path}", log_file, progress_callback, profile)
+            return
+        except RcloneRCUnavailable as e:
+            with open(log_file, "a") as f:
+                f.write(f"\n{e}. Falling back to the rclone command line.\n")
+
+    rclone_config_path = await asyncio.to_thread(create_rclone_config, task_id, service, params)
+    verb = "copy" if source.is_dir() else "copyto"
+    upload_cmd = (
+        f"rclone {verb} --config \"{rclone_config_path}\" \"{source}\" \"remote:{remote_path}\" "
+        f"-P --stats 1s --log-level=INFO --retries 5"
+    )
+    if profile:
+        upload_cmd += f" {transfer_profile_flags(service, profile)}"
+    if bwlimit:
+        upload_cmd += f" --bwlimit {bwlimit}"
+    try:
+        await run_command(upload_cmd, upload_cmd, log_file, task_id)
+    finally:
+        if os.path.exists(rclone_config_path):
+            os.remove(rclone_config_path)
+
 async def upload_uncompressed(task_id: str, service: str, upload_path: str, params: dict, status_file: Path):
     """Uploads the uncompressed files to the remote storage with progress tracking."""
     if service == "gofile":
@@ -243,6 +263,7 @@ async def upload_uncompressed(task_id: str, service: str, upload_path: str, para
     })
 
     if service == "openlist":
+            from . import openlist
             try:
                 openlist_url = params.get("openlist_url") or db_config.get_config("WDM_OPENLIST_URL")
                 openlist_user = params.get("openlist_user") or db_config.get_config("WDM_OPENLIST_USER")
@@ -263,13 +284,6 @@ async def upload_uncompressed(task_id: str, service: str, upload_path: str, para
                 total_uploaded_size = 0
                 last_update_time = 0
                 
-                def format_size(size):
-                    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-                        if size < 1024.0:
-                            return f"{size:.2f} {unit}"
-                        size /= 1024.0
-                    return f"{size:.2f} PB"
-
                 async def upload_dir_contents(local_dir: Path, remote_dir: str):
                     nonlocal uploaded_count, total_uploaded_size, last_update_time
                     for item in local_dir.iterdir():
@@ -340,23 +354,15 @@ async def upload_uncompressed(task_id: str, service: str, upload_path: str, para
                 update_task_status(task_id, {"status": "failed", "error": error_message})
             return
     
-    rclone_config_path = create_rclone_config(task_id, service, params)
-    if not rclone_config_path:
+    if not rclone_remote_options(task_id, service, params):
         error_message = f"Failed to create rclone configuration for {service}."
         with open(status_file, "a") as f:
             f.write(f"\n--- UPLOAD FAILED ---\n{error_message}\n")
         update_task_status(task_id, {"status": "failed", "error": error_message})
         return
 
-    remote_full_path = f"remote:{upload_path}"
-        
-    upload_cmd = (
-        f"rclone copy --config \"{rclone_config_path}\" \"{task_download_dir}\" \"{remote_full_path}\" "
-        f"-P --stats 1s --log-level=INFO --retries 5"
-    )
-    if params.get("upload_rate_limit"):
-        upload_cmd += f" --bwlimit {params['upload_rate_limit']}"
-    await run_command(upload_cmd, upload_cmd, status_file, task_id)
+    await rclone_upload(task_id, service, params, task_download_dir, upload_path, status_file,
+                        rclone_progress_handler(task_id, stats["count"], stats["size"]), stats)
 
 
 async def compress_in_chunks(task_id: str, source_dir: Path, archive_name_base: str, max_size: int, status_file: Path) -> list[Path]:
@@ -418,10 +424,10 @@ async def process_download_job(task_id: str, url: str, downloader: str, service:
     async with task_semaphore:
         task_download_dir = DOWNLOADS_DIR / task_id
         archive_name = generate_archive_name(url)
-        status_file = STATUS_DIR / f"{task_id}.log"
-        upload_log_file = STATUS_DIR / f"{task_id}_upload.log"
+        status_file, upload_log_file = get_task_log_paths(task_id)
         archive_paths = []
-        rclone_config_path = None
+        proxy_lease = None
+        build_command = None
         
         # Extract site specific options from kwargs or params
         kemono_posts = kwargs.get("kemono_posts") or params.get("kemono_posts")
@@ -458,7 +464,9 @@ async def process_download_job(task_id: str, url: str, downloader: str, service:
             if params.get("auto_proxy"):
                 if debug_enabled:
                     logger.debug(f"[WORKFLOW] 启用自动代理选择")
-                proxy = await get_working_proxy(status_file)
+                # Jobs of one batch land on different proxies when spreading is enabled
+                proxy_lease = ProxyLease(proxy_pool, status_file, spread=params.get("spread_proxies") == "true")
+                proxy = await proxy_lease.acquire()
             
             downloader = params.get("downloader", "gallery-dl")
 
@@ -482,83 +490,47 @@ async def process_download_job(task_id: str, url: str, downloader: str, service:
                 logger.debug(f"[WORKFLOW] 速度限制: {params.get('rate_limit', '无')}")
 
             # Use kemono-dl if explicitly selected or automatically for specific sites when uncompressed
-            is_kemono_site = any(domain in url for domain in ["kemono.cr", "kemono.su", "coomer.st", "coomer.su"])
-            if downloader == "kemono-dl" or (is_kemono_site and not enable_compression):
+            if downloader == "kemono-dl" or (kemono.is_kemono_url(url) and not enable_compression):
                 if debug_enabled:
-                    logger.debug(f"[WORKFLOW] 自动切换到 kemono-dl 引擎处理 {url}")
+                    logger.debug(f"[WORKFLOW] 自动切换到内置 kemono 引擎处理 {url}")
                 
-                cookie_file = None
-                try:
-                    # 1. Prepare Command
-                    cmd = ["python3", "-m", "kemono_dl", "--path", str(task_download_dir), url]
-                    
-                    # Hierarchical structure as requested
-                    cmd.extend(["--output", "{service}/{creator_name}/{post_title}/{filename}"])
-
-                    # Get cookies from params or DB
-                    cookies_str = params.get("cookies")
-                    kemono_user = params.get("kemono_username") or db_config.get_config("WDM_KEMONO_USERNAME")
-                    kemono_pass = params.get("kemono_password") or db_config.get_config("WDM_KEMONO_PASSWORD")
+                # 1. Download with the built-in engine
+                cookies_str = params.get("cookies")
+                kemono_user = params.get("kemono_username") or db_config.get_config("WDM_KEMONO_USERNAME")
+                kemono_pass = params.get("kemono_password") or db_config.get_config("WDM_KEMONO_PASSWORD")
 
-                    if cookies_str:
-                        cookie_file = create_netscape_cookies(cookies_str)
-                        cmd.extend(["--cookies", cookie_file])
-                    elif kemono_user and kemono_pass:
-                        cmd.extend(["--kemono-login", kemono_user, kemono_pass])
+                with open(status_file, "a") as f:
+                    f.write(f"Starting kemono download for {url}...\n")
 
+                engine = kemono.KemonoDownloader(
+                    url, task_download_dir, status_file, task_id, proxy=proxy, cookies=cookies_str,
+                    username=None if cookies_str else kemono_user, password=None if cookies_str else kemono_pass,
+                    rate_limit=parse_rate(params.get("rate_limit")),
+                )
+                kemono_stats = await engine.run()
+                if kemono_stats["failed_files"]:
                     with open(status_file, "a") as f:
-                        f.write(f"Starting kemono-dl for {url}...\n")
-
-                    # 2. Execute process
-                    process = await asyncio.create_subprocess_exec(
-                        *cmd,
-                        stdout=asyncio.subprocess.PIPE,
-                        stderr=asyncio.subprocess.STDOUT
-                    )
-
-                    while True:
-                        line = await process.stdout.readline()
-                        if not line: break
-                        decoded_line = line.decode('utf-8', errors='ignore')
-                        with open(status_file, "a") as f: f.write(decoded_line)
-                        if "Downloading" in decoded_line:
-                            update_task_status(task_id, {"progress_count": "Downloading..."})
-
-                    await process.wait()
-                    if process.returncode != 0:
-                        raise Exception(f"kemono-dl exited with code {process.returncode}")
+                        f.write(f"\n{kemono_stats['failed_files']} file(s) could not be downloaded.\n")
+                    if not kemono_stats["downloaded_files"]:
+                        raise kemono.KemonoError("No files could be downloaded.")
+                if proxy_lease:
+                    proxy_lease.succeeded()
 
-                    with open(status_file, "a") as f:
-                        f.write("\nDownload complete. Starting upload...\n")
+                with open(status_file, "a") as f:
+                    f.write("\nDownload complete. Starting upload...\n")
 
-                    # 3. Upload
-                    update_task_status(task_id, {"status": "uploading"})
-                    await upload_uncompressed(task_id, service, upload_path, params, upload_log_file)
-                    update_task_status(task_id, {"status": "completed"})
-                    return # Task finished successfully
-                    
-                finally:
-                    if cookie_file and os.path.exists(cookie_file):
-                        os.unlink(cookie_file)
+                # 2. Upload
+                update_task_status(task_id, {"status": "uploading"})
+                await upload_uncompressed(task_id, service, upload_path, params, upload_log_file)
+                update_task_status(task_id, {"status": "completed"})
+                return # Task finished successfully
 
             if downloader == "megadl":
                 command = f"megadl --path {task_download_dir}"
-                if params.get("rate_limit"):
-                    # Convert rate limit string to integer for megadl
-                    rate_limit = params['rate_limit'].strip().upper()
-                    try:
-                        if rate_limit.endswith('K'):
-                            bytes_per_second = int(float(rate_limit[:-1]) * 1000)
-                        elif rate_limit.endswith('M'):
-                            bytes_per_second = int(float(rate_limit[:-1]) * 1000000)
-                        elif rate_limit.endswith('G'):
-                            bytes_per_second = int(float(rate_limit[:-1]) * 1000000000)
-                        else:
-                            bytes_per_second = int(float(rate_limit))
-                        command += f" --limit-speed {bytes_per_second}"
-                    except ValueError:
-                        # If conversion fails, use original value (will likely fail but preserve error)
-                        command += f" --limit-speed {params['rate_limit']}"
+                limit_kbps = convert_rate_limit_to_kbps(params.get("rate_limit"))
+                if limit_kbps:
+                    # megadl takes KiB/s
+                    command += f" --limit-speed {limit_kbps}"
                 command += f" {url}"
                 command_log = command
             else:
@@ -591,22 +563,35 @@ async def process_download_job(task_id: str, url: str, downloader: str, service:
                     
                 if params.get("deviantart_client_id") and params.get("deviantart_client_secret"):
                     command += f" -o extractor.deviantart.client-id={params['deviantart_client_id']} -o extractor.deviantart.client-secret={params['deviantart_client_secret']}"
-                if proxy:
-                    command += f" --proxy {proxy}"
-                    if params.get("rate_limit"):
-                        command += f" --limit-rate {params['rate_limit']}"
-                command += f" {url}"
-
-                command_log = f"gallery-dl --verbose -c \"{task_gdl_config_path}\""
-                if proxy:
-                    command_log += f" --proxy {proxy}"
-                command_log += f" {url}"
+                base_command = command
+
+                rate_limit = parse_rate(params.get("rate_limit"))
+
+                def build_gallery_dl_command(proxy):
+                    # Rebuilt by run_command when it rotates to another proxy
+                    command = base_command
+                    command_log = f"gallery-dl --verbose -c \"{task_gdl_config_path}\""
+                    if proxy:
+                        command += f" --proxy {proxy}"
+                        command_log += f" --proxy {proxy}"
+                    if rate_limit:
+                        command += f" --limit-rate {rate_limit}"
+                        command_log += f" --limit-rate {rate_limit}"
+                    command += f" {url}"
+                    command_log += f" {url}"
+                    return command, command_log
+
+                build_command = build_gallery_dl_command
+                command, command_log = build_command(proxy)
             
             if debug_enabled:
                 logger.debug(f"[WORKFLOW] 执行下载命令: {command_log}")
             
             update_task_status(task_id, {"command": command_log})
-            await run_command(command, command_log, status_file, task_id)
+            await run_command(command, command_log, status_file, task_id, build_command, proxy_lease)
+            if proxy_lease:
+                # Uploads do not go through the proxy
+                proxy_lease.release()
 
             if not enable_compression:
                 if debug_enabled:
@@ -662,137 +647,117 @@ async def process_download_job(task_id: str, url: str, downloader: str, service:
             })
 
             uploaded_count = 0
-            for archive_path in archive_paths:
-                if service == "gofile":
-                    if debug_enabled:
-                        logger.debug(f"[WORKFLOW] 使用 gofile.io 上传: {archive_path}")
-                    gofile_token = params.get("gofile_token") or db_config.get_config("WDM_GOFILE_TOKEN")
-                    gofile_folder_id = params.get("gofile_folder_id") or db_config.get_config("WDM_GOFILE_FOLDER_ID")
-                    if gofile_token and not gofile_folder_id:
-                        gofile_folder_id = "ad957716-3899-498a-bebc-716f616f9b16"
-                    download_link = await upload_to_gofile(archive_path, upload_log_file, api_token=gofile_token, folder_id=gofile_folder_id)
-                    
-                    uploaded_count += 1
-                    percent = int((uploaded_count / total_upload_files) * 100)
-                    update_task_status(task_id, {
-                        "status": "completed" if uploaded_count == total_upload_files else "uploading",
-                        "gofile_link": download_link,
-                        "upload_stats": {
-                            "total_files": total_upload_files,
-                            "uploaded_files": uploaded_count,
-                            "percent": percent
-                        }
-                    })
-                    if debug_enabled:
-                        logger.debug(f"[WORKFLOW] gofile.io 上传完成，链接: {download_link}")
-
-                
+            if service == "gofile":
+                if debug_enabled:
+                    logger.debug(f"[WORKFLOW] 使用 gofile.io 上传: {archive_paths}")
+                gofile_token = params.get("gofile_token") or db_config.get_config("WDM_GOFILE_TOKEN")
+                gofile_folder_id = params.get("gofile_folder_id") or db_config.get_config("WDM_GOFILE_FOLDER_ID")
+                if gofile_token and not gofile_folder_id:
+                    gofile_folder_id = "ad957716-3899-498a-bebc-716f616f9b16"
+                download_links = await upload_archives_to_gofile(task_id, archive_paths, upload_log_file, gofile_token, gofile_folder_id)
+                update_task_status(task_id, {
+                    "status": "completed",
+                    "gofile_link": download_links[-1],
+                    "gofile_links": download_links,
+                })
+                if debug_enabled:
+                    logger.debug(f"[WORKFLOW] gofile.io 上传完成，链接: {download_links}")
 
-                elif service == "openlist":
-                    if debug_enabled:
-                        logger.debug(f"[WORKFLOW] 使用 Openlist 上传: {archive_path}")
-                    openlist_url = params.get("openlist_url") or db_config.get_config("WDM_OPENLIST_URL")
-                    openlist_user = params.get("openlist_user") or db_config.get_config("WDM_OPENLIST_USER")
-                    openlist_pass = params.get("openlist_pass") or db_config.get_config("WDM_OPENLIST_PASS")
-                    if not all([openlist_url, openlist_user, openlist_pass, upload_path]):
-                        raise openlist.OpenlistError("Openlist URL, username, password, and remote path are all required.")
-                    with open(upload_log_file, "a") as f: f.write(f"\n--- Starting Openlist Upload ---\n")
-                    token = await asyncio.to_thread(openlist.login, openlist_url, openlist_user, openlist_pass, upload_log_file)
-                    await asyncio.to_thread(openlist.create_directory, openlist_url, token, upload_path, upload_log_file)
+            else:
+                for archive_path in archive_paths:
+                    if service == "openlist":
+                        from . import openlist
+                        if debug_enabled:
+                            logger.debug(f"[WORKFLOW] 使用 Openlist 上传: {archive_path}")
+                        openlist_url = params.get("openlist_url") or db_config.get_config("WDM_OPENLIST_URL")
+                        openlist_user = params.get("openlist_user") or db_config.get_config("WDM_OPENLIST_USER")
+                        openlist_pass = params.get("openlist_pass") or db_config.get_config("WDM_OPENLIST_PASS")
+                        if not all([openlist_url, openlist_user, openlist_pass, upload_path]):
+                            raise openlist.OpenlistError("Openlist URL, username, password, and remote path are all required.")
+                        with open(upload_log_file, "a") as f: f.write(f"\n--- Starting Openlist Upload ---\n")
+                        token = await asyncio.to_thread(openlist.login, openlist_url, openlist_user, openlist_pass, upload_log_file)
+                        await asyncio.to_thread(openlist.create_directory, openlist_url, token, upload_path, upload_log_file)
                     
-                    # Initialize tracking variables for archives
-                    total_archives_size = sum(p.stat().st_size for p in archive_paths)
-                    total_uploaded_archives_size = 0
-                    last_update_time = 0
+                        # Initialize tracking variables for archives
+                        total_archives_size = sum(p.stat().st_size for p in archive_paths)
+                        total_uploaded_archives_size = 0
+                        last_update_time = 0
                     
-                    def format_size(size):
-                        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-                            if size < 1024.0:
-                                return f"{size:.2f} {unit}"
-                            size /= 1024.0
-                        return f"{size:.2f} PB"
-
-                    # Single archive upload in openlist (could be multiple if split)
-                    current_archive_size = archive_path.stat().st_size
+                        # Single archive upload in openlist (could be multiple if split)
+                        current_archive_size = archive_path.stat().st_size
                     
-                    def progress_handler(current, total):
-                        nonlocal last_update_time
-                        now = time.time()
-                        if now - last_update_time < 0.5 and current < total:
-                            return
-                        last_update_time = now
+                        def progress_handler(current, total):
+                            nonlocal last_update_time
+                            now = time.time()
+                            if now - last_update_time < 0.5 and current < total:
+                                return
+                            last_update_time = now
                         
-                        # Total progress (considering previously uploaded archives in the loop)
-                        # Note: uploaded_count is updated AFTER the file is done in the loop
-                        # So current_total includes size of already uploaded files + current progress
+                            # Total progress (considering previously uploaded archives in the loop)
+                            # Note: uploaded_count is updated AFTER the file is done in the loop
+                            # So current_total includes size of already uploaded files + current progress
                         
-                        # We need to calculate size of *previous* archives in this loop
-                        # The loop iterates 'archive_paths'. We can use 'uploaded_count' as index if we are careful,
-                        # but simpler to just track accumulated size.
+                            # We need to calculate size of *previous* archives in this loop
+                            # The loop iterates 'archive_paths'. We can use 'uploaded_count' as index if we are careful,
+                            # but simpler to just track accumulated size.
                         
-                        # Actually, 'uploaded_count' is incremented at the end of loop.
-                        # So 'total_uploaded_archives_size' tracks completed files.
+                            # Actually, 'uploaded_count' is incremented at the end of loop.
+                            # So 'total_uploaded_archives_size' tracks completed files.
                         
-                        current_total_uploaded = total_uploaded_archives_size + current
-                        total_percent = int((current_total_uploaded / total_archives_size) * 100) if total_archives_size > 0 else 0
-                        file_percent = int((current / total) * 100) if total > 0 else 0
+                            current_total_uploaded = total_uploaded_archives_size + current
+                            total_percent = int((current_total_uploaded / total_archives_size) * 100) if total_archives_size > 0 else 0
+                            file_percent = int((current / total) * 100) if total > 0 else 0
                         
+                            update_task_status(task_id, {
+                                "upload_stats": {
+                                    "total_files": total_upload_files,
+                                    "uploaded_files": uploaded_count,
+                                    "percent": total_percent,
+                                    "file_percent": file_percent,
+                                    "current_file": archive_path.name,
+                                    "transferred": format_size(current_total_uploaded),
+                                    "total": format_size(total_archives_size)
+                                }
+                            })
+
+                        await asyncio.to_thread(openlist.upload_file, openlist_url, token, archive_path, upload_path, upload_log_file, progress_handler)
+                    
+                        total_uploaded_archives_size += current_archive_size
+                    
+                        uploaded_count += 1
+                        percent = int((uploaded_count / total_upload_files) * 100)
                         update_task_status(task_id, {
                             "upload_stats": {
                                 "total_files": total_upload_files,
                                 "uploaded_files": uploaded_count,
-                                "percent": total_percent,
-                                "file_percent": file_percent,
-                                "current_file": archive_path.name,
-                                "transferred": format_size(current_total_uploaded),
-                                "total": format_size(total_archives_size)
+                                "percent": percent
                             }
                         })
-
-                    await asyncio.to_thread(openlist.upload_file, openlist_url, token, archive_path, upload_path, upload_log_file, progress_handler)
-                    
-                    total_uploaded_archives_size += current_archive_size
-                    
-                    uploaded_count += 1
-                    percent = int((uploaded_count / total_upload_files) * 100)
-                    update_task_status(task_id, {
-                        "upload_stats": {
-                            "total_files": total_upload_files,
-                            "uploaded_files": uploaded_count,
-                            "percent": percent
-                        }
-                    })
-                    
-                    if debug_enabled:
-                        logger.debug(f"[WORKFLOW] Openlist 上传完成")
-                else:
-                    if debug_enabled:
-                        logger.debug(f"[WORKFLOW] 使用 rclone 上传到 {service}: {archive_path}")
-                    rclone_config_path = create_rclone_config(task_id, service, params)
-                    if not rclone_config_path:
-                        raise RuntimeError(f"Failed to create rclone configuration for {service}. Please check your settings in the Settings page.")
                     
-                    remote_full_path = f"remote:{upload_path}"
-                    upload_cmd = (
-                        f"rclone copyto --config \"{rclone_config_path}\" \"{archive_path}\" \"{remote_full_path}/{archive_path.name}\" "
-                        f"-P --stats 1s --log-level=INFO --retries 5"
-                    )
-                    if params.get("upload_rate_limit"):
-                        upload_cmd += f" --bwlimit {params['upload_rate_limit']}"
-                    await run_command(upload_cmd, upload_cmd, upload_log_file, task_id)
+                        if debug_enabled:
+                            logger.debug(f"[WORKFLOW] Openlist 上传完成")
+                    else:
+                        if debug_enabled:
+                            logger.debug(f"[WORKFLOW] 使用 rclone 上传到 {service}: {archive_path}")
+                        total_archives_size = sum(p.stat().st_size for p in archive_paths)
+                        uploaded_archives_size = sum(p.stat().st_size for p in archive_paths[:uploaded_count])
+                        await rclone_upload(
+                            task_id, service, params, archive_path, f"{upload_path}/{archive_path.name}", upload_log_file,
+                            rclone_progress_handler(task_id, total_upload_files, total_archives_size, uploaded_count, uploaded_archives_size),
+                        )
                     
-                    uploaded_count += 1
-                    percent = int((uploaded_count / total_upload_files) * 100)
-                    update_task_status(task_id, {
-                        "upload_stats": {
-                            "total_files": total_upload_files,
-                            "uploaded_files": uploaded_count,
-                            "percent": percent
-                        }
-                    })
+                        uploaded_count += 1
+                        percent = int((uploaded_count / total_upload_files) * 100)
+                        update_task_status(task_id, {
+                            "upload_stats": {
+                                "total_files": total_upload_files,
+                                "uploaded_files": uploaded_count,
+                                "percent": percent
+                            }
+                        })
                     
-                    if debug_enabled:
-                        logger.debug(f"[WORKFLOW] rclone 上传完成")
+                        if debug_enabled:
+                            logger.debug(f"[WORKFLOW] rclone 上传完成")
 
 
             with open(status_file, "a") as f:
@@ -810,6 +775,8 @@ async def process_download_job(task_id: str, url: str, downloader: str, service:
                     f.write(f"\n--- UPLOAD FAILED ---\n{error_message}\n")
             update_task_status(task_id, {"status": "failed", "error": error_message})
         finally:
+            if proxy_lease:
+                proxy_lease.release()
             # --- MEMORY LEAK FIX ---
             if debug_enabled:
                 logger.debug(f"[WORKFLOW] 开始清理任务资源")
@@ -842,14 +809,7 @@ async def process_download_job(task_id: str, url: str, downloader: str, service:
                     os.remove(archive_path)
                     with open(status_file, "a") as f: f.write(f"Removed archive: {archive_path}\n")
 
-            # 3. Remove temporary rclone config
-            if rclone_config_path and os.path.exists(rclone_config_path):
-                if debug_enabled:
-                    logger.debug(f"[WORKFLOW] 删除 rclone 配置: {rclone_config_path}")
-                os.remove(rclone_config_path)
-                with open(status_file, "a") as f: f.write(f"Removed rclone config: {rclone_config_path}\n")
-
-            # 4. Remove temporary gallery-dl config
+            # 3. Remove temporary gallery-dl config
             if 'task_gdl_config_path' in locals() and os.path.exists(task_gdl_config_path):
                 if debug_enabled:
                     logger.debug(f"[WORKFLOW] 删除 gallery-dl 配置: {task_gdl_config_path}")
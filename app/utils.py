@@ -1,7 +1,5 @@
 import os
 import json
-import random
-import httpx
 import subprocess
 import asyncio
 import base64
@@ -11,23 +9,26 @@ from pathlib import Path
 from typing import Optional, Dict, Any, List
 from fastapi import Request
 
-from . import openlist
-from .database import db_config
+from .database import db_config, db_tasks
 from .config import STATUS_DIR, CONFIG_BACKUP_RCLONE_BASE64, CONFIG_BACKUP_REMOTE_PATH, GALLERY_DL_CONFIG_DIR
+from .rate_limit import host_limiter, parse_rate
 
 logger = logging.getLogger(__name__) 
 
 import time
-import psutil
 
-# Cache for network speed calculation
-_net_io_cache = {"last_time": time.time(), "last_recv": psutil.net_io_counters().bytes_recv, "last_sent": psutil.net_io_counters().bytes_sent}
+# Cache for network speed calculation; primed by the first get_net_speed() call
+_net_io_cache = None
 
 def get_net_speed():
     """Calculates real-time network receive/send speeds (bytes/s)."""
     global _net_io_cache
+    import psutil
     current_time = time.time()
     current_io = psutil.net_io_counters()
+    if _net_io_cache is None:
+        _net_io_cache = {"last_time": current_time, "last_recv": current_io.bytes_recv, "last_sent": current_io.bytes_sent}
+        return 0, 0
     
     interval = current_time - _net_io_cache["last_time"]
     if interval <= 0:
@@ -63,159 +64,25 @@ def count_files_in_dir(directory: Path) -> Dict[str, Any]:
 
 # --- Helper Functions ---
 
-def get_task_status_path(task_id: str) -> Path:
-    """Returns the path to the JSON status file for a given task."""
-    return STATUS_DIR / f"{task_id}.json"
-
-def update_task_status(task_id: str, updates: Dict[str, Any]):
-    """Updates the JSON status file for a given task."""
-    status_path = get_task_status_path(task_id)
-    status_data = {}
-    if status_path.exists():
-        with open(status_path, "r") as f:
-            try:
-                status_data = json.load(f)
-            except json.JSONDecodeError:
-                pass  # Overwrite if file is corrupted
-    
-    status_data.update(updates)
-    
-    with open(status_path, "w") as f:
-        json.dump(status_data, f, indent=4)
-
-async def get_working_proxy(status_file: Path) -> str:
-    """Fetches a list of HTTP proxies, tests them concurrently, and returns a working one."""
-    proxy_list_url = "https://raw.githubusercontent.com/TheSpeedX/PROXY-List/master/http.txt"
-    with open(status_file, "a") as f:
-        f.write("Fetching proxy list...\n")
-    async with httpx.AsyncClient() as client:
-        response = await client.get(proxy_list_url)
-        response.raise_for_status()
-        proxies = response.text.splitlines()
-
-    async def test_proxy(proxy):
-        try:
-            async with httpx.AsyncClient(proxies=f"http://{proxy}", timeout=5) as client:
-                response = await client.get("https://www.google.com", timeout=5)
-                response.raise_for_status()
-                return proxy
-        except Exception:
-            return None
-
-    i = 0
-    while True:
-        i += 1
-        shuffled_proxies = random.sample(proxies, min(len(proxies), 3000))
-        with open(status_file, "a") as f:
-            f.write(f"Attempt {i}: Concurrently testing {len(shuffled_proxies)} proxies...\n")
-
-        tasks = [test_proxy(p) for p in shuffled_proxies]
-        for future in asyncio.as_completed(tasks):
-            result = await future
-            if result:
-                with open(status_file, "a") as f:
-                    f.write(f"Found working proxy: {result}\n")
-                return result
-        
-        with open(status_file, "a") as f:
-            f.write(f"No working proxy found in attempt {i}. Retrying with a new batch...\n")
-
-async def upload_to_gofile(file_path: Path, status_file: Path, api_token: Optional[str] = None, folder_id: Optional[str] = None) -> str:
-    """
-    Uploads a file to gofile.io, using the correct server-specific endpoint for both authenticated and public uploads.
-    """
-
-    async def _attempt_upload(use_token: bool, servers: List[Dict]):
-        """Internal helper to attempt an upload by iterating through available servers."""
-        upload_type = "authenticated" if use_token and api_token else "public"
-        with open(status_file, "a", encoding="utf-8") as f:
-            f.write(f"Attempting {upload_type} upload...\n")
-
-        for server in servers:
-            server_name = server["name"]
-            upload_url = f"https://{server_name}.gofile.io/uploadFile"
-            
-            with open(status_file, "a", encoding="utf-8") as f:
-                f.write(f"Trying {upload_type} upload via server: {server_name}...\n")
-
-            try:
-                async with httpx.AsyncClient(timeout=300) as client:
-                    form_data = {}
-                    if use_token and api_token:
-                        form_data['token'] = api_token
-                        if folder_id:
-                            form_data['folderId'] = folder_id
-                    
-                    with open(file_path, "rb") as f_upload:
-                        files = {'file': (file_path.name, f_upload, "application/octet-stream")}
-                        response = await client.post(upload_url, data=form_data or None, files=files)
-                    
-                    response.raise_for_status()
-                    upload_result = response.json()
-
-                    if upload_result.get("status") == "ok":
-                        download_link = upload_result["data"]["downloadPage"]
-                        with open(status_file, "a", encoding="utf-8") as f:
-                            f.write(f"Gofile.io {upload_type} upload successful on server {server_name}! Link: {download_link}\n")
-                        return download_link
-                    else:
-                        with open(status_file, "a", encoding="utf-8") as f:
-                            f.write(f"Gofile API returned an error on {upload_type} upload to {server_name}: {upload_result}. Trying next server...\n")
-                        continue
-            except Exception as e:
-                with open(status_file, "a", encoding="utf-8") as f:
-                    f.write(f"An exception occurred during {upload_type} upload to {server_name}: {e}. Trying next server...\n")
-                continue
-        
-        with open(status_file, "a", encoding="utf-8") as f:
-            f.write(f"All Gofile servers failed for {upload_type} upload.\n")
-        return None
-
-    servers = []
-    try:
-        with open(status_file, "a", encoding="utf-8") as f:
-            f.write("Fetching Gofile server list...\n")
-        async with httpx.AsyncClient(timeout=60) as client:
-            servers_res = await client.get("https://api.gofile.io/servers")
-            servers_res.raise_for_status()
-            servers_data = servers_res.json()
-            if servers_data.get("status") != "ok":
-                 raise Exception(f"Gofile API did not return 'ok' for server list: {servers_data}")
-            servers = servers_data["data"]["servers"]
-            random.shuffle(servers)
-    except Exception as e:
-        error_message = f"FATAL: Could not fetch Gofile server list: {e}"
-        with open(status_file, "a", encoding="utf-8") as f:
-            f.write(f"{error_message}\n")
-        raise Exception(error_message)
-
-    download_link = None
-    if api_token:
-        download_link = await _attempt_upload(use_token=True, servers=servers)
+def get_task_log_paths(task_id: str) -> tuple[Path, Path]:
+    """Returns the (download log, upload log) paths for a given task."""
+    return STATUS_DIR / f"{task_id}.log", STATUS_DIR / f"{task_id}_upload.log"
 
-    if not download_link:
-        if api_token:
-            with open(status_file, "a", encoding="utf-8") as f:
-                f.write("Authenticated upload failed. Falling back to public upload.\n")
-        download_link = await _attempt_upload(use_token=False, servers=servers)
-
-    if not download_link:
-        raise Exception("Gofile.io upload failed completely after trying all available servers and fallback options.")
-
-    return download_link
+def get_task_status(task_id: str) -> Optional[Dict[str, Any]]:
+    """Returns the stored metadata for a given task, or None if it does not exist."""
+    return db_tasks.get_task(task_id)
 
+def update_task_status(task_id: str, updates: Dict[str, Any]):
+    """Updates the stored metadata for a given task, creating it if needed."""
+    db_tasks.update_task(task_id, updates)
 
-def create_rclone_config(task_id: str, service: str, params: dict) -> Path:
-    """Creates a temporary rclone config file."""
+def rclone_remote_options(task_id: str, service: str, params: dict) -> Optional[Dict[str, str]]:
+    """Returns the rclone backend options ({"type": ..., ...}) for a service, with plain-text secrets."""
     if service == "gofile" or service == "openlist":
         return None
 
-    config_dir = Path("/tmp/rclone_configs")
-    os.makedirs(config_dir, exist_ok=True)
-    config_path = config_dir / f"{task_id}.conf"
-    
-    config_content = f"[remote]\ntype = {service}\n"
-    
+    options = {"type": service}
+
     if service == "webdav":
         webdav_url = params.get('webdav_url') or db_config.get_config("WDM_WEBDAV_URL")
         webdav_user = params.get('webdav_user') or db_config.get_config("WDM_WEBDAV_USER")
@@ -226,16 +93,7 @@ def create_rclone_config(task_id: str, service: str, params: dict) -> Path:
             # We can't proceed without these
             return None
 
-        config_content += f"url = {webdav_url}\n"
-        config_content += f"vendor = other\n"
-        config_content += f"user = {webdav_user}\n"
-        obscured_pass_process = subprocess.run(
-            ["rclone", "obscure", webdav_pass],
-            capture_output=True,
-            text=True
-        )
-        obscured_pass = obscured_pass_process.stdout.strip()
-        config_content += f"pass = {obscured_pass}\n"
+        options.update(url=webdav_url, vendor="other", user=webdav_user, **{"pass": webdav_pass})
         
     elif service == "s3":
         s3_provider = params.get('s3_provider') or db_config.get_config("WDM_S3_PROVIDER", "AWS")
@@ -248,11 +106,8 @@ def create_rclone_config(task_id: str, service: str, params: dict) -> Path:
             logger.error(f"S3 configuration missing for task {task_id}")
             return None
 
-        config_content += f"provider = {s3_provider}\n"
-        config_content += f"access_key_id = {s3_access_key_id}\n"
-        config_content += f"secret_access_key = {s3_secret_access_key}\n"
-        config_content += f"region = {s3_region}\n"
-        config_content += f"endpoint = {s3_endpoint}\n"
+        options.update(provider=s3_provider, access_key_id=s3_access_key_id,
+                       secret_access_key=s3_secret_access_key, region=s3_region, endpoint=s3_endpoint)
     elif service == "b2":
         b2_account_id = params.get('b2_account_id') or db_config.get_config("WDM_B2_ACCOUNT_ID")
         b2_application_key = params.get('b2_application_key') or db_config.get_config("WDM_B2_APPLICATION_KEY")
@@ -261,15 +116,132 @@ def create_rclone_config(task_id: str, service: str, params: dict) -> Path:
             logger.error(f"B2 configuration missing for task {task_id}")
             return None
             
-        config_content += f"account = {b2_account_id}\n"
-        config_content += f"key = {b2_application_key}\n"
-    
+        options.update(account=b2_account_id, key=b2_application_key)
+
+    return options
+
+def create_rclone_config(task_id: str, service: str, params: dict) -> Path:
+    """
+    Creates a temporary rclone config file with the job's remote as `remote`.
+    Only used when the rclone rc daemon is unavailable; it runs `rclone obscure`, so call it off the event loop.
+    """
+    options = rclone_remote_options(task_id, service, params)
+    if not options:
+        return None
+
+    config_dir = Path("/tmp/rclone_configs")
+    os.makedirs(config_dir, exist_ok=True)
+    config_path = config_dir / f"{task_id}.conf"
+
+    if "pass" in options:
+        obscured_pass_process = subprocess.run(
+            ["rclone", "obscure", options["pass"]],
+            capture_output=True,
+            text=True
+        )
+        options["pass"] = obscured_pass_process.stdout.strip()
+
+    config_content = "[remote]\n" + "".join(f"{key} = {value}\n" for key, value in options.items())
 
     with open(config_path, "w") as f:
         f.write(config_content)
         
     return config_path
 
+# rclone transfer tuning per upload service. The generic fields apply to every backend,
+# the rest are backend options. Each is set per job (form field `rclone_<field>`), per
+# service in the settings (`WDM_<SERVICE>_<FIELD>`) or picked from the upload's size.
+TRANSFER_PROFILE_FIELDS = {
+    "webdav": ["transfers", "checkers", "multi_thread_streams", "buffer_size"],
+    "s3": ["transfers", "checkers", "multi_thread_streams", "buffer_size", "upload_concurrency", "chunk_size"],
+    "b2": ["transfers", "checkers", "multi_thread_streams", "buffer_size", "chunk_size"],
+}
+BACKEND_PROFILE_FIELDS = {"upload_concurrency", "chunk_size"}
+SIZE_PROFILE_FIELDS = {"buffer_size", "chunk_size"}
+# Upper bound of the memory the automatic profiles let one upload's buffers use
+AUTO_PROFILE_MEMORY_BUDGET = 512 * 1024 * 1024
+
+def transfer_profile_settings_keys() -> List[str]:
+    """The settings keys that hold the per-service transfer profiles."""
+    return [f"WDM_{service.upper()}_{field.upper()}" for service, fields in TRANSFER_PROFILE_FIELDS.items() for field in fields]
+
+def auto_transfer_profile(service: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Picks transfer settings from the file count and total size of an upload (see count_files_in_dir).
+    Many small files are bound by per-file round trips, so they get many parallel transfers and
+    checkers; a few large files get fewer transfers but more parallel parts per file. Transfers are
+    capped so that memory use, transfers x (buffer_size + upload_concurrency x chunk_size), stays
+    within AUTO_PROFILE_MEMORY_BUDGET.
+    """
+    count = max(stats.get("count", 0), 1)
+    average_size = stats.get("size", 0) / count
+    # WebDAV servers are usually a single host that throttles parallel requests
+    max_transfers = 8 if service == "webdav" else 32
+
+    if average_size < 1024 * 1024:
+        profile = {"transfers": max_transfers, "checkers": max_transfers, "multi_thread_streams": 4, "buffer_size": "4M"}
+    elif average_size < 64 * 1024 * 1024:
+        profile = {"transfers": max_transfers // 2, "checkers": 16, "multi_thread_streams": 4, "buffer_size": "16M"}
+    else:
+        profile = {"transfers": 4, "checkers": 8, "multi_thread_streams": 8, "buffer_size": "32M"}
+    profile["transfers"] = max(1, min(profile["transfers"], count))
+
+    large = average_size >= 64 * 1024 * 1024
+    if service == "s3":
+        profile["upload_concurrency"] = 8 if large else 4
+        profile["chunk_size"] = "16M" if large else "5M"
+    elif service == "b2":
+        profile["chunk_size"] = "96M" if large else "48M"
+
+    per_transfer = parse_rate(profile["buffer_size"]) + \
+        profile.get("upload_concurrency", 1) * (parse_rate(profile.get("chunk_size")) or 0)
+    profile["transfers"] = max(1, min(profile["transfers"], AUTO_PROFILE_MEMORY_BUDGET // per_transfer))
+    return profile
+
+def _profile_value(field: str, value) -> Optional[Any]:
+    """Validates one profile value; returns None for empty or invalid values."""
+    import re
+    value = str(value or "").strip()
+    if not value:
+        return None
+    if field in SIZE_PROFILE_FIELDS:
+        if re.match(r'^\d+(?:\.\d+)?[KMG]i?$', value, re.IGNORECASE) or value.isdigit():
+            return value.upper().replace("I", "i")
+    elif value.isdigit() and int(value) > 0:
+        return int(value)
+    logger.warning(f"Ignoring invalid rclone {field} value: {value}")
+    return None
+
+def rclone_transfer_profile(service: str, params: dict, stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolves the transfer settings of a job: form values, then the service's settings, then auto values."""
+    fields = TRANSFER_PROFILE_FIELDS.get(service)
+    if not fields:
+        return {}
+    profile = auto_transfer_profile(service, stats)
+    configured = db_config.get_configs([f"WDM_{service.upper()}_{field.upper()}" for field in fields], "")
+    for field in fields:
+        value = _profile_value(field, params.get(f"rclone_{field}"))
+        if value is None:
+            value = _profile_value(field, configured.get(f"WDM_{service.upper()}_{field.upper()}"))
+        if value is not None:
+            profile[field] = value
+    return {field: profile[field] for field in fields if field in profile}
+
+def transfer_profile_flags(service: str, profile: Dict[str, Any]) -> str:
+    """Command line flags for a transfer profile, e.g. `--transfers 8 --s3-chunk-size 16M`."""
+    flags = []
+    for field, value in profile.items():
+        prefix = f"{service}-" if field in BACKEND_PROFILE_FIELDS else ""
+        flags.append(f"--{prefix}{field.replace('_', '-')} {value}")
+    return " ".join(flags)
+
+def format_size(size):
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if size < 1024.0:
+            return f"{size:.2f} {unit}"
+        size /= 1024.0
+    return f"{size:.2f} PB"
+
 def generate_archive_name(url: str) -> str:
     """Generates a descriptive archive name from a URL."""
     try:
@@ -282,41 +254,16 @@ def generate_archive_name(url: str) -> str:
         return "archive"
 
 def convert_rate_limit_to_kbps(rate_limit_str: str) -> int:
-    """Converts rate limit string (e.g., '2M', '500K') to integer KB/s for megadl command.
+    """Converts rate limit string (e.g., '2M', '500K') to integer KiB/s for megadl command.
     
     Args:
-        rate_limit_str: Speed limit string like '2M', '500K', '1G', or plain number.
+        rate_limit_str: Speed limit string like '2M', '500K', '1G', or plain number of bytes.
         
     Returns:
-        Integer value in KB/s.
+        Integer value in KiB/s (0 when no valid limit is given).
     """
-    if not rate_limit_str:
-        return 0
-    
-    rate_limit_str = rate_limit_str.strip().upper()
-    
-    if rate_limit_str.isdigit():
-        return int(rate_limit_str)
-    
-    import re
-    match = re.match(r'^(\d+(?:\.\d+)?)\s*([KMG])?$', rate_limit_str)
-    if not match:
-        numbers = re.findall(r'\d+', rate_limit_str)
-        if numbers:
-            return int(numbers[0])
-        return 0
-    
-    number = float(match.group(1))
-    unit = match.group(2)
-    
-    if unit == 'G':
-        return int(number * 1000 * 1000)
-    elif unit == 'M':
-        return int(number * 1000)
-    elif unit == 'K':
-        return int(number)
-    else:
-        return int(number)
+    rate = parse_rate(rate_limit_str)
+    return max(1, rate // 1024) if rate else 0
 
 async def _run_rclone_command(command: str, log_file: Optional[Path] = None):
     """Helper to run an rclone command and log its output."""
@@ -432,20 +379,224 @@ def sanitize_filename(filename):
     sanitized = re.sub(r'[/*?:\"<>|]', "_", filename)
     return re.sub(r'\s+', ' ', sanitized).strip()
 
-def download_file(url, destination_path, session):
-    """Synchronous file download with retry logic, designed to be run in a thread."""
-    max_retries = 5
+# Downloads: bytes buffered before each disk write, and the size from which a file is
+# fetched as parallel range segments when the server supports it
+DOWNLOAD_BUFFER_SIZE = 1024 * 1024
+SEGMENT_THRESHOLD = 64 * 1024 * 1024
+DOWNLOAD_SEGMENTS = 4
+
+class _RestartDownload(Exception):
+    """The remote file changed (or cannot be resumed); the partial file is discarded."""
+    pass
+
+class _PartialDownload:
+    """
+    Resume state of a `.part` file, kept next to it as `.part.json`: the resolved URL, the
+    validator (strong ETag or Last-Modified) sent as If-Range, the total size and, for
+    segmented downloads, each segment's [start, end, next byte].
+    """
+
+    def __init__(self, destination_path: Path):
+        self.part_path = destination_path.with_name(destination_path.name + ".part")
+        self.meta_path = destination_path.with_name(destination_path.name + ".part.json")
+        self.url = None
+        self.validator = None
+        self.total = 0
+        self.segments = None
+        try:
+            if self.part_path.exists():
+                meta = json.loads(self.meta_path.read_text())
+                self.url, self.validator, self.total, self.segments = meta["url"], meta["validator"], meta["total"], meta["segments"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    @property
+    def done(self) -> int:
+        if self.segments:
+            return sum(position - start for start, _, position in self.segments)
+        return self.part_path.stat().st_size if self.part_path.exists() else 0
+
+    def save(self):
+        if self.validator and self.part_path.exists():
+            self.meta_path.write_text(json.dumps({"url": self.url, "validator": self.validator,
+                                                  "total": self.total, "segments": self.segments}))
+
+    def reset(self):
+        self.url = self.validator = self.segments = None
+        self.total = 0
+        for path in (self.part_path, self.meta_path):
+            if path.exists():
+                path.unlink()
+
+def _response_validator(response) -> Optional[str]:
+    """A validator usable in If-Range: a strong ETag, or else Last-Modified."""
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+async def _write_at(fd: int, data: bytes, offset: int):
+    await asyncio.to_thread(os.pwrite, fd, data, offset)
+
+async def _stream_into(response, fd: int, offset: int, on_chunk, bandwidth=None) -> int:
+    """
+    Writes a response body at `offset` in DOWNLOAD_BUFFER_SIZE writes; returns the next offset.
+    `bandwidth` (a rate_limit.TokenBucket of bytes) throttles the read.
+    """
+    buffer = bytearray()
+    async for chunk in response.aiter_bytes():
+        if bandwidth:
+            await bandwidth.acquire(len(chunk))
+        buffer += chunk
+        if len(buffer) >= DOWNLOAD_BUFFER_SIZE:
+            await _write_at(fd, bytes(buffer), offset)
+            offset += len(buffer)
+            on_chunk(offset, len(buffer))
+            buffer.clear()
+    if buffer:
+        await _write_at(fd, bytes(buffer), offset)
+        offset += len(buffer)
+        on_chunk(offset, len(buffer))
+    return offset
+
+def _raise_for_status(response):
+    if response.status_code == 429:
+        retry_after = response.headers.get("Retry-After", "")
+        raise _RetryAfter(int(retry_after) if retry_after.isdigit() else None)
+    response.raise_for_status()
+
+class _RetryAfter(Exception):
+    def __init__(self, seconds: Optional[int]):
+        super().__init__(f"rate limited (retry after {seconds or 'unknown'}s)")
+        self.seconds = seconds
+
+async def _download_single(client, url: str, state: _PartialDownload, headers: dict, report, segments: int,
+                           bandwidth=None):
+    """One attempt over a single connection, resuming the `.part` file when it can be validated."""
+    offset = state.done if state.validator else 0
+    request_headers = dict(headers)
+    if offset:
+        request_headers.update({"Range": f"bytes={offset}-", "If-Range": state.validator})
+    request_url = state.url or url
+    async with host_limiter(request_url).slot() as observe, \
+            client.stream("GET", request_url, headers=request_headers, timeout=300) as r:
+        observe(r.status_code, r.headers.get("Retry-After"))
+        if r.status_code == 416 and offset:
+            raise _RestartDownload("the partial file does not match the remote file")
+        _raise_for_status(r)
+        if r.status_code == 206 and offset:
+            # Content-Range: bytes <start>-<end>/<total>
+            total = int(r.headers.get("Content-Range", "").rpartition("/")[2] or 0)
+        else:
+            # A full body: the file changed or the server ignores ranges
+            offset = 0
+            total = int(r.headers.get("Content-Length") or 0)
+            state.validator = _response_validator(r)
+            state.url = str(r.url)
+        state.total = total
+
+        if (offset == 0 and segments > 1 and total >= SEGMENT_THRESHOLD and state.validator
+                and r.headers.get("Accept-Ranges", "").lower() == "bytes"):
+            size = total // segments
+            state.segments = [[i * size, (i + 1) * size - 1 if i < segments - 1 else total - 1, i * size]
+                              for i in range(segments)]
+            with open(state.part_path, "wb") as f:
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(f.fileno(), 0, total)
+                else:
+                    f.truncate(total)
+            return False
+
+        report(offset, total)
+        with open(state.part_path, "r+b" if offset else "wb") as f:
+            f.truncate(offset)
+            end = await _stream_into(r, f.fileno(), offset, lambda position, _: report(position, total), bandwidth)
+    if total and end != total:
+        raise IOError(f"incomplete body ({end} of {total} bytes)")
+    return True
+
+async def _download_segments(client, state: _PartialDownload, headers: dict, report, bandwidth=None):
+    """One attempt over parallel range requests; each segment resumes where it stopped."""
+    with open(state.part_path, "r+b") as f:
+        fd = f.fileno()
+
+        async def fetch(segment):
+            start, end, position = segment
+            if position > end:
+                return
+            request_headers = {**headers, "Range": f"bytes={position}-{end}", "If-Range": state.validator}
+            async with host_limiter(state.url).slot() as observe, \
+                    client.stream("GET", state.url, headers=request_headers, timeout=300) as r:
+                observe(r.status_code, r.headers.get("Retry-After"))
+                _raise_for_status(r)
+                if r.status_code != 206:
+                    raise _RestartDownload("the server returned the whole file instead of a range")
+
+                def on_chunk(next_position, _):
+                    segment[2] = next_position
+                    report(state.done, state.total)
+
+                await _stream_into(r, fd, position, on_chunk, bandwidth)
+            if segment[2] <= end:
+                raise IOError(f"segment {start}-{end} ended at byte {segment[2]}")
+
+        fetches = [asyncio.create_task(fetch(segment)) for segment in state.segments]
+        try:
+            await asyncio.gather(*fetches)
+        finally:
+            for fetch_task in fetches:
+                fetch_task.cancel()
+
+async def download_file(url: str, destination_path: Path, client, headers: Optional[Dict[str, str]] = None,
+                        progress_callback=None, max_retries: int = 5, segments: int = DOWNLOAD_SEGMENTS,
+                        bandwidth=None) -> bool:
+    """
+    Streams a file to disk over a shared httpx.AsyncClient, with retries that resume instead of
+    starting over. The body goes to a `.part` file (resume state in `.part.json`) that replaces
+    the destination once complete. Resumed requests send Range + If-Range, so a file that
+    changed on the server is downloaded again. Files of SEGMENT_THRESHOLD or more on servers
+    that accept ranges are split into `segments` parallel range requests written in place.
+    `progress_callback(done, total)` is called as data arrives (total is 0 when unknown).
+    Every request goes through the shared limiter of its host (see rate_limit), and
+    `bandwidth`, a rate_limit.TokenBucket of bytes, caps the speed of the whole download.
+    A partial file left by a failed call is resumed by the next call for the same destination.
+    """
+    import random
+    # Sizes and offsets are counted in bytes on the wire, so the body must not be compressed
+    headers = {**(headers or {}), "Accept-Encoding": "identity"}
+    state = _PartialDownload(destination_path)
+
+    def report(done, total):
+        if progress_callback:
+            progress_callback(done, total)
+
     for attempt in range(max_retries):
         try:
-            with session.get(url, stream=True, timeout=300) as r:
-                r.raise_for_status()
-                with open(destination_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
+            if state.segments is None:
+                complete = await _download_single(client, url, state, headers, report, segments, bandwidth)
+            else:
+                complete = False
+            if not complete:
+                await _download_segments(client, state, headers, report, bandwidth)
+            if state.total and state.part_path.stat().st_size != state.total:
+                raise _RestartDownload(f"size mismatch ({state.part_path.stat().st_size} of {state.total} bytes)")
+            os.replace(state.part_path, destination_path)
+            if state.meta_path.exists():
+                state.meta_path.unlink()
             return True
+        except _RestartDownload as e:
+            logger.warning(f"Restarting download of {url}: {e}")
+            if state.segments is not None:
+                # The server does not serve the ranges it advertises; use one stream from now on
+                segments = 1
+            state.reset()
+            delay = 0
         except Exception as e:
-            if attempt + 1 == max_retries:
-                return False
-            time.sleep(5)
-    return False
\ No newline at end of file
+            logger.warning(f"Download of {url} failed (attempt {attempt + 1}/{max_retries}): {e}")
+            # Exponential backoff with jitter, or what the server asked for
+            delay = e.seconds if isinstance(e, _RetryAfter) and e.seconds else min(2 ** attempt, 30) + random.uniform(0, 1)
+        finally:
+            state.save()
+        if attempt + 1 < max_retries:
+            await asyncio.sleep(delay)
+    return False
@@ -24,6 +24,10 @@ hidden_imports = [
     'app.log_endpoint',
     'app.redis_client',
     'redis',
+    'aiosqlite',
+    'aiomysql',
+    'sqlalchemy.dialects.sqlite.aiosqlite',
+    'sqlalchemy.dialects.mysql.aiomysql',
 ]
 
 a = Analysis(